@@ -2,6 +2,10 @@ import sys
 import functools
 import inspect
 import re
+import socket
+import threading
+import time
+import Queue
 import oauth2 as oauth
 import urllib
 import urlparse
@@ -12,6 +16,7 @@ import evernote.edam.userstore.constants as UserStoreConstants
 
 import thrift.protocol.TBinaryProtocol as TBinaryProtocol
 import thrift.transport.THttpClient as THttpClient
+from thrift.Thrift import TApplicationException, TMessageType, TType
 
 
 class EvernoteClient(object):
@@ -66,19 +71,26 @@ class EvernoteClient(object):
     def get_note_store(self):
         user_store = self.get_user_store()
         note_store_uri = user_store.getNoteStoreUrl()
-        store = Store(self.token, NoteStore.Client, note_store_uri)
+        store = Store(self.token, NoteStoreClient, note_store_uri)
         if not store:  # Trick for PyDev code completion
             store = NoteStore.Client()
             raise Exception('Should never reach here')
         return store
 
+    def get_note_store_pool(self, size=4, timeout=60):
+        user_store = self.get_user_store()
+        note_store_uri = user_store.getNoteStoreUrl()
+        return StorePool(
+            self.token, NoteStoreClient, note_store_uri, size, timeout,
+        )
+
     def get_shared_note_store(self, linkedNotebook):
         note_store_uri = linkedNotebook.noteStoreUrl
-        note_store = Store(self.token, NoteStore.Client, note_store_uri)
+        note_store = Store(self.token, NoteStoreClient, note_store_uri)
         shared_auth = note_store.authenticateToSharedNotebook(
             linkedNotebook.shareKey)
         shared_token = shared_auth.authenticationToken
-        store = Store(shared_token, NoteStore.Client, note_store_uri)
+        store = Store(shared_token, NoteStoreClient, note_store_uri)
         if not store:  # Trick for PyDev code completion
             store = NoteStore.Client()
             raise Exception('Should never reach here')
@@ -89,7 +101,7 @@ class EvernoteClient(object):
         biz_auth = user_store.authenticateToBusiness()
         biz_token = biz_auth.authenticationToken
         note_store_uri = biz_auth.noteStoreUrl
-        store = Store(biz_token, NoteStore.Client, note_store_uri)
+        store = Store(biz_token, NoteStoreClient, note_store_uri)
         if not store:  # Trick for PyDev code completion
             store = NoteStore.Client()
             raise Exception('Should never reach here')
@@ -110,8 +122,62 @@ class EvernoteClient(object):
         return url
 
 
+class NoteStoreClient(NoteStore.Client):
+    """Note store client writing resource bodies straight to files"""
+
+    def getResourceDataTo(self, authenticationToken, guid, fileobj):
+        """Write resource body to file object, get its size"""
+        self.send_getResourceData(authenticationToken, guid)
+        return self.recv_getResourceDataTo(fileobj)
+
+    def recv_getResourceDataTo(self, fileobj):
+        iprot = self._iprot
+        (fname, mtype, rseqid) = iprot.readMessageBegin()
+        if mtype == TMessageType.EXCEPTION:
+            x = TApplicationException()
+            x.read(iprot)
+            iprot.readMessageEnd()
+            raise x
+        result = NoteStore.getResourceData_result()
+        size = None
+        iprot.readStructBegin()
+        while True:
+            (fname, ftype, fid) = iprot.readFieldBegin()
+            if ftype == TType.STOP:
+                break
+            field = None
+            if 0 <= fid < len(result.thrift_spec):
+                field = result.thrift_spec[fid]
+            if fid == 0 and ftype == TType.STRING:
+                size = iprot.readBinaryTo(fileobj)
+            elif field and field[1] == ftype:
+                setattr(result, field[2], iprot.readFieldByTType(
+                    ftype, field[3],
+                ))
+            else:
+                iprot.skip(ftype)
+            iprot.readFieldEnd()
+        iprot.readStructEnd()
+        iprot.readMessageEnd()
+        if size is not None:
+            return size
+        if result.userException is not None:
+            raise result.userException
+        if result.systemException is not None:
+            raise result.systemException
+        if result.notFoundException is not None:
+            raise result.notFoundException
+        raise TApplicationException(
+            TApplicationException.MISSING_RESULT,
+            'getResourceData failed: unknown result',
+        )
+
+
 class Store(object):
 
+    # called with method name, seconds, bytes sent and received
+    call_listeners = []
+
     def __init__(self, token, client_class, store_url):
         self.token = token
         m = re.search(':A=(.+):', token)
@@ -127,20 +193,37 @@ class Store(object):
             if targetMethod is None:
                 return object.__getattribute__(self, name)(*args, **kwargs)
 
-            org_args = inspect.getargspec(targetMethod).args
-            if len(org_args) == len(args) + 1:
-                return targetMethod(*args, **kwargs)
-            elif 'authenticationToken' in org_args:
-                skip_args = ['self', 'authenticationToken']
-                arg_names = [i for i in org_args if i not in skip_args]
-                return functools.partial(
-                    targetMethod, authenticationToken=self.token
-                )(**dict(zip(arg_names, args)))
-            else:
-                return targetMethod(*args, **kwargs)
+            if not Store.call_listeners:
+                return self._call(targetMethod, args, kwargs)
+
+            started = time.time()
+            sent = self._transport.sent
+            received = self._transport.received
+            try:
+                return self._call(targetMethod, args, kwargs)
+            finally:
+                for listener in Store.call_listeners:
+                    listener(
+                        name, time.time() - started,
+                        self._transport.sent - sent,
+                        self._transport.received - received,
+                    )
 
         return delegate_method
 
+    def _call(self, targetMethod, args, kwargs):
+        org_args = inspect.getargspec(targetMethod).args
+        if len(org_args) == len(args) + 1:
+            return targetMethod(*args, **kwargs)
+        elif 'authenticationToken' in org_args:
+            skip_args = ['self', 'authenticationToken']
+            arg_names = [i for i in org_args if i not in skip_args]
+            return functools.partial(
+                targetMethod, authenticationToken=self.token
+            )(**dict(zip(arg_names, args)))
+        else:
+            return targetMethod(*args, **kwargs)
+
     def _get_thrift_client(self, client_class, url):
         http_client = THttpClient.THttpClient(url)
         http_client.addHeaders(**{
@@ -148,6 +231,7 @@ class Store(object):
             % (self._user_agent_id, self._get_sdk_version(), sys.version)
         })
 
+        self._transport = http_client
         thrift_protocol = TBinaryProtocol.TBinaryProtocol(http_client)
         return client_class(thrift_protocol)
 
@@ -156,3 +240,115 @@ class Store(object):
             UserStoreConstants.EDAM_VERSION_MAJOR,
             UserStoreConstants.EDAM_VERSION_MINOR
         )
+
+
+class StoreFuture(object):
+
+    def __init__(self):
+        self._event = threading.Event()
+        self._result = None
+        self._exc_info = None
+        self._transport = None
+
+    def set_running(self, transport):
+        self._transport = transport
+
+    def set_result(self, result):
+        self._result = result
+        self._event.set()
+
+    def set_exc_info(self, exc_info):
+        self._exc_info = exc_info
+        self._event.set()
+
+    def done(self):
+        return self._event.is_set()
+
+    def result(self, timeout=None):
+        """Wait for result, with timeout running call which sent and
+        received nothing for timeout seconds raises socket.timeout,
+        time spent queued does not count"""
+        progress = None
+        while not self._event.wait(timeout):
+            transport = self._transport
+            if transport is None:
+                continue
+            current = transport.sent + transport.received
+            if current == progress:
+                raise socket.timeout('Store call stalled')
+            progress = current
+        if self._exc_info:
+            raise self._exc_info[0], self._exc_info[1], self._exc_info[2]
+        return self._result
+
+
+class StorePool(object):
+    """Stores with own connections serving calls from one queue.
+
+    Methods are the same as Store ones and block, `submit` returns
+    StoreFuture, so several requests can be in flight at once.
+    Timeout in seconds is set to transports of stores, blocking calls
+    give up on call stalled for it.
+    """
+
+    def __init__(self, token, client_class, store_url, size=4, timeout=60):
+        self.token = token
+        self.size = size
+        self.timeout = timeout
+        self._queue = Queue.Queue()
+        self._lock = threading.Lock()
+        self._closed = False
+        for _ in range(size):
+            store = Store(token, client_class, store_url)
+            if timeout is not None:
+                store._transport.setTimeout(timeout * 1000)
+            worker = threading.Thread(target=self._work, args=(store,))
+            worker.daemon = True
+            worker.start()
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+
+        def delegate_method(*args, **kwargs):
+            return self.submit(name, *args, **kwargs).result(self.timeout)
+
+        return delegate_method
+
+    def submit(self, name, *args, **kwargs):
+        future = StoreFuture()
+        with self._lock:
+            if self._closed:
+                raise RuntimeError('Store pool closed')
+            self._queue.put((future, name, args, kwargs))
+        return future
+
+    def map(self, name, args_list):
+        futures = [self.submit(name, *args) for args in args_list]
+        return (future.result(self.timeout) for future in futures)
+
+    def close(self):
+        """Stop workers after running calls, queued calls fail"""
+        with self._lock:
+            self._closed = True
+            while True:
+                try:
+                    task = self._queue.get_nowait()
+                except Queue.Empty:
+                    break
+                error = RuntimeError('Store pool closed')
+                task[0].set_exc_info((RuntimeError, error, None))
+            for _ in range(self.size):
+                self._queue.put(None)
+
+    def _work(self, store):
+        while True:
+            task = self._queue.get()
+            if task is None:
+                return
+            future, name, args, kwargs = task
+            future.set_running(store._transport)
+            try:
+                future.set_result(getattr(store, name)(*args, **kwargs))
+            except Exception:
+                future.set_exc_info(sys.exc_info())
@@ -0,0 +1,137 @@
+"""Slotted EDAM types decoding only requested fields.
+
+Generated ttypes keep attributes in per-instance __dict__ and decode
+every field. `install` replaces structs of type and notestore ttypes
+with TBase subclasses having __slots__, fields missing in the mask
+are skipped while reading and stay None:
+
+    install({'Resource': ('guid', 'data', 'mime', 'attributes')})
+
+Classes not in the mask decode all fields. With fastbinary all fields
+are decoded too, only slots are used. Without it structs are read and
+written with precompiled codecs when transport exposes its buffer.
+"""
+from thrift.protocol import TBinaryProtocol, TCodec
+from thrift.protocol.TProtocol import TProtocolException
+from thrift.protocol.TBase import TBase
+from thrift.transport import TTransport
+import evernote.edam.type.ttypes
+import evernote.edam.notestore.ttypes
+import evernote.edam.notestore.NoteStore
+import struct
+
+try:
+    from thrift.protocol import fastbinary
+except ImportError:
+    fastbinary = None
+
+
+TYPE_MODULES = (
+    evernote.edam.type.ttypes,
+    evernote.edam.notestore.ttypes,
+)
+
+# modules with generated classes referring types in thrift_spec
+SPEC_MODULES = TYPE_MODULES + (
+    evernote.edam.notestore.NoteStore,
+)
+
+
+class SlottedBase(TBase):
+    """Struct decoding fields present in read_spec"""
+    __slots__ = []
+    thrift_spec = None
+    read_spec = None
+
+    def read(self, iprot):
+        if (
+            iprot.__class__ == TBinaryProtocol.TBinaryProtocolAccelerated
+            and isinstance(iprot.trans, TTransport.CReadableTransport)
+            and fastbinary is not None
+        ):
+            fastbinary.decode_binary(
+                self, iprot.trans, (self.__class__, self.thrift_spec),
+            )
+            return
+        if (
+            iprot.__class__ is TBinaryProtocol.TBinaryProtocol
+            and hasattr(iprot.trans, 'getReadBuffer')
+        ):
+            buf, pos = iprot.trans.getReadBuffer()
+            if buf is not None:
+                try:
+                    end = TCodec.decode(self.__class__, self, buf, pos)
+                except (struct.error, IndexError):
+                    raise TProtocolException(
+                        type=TProtocolException.INVALID_DATA,
+                        message='Truncated %s' % self.__class__.__name__,
+                    )
+                iprot.trans.consumeReadBuffer(end - pos)
+                return
+        iprot.readStruct(self, self.read_spec)
+
+    def write(self, oprot):
+        if oprot.__class__ is TBinaryProtocol.TBinaryProtocol:
+            oprot.trans.write(TCodec.encode(self))
+            return
+        super(SlottedBase, self).write(oprot)
+
+
+def is_struct(cls):
+    return (
+        isinstance(cls, type)
+        and getattr(cls, 'thrift_spec', None) is not None
+        and not issubclass(cls, (Exception, SlottedBase))
+    )
+
+
+def create_types(mask=None, modules=TYPE_MODULES):
+    """Slotted classes by generated ones"""
+    mask = mask or {}
+    types = {}
+    for module in modules:
+        for cls in vars(module).values():
+            if is_struct(cls) and cls.__module__ == module.__name__:
+                types[cls] = type(cls.__name__, (SlottedBase,), {
+                    '__slots__': tuple(
+                        field[2] for field in cls.thrift_spec if field
+                    ),
+                    '__doc__': cls.__doc__,
+                    '__module__': cls.__module__,
+                    '__init__': cls.__dict__['__init__'],
+                    'validate': cls.__dict__['validate'],
+                })
+
+    for cls, slotted in types.items():
+        slotted.thrift_spec = replace_spec(cls.thrift_spec, types)
+        fields = mask.get(cls.__name__)
+        slotted.read_spec = tuple(
+            field if field and (
+                fields is None or field[2] in fields
+            ) else None for field in slotted.thrift_spec
+        )
+    return types
+
+
+def replace_spec(spec, types):
+    """Spec with classes replaced by slotted"""
+    if isinstance(spec, tuple):
+        return tuple(replace_spec(item, types) for item in spec)
+    if isinstance(spec, type) and spec in types:
+        return types[spec]
+    return spec
+
+
+def install(mask=None):
+    """Replace generated structs with slotted, call before requests"""
+    types = create_types(mask)
+    for module in SPEC_MODULES:
+        for name, cls in vars(module).items():
+            if not isinstance(cls, type):
+                continue
+            if cls in types:
+                setattr(module, name, types[cls])
+            elif getattr(cls, 'thrift_spec', None) is not None:
+                # results and exceptions, spec is used by fastbinary
+                cls.thrift_spec = replace_spec(cls.thrift_spec, types)
+    return types
@@ -124,6 +124,7 @@ class Note(DbusSendable):
         ('conflict_items', 'ai'),
         ('share_date', 'x'),
         ('share_url', 's'),
+        ('snippet', 's'),
     )
 
 
@@ -158,3 +159,49 @@ class Place(DbusSendable):
         ('id', 'i'),
         ('name', 's'),
     )
+
+
+class MenuNote(DbusSendable):
+    fields = (
+        ('id', 'i'),
+        ('title', 's'),
+    )
+
+
+class MenuNotebook(DbusSendable):
+    fields = (
+        ('id', 'i'),
+        ('name', 's'),
+        ('notes', 'a%s' % MenuNote.signature),
+    )
+
+
+class Menu(DbusSendable):
+    fields = (
+        ('version', 'i'),
+        ('authenticated', 'b'),
+        ('first_synced', 'b'),
+        ('status', 'i'),
+        ('last_sync', 's'),
+        ('sort_by_notebook', 'b'),
+        ('pin_notes', 'a%s' % MenuNote.signature),
+        ('notes', 'a%s' % MenuNote.signature),
+        ('notebooks', 'a%s' % MenuNotebook.signature),
+    )
+
+
+class Change(DbusSendable):
+    fields = (
+        ('entity', 's'),
+        ('operation', 's'),
+        ('ids', 'ai'),
+    )
+
+
+class Metric(DbusSendable):
+    fields = (
+        ('name', 's'),
+        ('count', 'x'),
+        ('total', 'd'),
+        ('max', 'd'),
+    )
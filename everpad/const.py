@@ -10,6 +10,19 @@ STATUS_SYNC = 1
 
 DEFAULT_SYNC_DELAY = 30000 * 60
 
+# jobs of sync thread, lower runs first when several are due
+SYNC_JOB_PUSH = 0  # local changes only
+SYNC_JOB_FETCH = 1  # content and resources requested by clients
+SYNC_JOB_SYNC = 2  # full remote and local sync
+SYNC_BACKOFF_MIN = 30  # seconds, doubled after each failed sync
+SYNC_BACKOFF_MAX = 3600
+SYNC_STOP_TIMEOUT = 5000  # ms, waited for sync thread on exit
+# local changes are pushed after delay from last change without remote
+# sync, but not later than max delay from first; settings key
+# push_delay set to -1 leaves pushes to periodic sync
+PUSH_DELAY = 3  # seconds
+PUSH_MAX_DELAY = 30
+
 
 # sync state constants
 SYNC_STATE_START = 0
@@ -25,6 +38,8 @@ SYNC_STATE_FINISH = 9
 SYNC_STATE_RATE_LIMITED  = 10
 SYNC_STATE_SEARCHES_REMOTE = 11
 SYNC_STATE_LBN_REMOTE = 12
+SYNC_STATE_NOTES_CONTENT = 13
+SYNC_STATE_RESOURCES = 14
 
 SYNC_MANUAL = -1
 SYNC_STATES = (
@@ -33,7 +48,8 @@ SYNC_STATES = (
     SYNC_STATE_NOTEBOOKS_REMOTE, SYNC_STATE_TAGS_REMOTE,
     SYNC_STATE_NOTES_REMOTE, SYNC_STATE_FINISH, 
     SYNC_STATE_RATE_LIMITED, SYNC_STATE_SEARCHES_REMOTE,
-    SYNC_STATE_LBN_REMOTE
+    SYNC_STATE_LBN_REMOTE, SYNC_STATE_NOTES_CONTENT,
+    SYNC_STATE_RESOURCES,
 )
 DEFAULT_FONT = 'Sans'
 DEFAULT_FONT_SIZE = 14
@@ -42,10 +58,20 @@ DEFAULT_INDICATOR_LAYOUT = [
 ]
 
 # EDAM_VERSION = EDAM_VERSION_MAJOR + "." + EDAM_VERSION_MINOR
-SCHEMA_VERSION = 5
-API_VERSION = 6
+SCHEMA_VERSION = 11
+API_VERSION = 9
 VERSION = '2.5'
-DB_PATH = "~/.everpad/everpad.%s.db" % SCHEMA_VERSION
+# since schema 5 database upgraded in place by migrations
+DB_PATH = "~/.everpad/everpad.5.db"
+# sqlite pragma, provider settings key and default value
+DB_PRAGMAS = (
+    ('journal_mode', 'db-journal-mode', 'WAL'),
+    ('synchronous', 'db-synchronous', 'NORMAL'),
+    ('cache_size', 'db-cache-size', -16000),  # negative is KiB
+    ('mmap_size', 'db-mmap-size', 64 * 1024 * 1024),
+    ('temp_store', 'db-temp-store', 'MEMORY'),
+    ('busy_timeout', 'db-busy-timeout', 5000),  # ms
+)
 
 ACTION_NONE = 0
 ACTION_CREATE = 1
@@ -72,3 +98,65 @@ ORDER_UPDATED_DESC = 3
 
 DEFAULT_LIMIT = 100
 NOT_PINNDED = -1
+MENU_NOTES_LIMIT = 20
+SNIPPET_LENGTH = 200
+
+# change feed entities and operations
+CHANGE_NOTE = 'note'
+CHANGE_NOTEBOOK = 'notebook'
+CHANGE_TAG = 'tag'
+CHANGE_RESOURCE = 'resource'
+CHANGE_PLACE = 'place'
+CHANGE_ENTITIES = (
+    CHANGE_NOTE, CHANGE_NOTEBOOK, CHANGE_TAG, CHANGE_RESOURCE, CHANGE_PLACE,
+)
+
+CHANGE_CREATE = 'create'
+CHANGE_UPDATE = 'update'
+CHANGE_DELETE = 'delete'
+CHANGE_RELOAD = 'reload'
+
+CHANGES_DELAY = 200  # ms, changes are coalesced within
+CHANGES_LOG_SIZE = 5000
+
+QUERY_CACHE_SIZE = 256
+ASYNC_CACHE_SIZE = 64  # results of recent provider calls kept by pad
+USER_CACHE_TTL = 3600  # seconds, user info of account kept
+
+NOTE_STORE_POOL_SIZE = 4
+NOTE_STORE_TIMEOUT = 60  # seconds, call of pool without traffic fails
+NOTE_PREFETCH_WINDOW = 8
+
+# full sync stores notes by sync chunk metadata, content and resources
+# are pulled after it in batches, opened notes first; settings key
+# metadata_first_sync set to 0 pulls full notes while sync
+METADATA_FIRST_SYNC = True
+NOTE_CONTENT_BATCH = 50
+
+# with settings key lazy_resources set to 1 sync doesn't download
+# resources data, it's downloaded when opened and least recently used
+# files are removed over resource_cache_size MB; resources of offline
+# notebooks are always downloaded
+LAZY_RESOURCES = False
+RESOURCE_CACHE_SIZE = 512
+RESOURCE_TOUCH_INTERVAL = 600  # seconds, access time precision
+
+# places of notes with coordinates are resolved in background, settings
+# key geocoding set to 0 disables it, geocode_url replaces service
+GEOCODING = True
+GEOCODE_URL = (
+    'http://maps.googleapis.com/maps/api/geocode/json'
+    '?latlng=%.4f,%.4f&sensor=false'
+)
+GEOCODE_INTERVAL = 1  # seconds between requests
+GEOCODE_TIMEOUT = 10
+
+# fields of evernote types decoded while sync, others are skipped
+EDAM_FIELD_MASK = {
+    'Resource': (
+        'guid', 'noteGuid', 'data', 'mime', 'width', 'height',
+        'duration', 'active', 'attributes', 'updateSequenceNum',
+    ),
+    'ResourceAttributes': ('fileName', 'attachment'),
+    'NoteAttributes': ('latitude', 'longitude', 'placeName', 'shareDate'),
+}
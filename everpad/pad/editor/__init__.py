@@ -155,8 +155,9 @@ class Editor(QMainWindow):  # TODO: kill this god shit
 
     def load_note(self, note):
         self.logger.debug('Loading note: "%s"' % note.title)
-        self.resource_edit.resources = map(Resource.from_tuple,
-            self.app.provider.get_note_resources(note.id),
+        self._resources_loaded = False
+        self.app.async_provider.get_note_resources(note.id).then(
+            self._resources_received,
         )
         self.notebook_edit.notebook = note.notebook
         self.note_edit.title = note.title
@@ -164,6 +165,13 @@ class Editor(QMainWindow):  # TODO: kill this god shit
         self.note_edit.content = note.content
         self.tag_edit.tags = note.tags
 
+    def _resources_received(self, resources):
+        self.resource_edit.resources = map(Resource.from_tuple, resources)
+        for res in self.resource_edit.resources:
+            # missing data is pulled and shown when received
+            self.app.async_provider.fetch_resource(res.id)
+        self._resources_loaded = True
+
     def update_note(self):
         self.logger.debug('Updating note: "%s"' % self.note_edit.title)
         self.note.notebook = self.notebook_edit.notebook
@@ -196,11 +204,13 @@ class Editor(QMainWindow):  # TODO: kill this god shit
         self.mark_untouched()
         self.update_note()
         self.app.provider.update_note(self.note.struct)
-        self.app.provider.update_note_resources(
-            self.note.id, dbus.Array(map(lambda res:
-                res.struct, self.resource_edit.resources,
-            ), signature=Resource.signature),
-        )
+        # don't drop resources which are not received yet
+        if self._resources_loaded:
+            self.app.provider.update_note_resources(
+                self.note.id, dbus.Array(map(lambda res:
+                    res.struct, self.resource_edit.resources,
+                ), signature=Resource.signature),
+            )
         self.app.send_notify(self.tr('Note "%s" saved!') % self.note.title)
 
     @Slot()
@@ -291,6 +291,17 @@ class ContentEdit(QObject):
             self.page.linkHovered.connect(self.link_hovered)
             self.page.contentsChanged.connect(self.page_changed)
 
+    def reload_resource(self, res):
+        """Reload images of resource which data pulled after shown"""
+        if res.in_content and 'image' in res.mime:
+            self.page.mainFrame().evaluateJavaScript(
+                'var src = %s;'
+                'var images = document.getElementsByTagName("img");'
+                'for (var i = 0; i < images.length; i++)'
+                '    if (images[i].src == src) images[i].src = src;'
+                % json.dumps('file://%s' % res.file_path),
+            )
+
     @Slot()
     def selection_changed(self):
         self.copy_available.emit(
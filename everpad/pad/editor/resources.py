@@ -5,6 +5,7 @@ from PySide.QtGui import (
 )
 from PySide.QtCore import Slot, Qt, QUrl, QFileInfo
 from everpad.basetypes import Resource, NONE_ID
+from everpad.const import CHANGE_RESOURCE, CHANGE_UPDATE
 from everpad.tools import prepare_file_path
 from functools import partial
 import subprocess
@@ -21,24 +22,28 @@ class ResourceItem(QWidget):
         self.res = res
         layout = QVBoxLayout()
         self.setLayout(layout)
-        preview = QLabel()
-        if 'image' in res.mime:
-            pixmap = QPixmap(res.file_path).scaledToWidth(32)
-
-        else:
-            info = QFileInfo(res.file_path)
-            pixmap = QFileIconProvider().icon(info).pixmap(32, 32)
-        preview.setPixmap(pixmap)
-        preview.setMask(pixmap.mask())
-        preview.setMaximumHeight(32)
+        self.preview = QLabel()
+        self.update_preview()
+        self.preview.setMaximumHeight(32)
         label = QLabel()
         label.setText(res.file_name)
-        layout.addWidget(preview)
+        layout.addWidget(self.preview)
         layout.addWidget(label)
         layout.setAlignment(Qt.AlignHCenter)
         self.setFixedWidth(64)
         self.setFixedHeight(64)
 
+    def update_preview(self):
+        """Update preview, data may be pulled after shown"""
+        if 'image' in self.res.mime:
+            pixmap = QPixmap(self.res.file_path).scaledToWidth(32)
+
+        else:
+            info = QFileInfo(self.res.file_path)
+            pixmap = QFileIconProvider().icon(info).pixmap(32, 32)
+        self.preview.setPixmap(pixmap)
+        self.preview.setMask(pixmap.mask())
+
 
 class ResourceEdit(object):  # TODO: move event to item
     """Abstraction for notebook edit"""
@@ -64,6 +69,21 @@ class ResourceEdit(object):  # TODO: move event to item
             self.widget.show()
         self.label.linkActivated.connect(self.label_uri)
         self.label.setContextMenuPolicy(Qt.NoContextMenu)
+        self.app.changes.connect(self._changes_received)
+
+    def _changes_received(self, changes):
+        """Refresh resources which data pulled after shown"""
+        ids = set()
+        for change in changes:
+            if (
+                change.entity == CHANGE_RESOURCE
+                and change.operation == CHANGE_UPDATE
+            ):
+                ids.update(change.ids)
+        for res, item in self._resource_labels.items():
+            if res.id in ids:
+                item.update_preview()
+                self.parent.note_edit.reload_resource(res)
 
     def update_label(self):
         self.label.setText(
@@ -1,23 +1,29 @@
 import sys
 sys.path.insert(0, '../..')
 from PySide.QtCore import Slot, QTranslator, QLocale, Signal, QSettings, QT_TRANSLATE_NOOP, QLibraryInfo
-from PySide.QtGui import QApplication, QSystemTrayIcon, QMenu, QCursor
+from PySide.QtGui import (
+    QApplication, QSystemTrayIcon, QMenu, QCursor, QAction,
+)
 from PySide.QtNetwork import QNetworkProxyFactory
 
-from everpad.basetypes import Note, NONE_ID, NONE_VAL, Notebook
+from everpad.basetypes import (
+    Note, NONE_ID, NONE_VAL, Menu, MenuNote, MenuNotebook, Change,
+)
 from everpad.tools import get_provider, get_pad, print_version, resource_filename
 from everpad.pad.editor import Editor
 from everpad.pad.management import Management
 from everpad.pad.list import List
+from everpad.pad.tools import AsyncProvider
 from everpad.const import (
     STATUS_RATE, STATUS_SYNC, SYNC_STATES, SYNC_STATE_START,
     SYNC_STATE_FINISH, API_VERSION,
-    DEFAULT_INDICATOR_LAYOUT,
+    DEFAULT_INDICATOR_LAYOUT, CHANGE_ENTITIES, CHANGE_RELOAD,
 )
 from everpad.specific import get_launcher, get_tray_icon
 
 from functools import partial
 from datetime import datetime
+from difflib import SequenceMatcher
 import signal
 import dbus
 import dbus.service
@@ -37,6 +43,8 @@ class Indicator(QSystemTrayIcon):
         self.setContextMenu(self.menu)
         self.menu.aboutToShow.connect(self.update)
         self.opened_notes = {}
+        self._menu_keys = []
+        self._menu_actions = []
         self.activated.connect(self._activated)
         self.settings = QSettings('everpad', 'everpad-pad')
         # Configure logger.
@@ -49,128 +57,185 @@ class Indicator(QSystemTrayIcon):
             '%(asctime)s - %(name)s - %(levelname)s - %(message)s')
         fh.setFormatter(formatter)
         self.logger.addHandler(fh)
+        self._apply_entries(self._footer_entries())
 
     def _activated(self, reason):
         if reason == QSystemTrayIcon.Trigger:
             self.menu.popup(QCursor().pos())
 
-    def _add_note(self, menu, struct):
-        note = Note.from_tuple(struct)
-        title = note.title[:40].replace('&', '&&')
-        menu.addAction(title, Slot()(
-            partial(self.open, note=note)
-        ))
-
     @Slot()
     def update(self):
-        self.menu.clear()
-        try:
-            version = self.app.provider.get_api_version()
-        except (  # dbus raise some magic
-            dbus.exceptions.UnknownMethodException,
-            dbus.exceptions.DBusException,
-        ):
-            version = -1
-        if version != API_VERSION:
-            action = self.menu.addAction(
-                self.tr('API version missmatch, please restart'),
-            )
-            action.setEnabled(False)
-            if version < API_VERSION:
-                handler = self.app.provider.kill
+        """Refresh menu in background, menu keeps last state meanwhile"""
+        self.app.async_provider.get_menu().then(
+            self._on_menu, self._on_menu_failed,
+        )
+
+    def _on_menu(self, struct):
+        self._apply_entries(self._menu_entries(Menu.from_tuple(struct)))
+
+    def _on_menu_failed(self, error):
+        """Unknown method means provider is not compatible,
+        on other errors menu keeps last state"""
+        if isinstance(error, dbus.exceptions.UnknownMethodException):
+            self._apply_entries(self._version_entries(-1))
+        else:
+            self.logger.error('Menu update failed: %s' % error)
+
+    def _apply_entries(self, entries):
+        """Change only menu actions which differ from new entries.
+
+        Entry is pair of key, which describes everything visible
+        in action, and function which creates the action.
+        """
+        keys = [key for key, _ in entries]
+        matcher = SequenceMatcher(None, self._menu_keys, keys, autojunk=False)
+        actions = []
+        for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+            if tag == 'equal':
+                actions += self._menu_actions[i1:i2]
+                continue
+            for action in self._menu_actions[i1:i2]:
+                self.menu.removeAction(action)
+            if i2 < len(self._menu_actions):
+                before = self._menu_actions[i2]
             else:
-                handler = partial(os.execlp, 'everpad', '--replace')
-            self.menu.addAction(
+                before = None
+            for _, create in entries[j1:j2]:
+                action = create()
+                self.menu.insertAction(before, action)
+                actions.append(action)
+        self._menu_keys = keys
+        self._menu_actions = actions
+
+    def _action_entry(self, name, label, handler, enabled=True):
+        def create():
+            action = QAction(label, self.menu)
+            action.triggered.connect(handler)
+            action.setEnabled(enabled)
+            return action
+        return ('action', name, label, enabled), create
+
+    def _separator_entry(self):
+        def create():
+            action = QAction(self.menu)
+            action.setSeparator(True)
+            return action
+        return ('separator',), create
+
+    def _note_action(self, menu, note):
+        action = QAction(note.title[:40].replace('&', '&&'), menu)
+        action.triggered.connect(Slot()(partial(self.open_by_id, note.id)))
+        return action
+
+    def _note_entry(self, struct):
+        note = MenuNote.from_tuple(struct)
+        return ('note', note.id, note.title), partial(
+            self._note_action, self.menu, note,
+        )
+
+    def _notebook_entry(self, struct):
+        notebook = MenuNotebook.from_tuple(struct)
+        notes = map(MenuNote.from_tuple, notebook.notes)
+
+        def create():
+            sub_menu = QMenu(notebook.name, self.menu)
+            for note in notes:
+                sub_menu.addAction(self._note_action(sub_menu, note))
+            return sub_menu.menuAction()
+        return ('notebook', notebook.id, notebook.name, tuple(
+            (note.id, note.title) for note in notes
+        )), create
+
+    def _version_entries(self, version):
+        if version < API_VERSION:
+            handler = self.app.provider.kill
+        else:
+            handler = partial(os.execlp, 'everpad', '--replace')
+        return [
+            self._action_entry(
+                'version', self.tr('API version missmatch, please restart'),
+                lambda: None, False,
+            ),
+            self._action_entry(
+                ('restart', version < API_VERSION),
                 self.tr('Restart everpad'), handler,
-            )
-            return
-        if self.app.provider.is_authenticated():
-            pin_notes = self.app.provider.find_notes(
-                '', dbus.Array([], signature='i'),
-                dbus.Array([], signature='i'), 0,
-                20, Note.ORDER_UPDATED_DESC, 1,
-            )
-            sort_by_notebook = bool(int(
-                self.app.provider.get_settings_value('sort-by-notebook') or 0))
-            has_notes = False
-            if not sort_by_notebook:
-                notes = self.app.provider.find_notes(
-                    '', dbus.Array([], signature='i'),
-                    dbus.Array([], signature='i'), 0,
-                    20 - len(pin_notes), Note.ORDER_UPDATED_DESC, 0,
-                )
-                has_notes = bool(notes)
+            ),
+        ]
+
+    def _footer_entries(self):
+        return [
+            self._separator_entry(),
+            self._action_entry(
+                'management', self.tr('Settings and Management'),
+                self.show_management,
+            ),
+            self._action_entry('exit', self.tr('Exit'), self.exit),
+        ]
+
+    def _menu_entries(self, menu):
+        if menu.version != API_VERSION:
+            return self._version_entries(menu.version)
+        if not menu.authenticated:
+            return self._footer_entries()
+
+        if menu.sort_by_notebook:
+            has_notes = any(notes for _, _, notes in menu.notebooks)
+        else:
+            has_notes = bool(menu.notes)
+        first_sync = not (
+            has_notes or len(menu.pin_notes) or menu.first_synced
+        )
+
+        # Rate Limit indication added
+        # STATUS_RATE = -1  # Rate Limit status
+        # STATUS_NONE = 0
+        # STATUS_SYNC = 1
+        status_syncing = menu.status
+
+        if status_syncing < 0:
+            sync_label = self.tr('Rate Limit')
+        elif status_syncing and first_sync:
+            sync_label = self.tr('Wait, first sync in progress')
+        elif status_syncing and not first_sync:
+            sync_label = self.tr('Sync in progress')
+        elif not status_syncing and first_sync:
+            sync_label = self.tr('Please perform first sync')
+        else:
+            delta_sync = (
+                datetime.now() - datetime.strptime(menu.last_sync, '%H:%M')
+            ).seconds // 60
+            if delta_sync == 0:
+                sync_label = self.tr('Last Sync: Just now')
+            elif delta_sync == 1:
+                sync_label = self.tr('Last Sync: %s min ago') % delta_sync
             else:
-                notebooks = self.app.provider.list_notebooks()
-                notes = {}
-                for notebook_struct in notebooks:
-                    notebook = Notebook.from_tuple(notebook_struct)
-                    _notes = self.app.provider.find_notes('', [notebook.id],
-                         dbus.Array([], signature='i'), 0,
-                         20 - len(pin_notes), Note.ORDER_UPDATED_DESC, 0,
-                    )
-                    notes[notebook] = _notes
-                    if _notes:
-                        has_notes = True
-            first_sync = not (
-                has_notes or len(pin_notes) or self.app.provider.is_first_synced()
-            )
-            
-            # Rate Limit indication added
-            # STATUS_RATE = -1  # Rate Limit status
-            # STATUS_NONE = 0
-            # STATUS_SYNC = 1
-            # status_syncing = self.app.provider.get_status() == STATUS_SYNC
-            status_syncing = self.app.provider.get_status()
-            
-            if status_syncing < 0:
-                sync_label = self.tr('Rate Limit')            
-            elif status_syncing and first_sync:
-                sync_label = self.tr('Wait, first sync in progress')
-            elif status_syncing and not first_sync:
-                sync_label = self.tr('Sync in progress')
-            elif not status_syncing and first_sync:
-                sync_label = self.tr('Please perform first sync')
+                sync_label = self.tr('Last Sync: %s mins ago') % delta_sync
+
+        menu_items = {
+            'create_note': [self.tr('Create Note'), self.create],
+            'all_notes': [self.tr('All Notes'), self.show_all_notes],
+            'sync': [sync_label, Slot()(self.app.provider.sync)],
+            'pin_notes': map(self._note_entry, menu.pin_notes),
+            'notes': map(self._notebook_entry, menu.notebooks)
+            if menu.sort_by_notebook else map(self._note_entry, menu.notes),
+        }
+        entries = []
+        for item in self.app.settings.value('menu-order', DEFAULT_INDICATOR_LAYOUT):
+            if item == 'pin_notes' or item == 'notes':
+                if not first_sync and len(menu_items[item]):
+                    entries.append(self._separator_entry())
+                    entries += menu_items[item]
+                    entries.append(self._separator_entry())
             else:
-                last_sync = self.app.provider.get_last_sync()
-                delta_sync = (
-                    datetime.now() - datetime.strptime(last_sync, '%H:%M')
-                ).seconds // 60
-                if delta_sync == 0:
-                    sync_label = self.tr('Last Sync: Just now')
-                elif delta_sync == 1:
-                    sync_label = self.tr('Last Sync: %s min ago') % delta_sync
-                else:
-                    sync_label = self.tr('Last Sync: %s mins ago') % delta_sync
-            
-            menu_items = {
-                'create_note': [self.tr('Create Note'), self.create],
-                'all_notes': [self.tr('All Notes'), self.show_all_notes],
-                'sync': [sync_label, Slot()(self.app.provider.sync)],
-                'pin_notes': pin_notes,
-                'notes': notes,
-            }
-            for item in self.app.settings.value('menu-order', DEFAULT_INDICATOR_LAYOUT):
-                if item == 'pin_notes' or item == 'notes':
-                    if not first_sync and len(menu_items[item]):
-                        self.menu.addSeparator()
-                        if item == 'notes' and sort_by_notebook:
-                            for notebook in menu_items[item]:
-                                sub_menu = self.menu.addMenu(notebook.name)
-                                _notes = menu_items[item][notebook]
-                                for struct in _notes:
-                                    self._add_note(sub_menu, struct)
-                        else:
-                            for struct in menu_items[item]:
-                                self._add_note(self.menu, struct)
-                        self.menu.addSeparator()
-                else:
-                    action = self.menu.addAction(menu_items[item][0], menu_items[item][1])
-                    if status_syncing and item == 'sync':
-                        action.setEnabled(False)
-        self.menu.addSeparator()
-        self.menu.addAction(self.tr('Settings and Management'), self.show_management)
-        self.menu.addAction(self.tr('Exit'), self.exit)
+                entries.append(self._action_entry(
+                    item, menu_items[item][0], menu_items[item][1],
+                    not (status_syncing and item == 'sync'),
+                ))
+        return entries + self._footer_entries()
+
+    def open_by_id(self, id, search_term=''):
+        note = Note.from_tuple(self.app.provider.get_note(id))
+        return self.open(note, search_term)
 
     def open(self, note, search_term=''):
         self.logger.debug('Opening note: "%s".' % note.title)
@@ -207,6 +272,7 @@ class Indicator(QSystemTrayIcon):
             place='',
             share_date=NONE_VAL,
             share_url='',
+            snippet='',
         ).struct
         note = Note.from_tuple(
             self.app.provider.create_note(note_struct),
@@ -238,6 +304,7 @@ class Indicator(QSystemTrayIcon):
 
 class PadApp(QApplication):
     data_changed = Signal()
+    changes = Signal(list)
 
     def __init__(self, *args, **kwargs):
         QApplication.__init__(self, *args, **kwargs)
@@ -254,6 +321,7 @@ class PadApp(QApplication):
         QT_TRANSLATE_NOOP('QApplication', 'QT_LAYOUT_DIRECTION')
         self.installTranslator(self.appTranslator)
         QNetworkProxyFactory.setUseSystemConfiguration(True)
+        self.changes_token = None
         self.indicator = Indicator()
         self.update_icon()
         self.indicator.show()
@@ -278,6 +346,28 @@ class PadApp(QApplication):
         """Note, notebook or tag changed"""
         self.data_changed.emit()
 
+    def on_changes_available(self, since, token, changes):
+        """Emit changes, fetch missed ones when tokens not match"""
+        if self.changes_token is not None and since != self.changes_token:
+            self.async_provider.get_changes_since(
+                self.changes_token,
+            ).then(self._missed_changes_received)
+        else:
+            self._apply_changes(token, changes)
+
+    def _missed_changes_received(self, reply):
+        token, complete, changes = reply
+        if not complete:
+            # provider restarted or log overflowed
+            changes = [Change(
+                entity=entity, operation=CHANGE_RELOAD, ids=[],
+            ).struct for entity in CHANGE_ENTITIES]
+        self._apply_changes(token, changes)
+
+    def _apply_changes(self, token, changes):
+        self.changes_token = token
+        self.changes.emit(Change.list << changes)
+
 
 class EverpadService(dbus.service.Object):
     def __init__(self, *args, **kwargs):
@@ -290,8 +380,7 @@ class EverpadService(dbus.service.Object):
 
     @dbus.service.method("com.everpad.App", in_signature='is', out_signature='')
     def open_with_search_term(self, id, search_term):
-        note = Note.from_tuple(self.app.provider.get_note(id))
-        self.app.indicator.open(note, search_term)
+        self.app.indicator.open_by_id(id, search_term)
 
     @dbus.service.method("com.everpad.App", in_signature='', out_signature='')
     def create(self):
@@ -341,6 +430,7 @@ def main():
         dbus.mainloop.glib.DBusGMainLoop(set_as_default=True)
         session_bus = dbus.SessionBus()
         app.provider = get_provider(session_bus)
+        app.async_provider = AsyncProvider(app.provider)
         app.provider.connect_to_signal(
             'sync_state_changed',
             app.on_sync_state_changed,
@@ -351,11 +441,16 @@ def main():
             app.on_data_changed,
             dbus_interface="com.everpad.provider",
         )
+        app.provider.connect_to_signal(
+            'changes_available',
+            app.on_changes_available,
+            dbus_interface="com.everpad.provider",
+        )
         app.launcher = get_launcher('application://everpad.desktop', session_bus, '/')
         bus = dbus.service.BusName("com.everpad.App", session_bus)
         service = EverpadService(session_bus, '/EverpadService')
         if args.open:
-            app.indicator.open(args.open)
+            app.indicator.open_by_id(args.open)
         if args.create:
             app.indicator.create()
         if args.settings:
@@ -11,11 +11,15 @@ from PySide.QtCore import Slot, Qt, QPoint
 from everpad.interface.list import Ui_List
 from everpad.pad.tools import get_icon
 from everpad.basetypes import Notebook, Note, Tag, NONE_ID
+from everpad.const import (
+    CHANGE_NOTE, CHANGE_NOTEBOOK, CHANGE_TAG, CHANGE_UPDATE,
+)
 import dbus
 import datetime
 
 
 SELECT_NONE = -1
+LIST_ENTITIES = (CHANGE_NOTE, CHANGE_NOTEBOOK, CHANGE_TAG)
 
 
 class List(QMainWindow):
@@ -27,7 +31,7 @@ class List(QMainWindow):
         self.closed = False
         self.sort_order = None
         self._init_interface()
-        self.app.data_changed.connect(self._reload_data)
+        self.app.changes.connect(self._changes_received)
         self._init_notebooks()
         self._init_tags()
         self._init_notes()
@@ -65,6 +69,7 @@ class List(QMainWindow):
 
     def _init_notes(self):
         self._current_note = None
+        self._notes_future = None
         self.notesModel = QStandardItemModel()
         self.notesModel.setHorizontalHeaderLabels(
             [self.tr('Title'), self.tr('Last Updated')])
@@ -134,8 +139,6 @@ class List(QMainWindow):
         self._current_note = index
 
     def notebook_selected(self, index):
-        self.notesModel.setRowCount(0)
-
         item = self.notebooksModel.itemFromIndex(index)
         if hasattr(item, 'notebook'):
             notebook_id = item.notebook.id
@@ -148,33 +151,34 @@ class List(QMainWindow):
         notebook_filter = [notebook_id] if notebook_id > 0 else dbus.Array([], signature='i')
 
         if hasattr(item, 'stack'):  # stack selected, retrieve all underlying notebooks
-            notebook_filter = []
-            for notebook_struct in self.app.provider.list_notebooks():
-                notebook = Notebook.from_tuple(notebook_struct)
-                if(notebook.stack == item.stack):
-                    notebook_filter.append(notebook.id)
-
-        notes = self.app.provider.find_notes(
+            future = self.app.async_provider.list_notebooks()
+            self._notes_future = future
+            future.then(lambda notebooks: self._stack_notebooks_received(
+                future, item.stack, notebooks,
+            ))
+            return
+
+        self._load_notes(self.app.async_provider.find_notes(
             '', notebook_filter, dbus.Array([], signature='i'),
             0, 2 ** 31 - 1, Note.ORDER_TITLE, -1,
-        )  # fails with sys.maxint in 64
-
-        for note_struct in notes:
-            note = Note.from_tuple(note_struct)
-            self.notesModel.appendRow(QNoteItemFactory(note).make_items())
-
-        sort_order = self.sort_order
-        if sort_order is None:
-            sort_order = self.app.settings.value('list-notes-sort-order')
+        ))  # fails with sys.maxint in 64
+
+    def _stack_notebooks_received(self, future, stack, notebooks):
+        # ignore replies for stack which is not selected anymore
+        if future is not self._notes_future:
+            return
+        notebook_filter = []
+        for notebook_struct in notebooks:
+            notebook = Notebook.from_tuple(notebook_struct)
+            if notebook.stack == stack:
+                notebook_filter.append(notebook.id)
 
-        if sort_order:
-            logicalIndex, order = sort_order
-            order = Qt.SortOrder.values[order]
-            self.ui.notesList.sortByColumn(int(logicalIndex), order)
+        self._load_notes(self.app.async_provider.find_notes(
+            '', notebook_filter, dbus.Array([], signature='i'),
+            0, 2 ** 31 - 1, Note.ORDER_TITLE, -1,
+        ))  # fails with sys.maxint in 64
 
     def tag_selected(self, index):
-        self.notesModel.setRowCount(0)
-
         item = self.tagsModel.itemFromIndex(index)
         if hasattr(item, 'tag'):
             tag_id = item.tag.id
@@ -185,14 +189,30 @@ class List(QMainWindow):
         self._current_tag = tag_id
 
         tag_filter = [tag_id] if tag_id > 0 else dbus.Array([], signature='i')
-        notes = self.app.provider.find_notes(
+        self._load_notes(self.app.async_provider.find_notes(
             '', dbus.Array([], signature='i'), tag_filter,
             0, 2 ** 31 - 1, Note.ORDER_TITLE, -1,
-        )  # fails with sys.maxint in 64
+        ))  # fails with sys.maxint in 64
+
+    def _load_notes(self, future):
+        """Show cached notes at once and replace them with reply"""
+        self._notes_future = future
+        self._show_notes(future.cached or [])
+        future.then(lambda notes: self._notes_received(future, notes))
+
+    def _notes_received(self, future, notes):
+        # ignore replies for notebook or tag which is not selected anymore
+        if future is self._notes_future:
+            self._show_notes(notes)
+
+    def _show_notes(self, notes):
+        self.notesModel.setRowCount(0)
         for note_struct in notes:
             note = Note.from_tuple(note_struct)
             self.notesModel.appendRow(QNoteItemFactory(note).make_items())
+        self._sort_notes()
 
+    def _sort_notes(self):
         sort_order = self.sort_order
         if sort_order is None:
             sort_order = self.app.settings.value('list-notes-sort-order')
@@ -256,15 +276,9 @@ class List(QMainWindow):
             self.tr('Rename stack'), stack,
         )
         if status:
-            # loop notebooks and update stack str
-            for notebook_struct in self.app.provider.list_notebooks():
-                notebook = Notebook.from_tuple(notebook_struct)
-                if(notebook.stack == item.stack):
-                    notebook.stack = name
-                    self.app.provider.update_notebook(notebook.struct)
-
+            self.app.provider.rename_stack(stack, name)
             self.app.send_notify(self.tr('Stack "%s" renamed!') % name)
-            self._reload_notebooks_list(notebook.id)
+            self._reload_notebooks_list()
 
     @Slot()
     def remove_stack(self):
@@ -277,14 +291,8 @@ class List(QMainWindow):
         if msg.exec_() == QMessageBox.Yes:
             index = self.ui.notebooksList.currentIndex()
             item = self.notebooksModel.itemFromIndex(index)
-            # loop notebooks and remove stack str
-            for notebook_struct in self.app.provider.list_notebooks():
-                notebook = Notebook.from_tuple(notebook_struct)
-                if(notebook.stack == item.stack):
-                    print "Clearing one notebook from its stack."
-                    notebook.stack = ''
-                    self.app.provider.update_notebook(notebook.struct)
-
+            # notebooks and notes are kept out of stack
+            self.app.provider.rename_stack(item.stack, '')
             self._reload_notebooks_list()
 
     @Slot()
@@ -364,6 +372,44 @@ class List(QMainWindow):
         menu.addAction(QIcon.fromTheme('gtk-delete'), self.tr('Remove'), self.remove_note)
         menu.exec_(self.ui.notesList.mapToGlobal(pos))
 
+    def _changes_received(self, changes):
+        """Update edited notes in place, reload lists otherwise"""
+        changes = filter(
+            lambda change: change.entity in LIST_ENTITIES, changes,
+        )
+        if not changes or not self.isVisible():
+            # hidden list reloaded on show
+            return
+        for change in changes:
+            if change.entity != CHANGE_NOTE or change.operation != CHANGE_UPDATE:
+                self._reload_data()
+                return
+        for change in changes:
+            for note_id in change.ids:
+                self.app.async_provider.get_note(note_id).then(
+                    self._note_updated,
+                )
+
+    def _note_updated(self, note_struct):
+        note = Note.from_tuple(note_struct)
+        for row in range(self.notesModel.rowCount()):
+            shown = self.notesModel.item(row, 0).note
+            if shown.id == note.id:
+                break
+        else:
+            # note may be moved to selected notebook or tag
+            self._reload_data()
+            return
+        if (
+            shown.notebook != note.notebook
+            or sorted(shown.tags) != sorted(note.tags)
+        ):
+            self._reload_data()
+            return
+        for column, item in enumerate(QNoteItemFactory(note).make_items()):
+            self.notesModel.setItem(row, column, item)
+        self._sort_notes()
+
     def _reload_data(self):
         self._reload_notebooks_list(self._current_notebook)
         self._reload_tags_list(self._current_tag)
@@ -1,4 +1,7 @@
+from PySide.QtCore import QObject, Signal
 from PySide.QtGui import QIcon
+from collections import OrderedDict
+from everpad import const
 import os
 import sys
 from everpad.tools import resource_filename
@@ -26,3 +29,86 @@ def get_file_icon_path():
         if os.path.isfile(path):
             return 'file://%s' % path
 file_icon_path = get_file_icon_path()
+
+
+class ProviderFuture(QObject):
+    """Result of provider call which is not finished yet.
+
+    Replies are delivered by the dbus main loop, so callbacks
+    always run in the gui thread.
+    """
+    finished = Signal(object)
+    failed = Signal(object)
+
+    def __init__(self, cached=None, *args, **kwargs):
+        QObject.__init__(self, *args, **kwargs)
+        self.cached = cached
+        self.result = None
+        self.error = None
+        self.done = False
+
+    def then(self, callback, errback=None):
+        """Call callback with result, immediately if already received"""
+        if self.done:
+            if self.error is None:
+                callback(self.result)
+            elif errback:
+                errback(self.error)
+        else:
+            self.finished.connect(callback)
+            if errback:
+                self.failed.connect(errback)
+        return self
+
+    def set_result(self, result):
+        self.result = result
+        self.done = True
+        self.finished.emit(result)
+
+    def set_error(self, error):
+        self.error = error
+        self.done = True
+        self.failed.emit(error)
+
+
+class AsyncProvider(object):
+    """Non blocking proxy for provider.
+
+    Each call returns `ProviderFuture` with last known result
+    of the same call in `cached`, so windows can render it at once
+    and update when the reply arrives. Only results of recent
+    calls are kept.
+    """
+
+    def __init__(self, provider, cache_size=const.ASYNC_CACHE_SIZE):
+        self._provider = provider
+        self._cache = OrderedDict()
+        self.cache_size = cache_size
+
+    def __getattr__(self, name):
+        method = getattr(self._provider, name)
+
+        def call(*args):
+            key = (name, repr(args))
+            future = ProviderFuture(cached=self._cache.get(key))
+
+            def on_reply(*values):
+                if len(values) > 1:
+                    result = values
+                elif values:
+                    result = values[0]
+                else:
+                    result = None
+                self._cache.pop(key, None)
+                self._cache[key] = result
+                while len(self._cache) > self.cache_size:
+                    self._cache.popitem(last=False)
+                future.set_result(result)
+
+            method(
+                *args,
+                reply_handler=on_reply,
+                error_handler=future.set_error
+            )
+            return future
+        return call
@@ -0,0 +1,101 @@
+from collections import OrderedDict
+from .. import const
+import threading
+import time
+
+
+class QueryCache(object):
+    """LRU cache of serialized query results.
+
+    Each entry knows entities it depends on and dropped when
+    one of them changed, so cached results are never stale.
+    """
+
+    def __init__(self, size=const.QUERY_CACHE_SIZE):
+        self.size = size
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._generation = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key, entities, compute):
+        """Get cached result or compute and store it"""
+        with self._lock:
+            if key in self._entries:
+                self.hits += 1
+                entry = self._entries.pop(key)
+                self._entries[key] = entry
+                return entry[1]
+            self.misses += 1
+            generation = self._generation
+
+        result = compute()
+
+        with self._lock:
+            # result computed before invalidation can be outdated
+            if generation == self._generation:
+                self._entries[key] = (frozenset(entities), result)
+                while len(self._entries) > self.size:
+                    self._entries.popitem(last=False)
+        return result
+
+    def invalidate(self, entities):
+        """Drop entries depending on changed entities"""
+        with self._lock:
+            self._generation += 1
+            for key, (depends, result) in self._entries.items():
+                if depends.intersection(entities):
+                    del self._entries[key]
+
+
+def cache_key(name, *args):
+    """Hashable key from method name and dbus arguments"""
+    key = [name]
+    for arg in args:
+        if isinstance(arg, list):
+            arg = tuple(arg)
+        elif isinstance(arg, set):
+            arg = frozenset(arg)
+        key.append(arg)
+    return tuple(key)
+
+
+class UserCache(object):
+    """User info of auth token kept for ttl.
+
+    Shard of account can change, but rarely, so it is requested
+    again after ttl or when auth changed.
+    """
+
+    def __init__(self, ttl=const.USER_CACHE_TTL):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._token = None
+        self._user = None
+        self._expires = 0
+
+    def get_user(self, user_store, auth_token):
+        """Get cached user or request it"""
+        with self._lock:
+            if auth_token == self._token and time.time() < self._expires:
+                return self._user
+
+        user = user_store.getUser(auth_token)
+
+        with self._lock:
+            self._token = auth_token
+            self._user = user
+            self._expires = time.time() + self.ttl
+        return user
+
+    def invalidate(self):
+        with self._lock:
+            self._token = self._user = None
+            self._expires = 0
+
+
+user_cache = UserCache()
@@ -0,0 +1,146 @@
+from collections import deque, OrderedDict
+from sqlalchemy import event
+from .. import const, basetypes as btype
+from . import models
+import threading
+import time
+
+
+ENTITIES = {
+    models.Note: const.CHANGE_NOTE,
+    models.Notebook: const.CHANGE_NOTEBOOK,
+    models.Tag: const.CHANGE_TAG,
+    models.Resource: const.CHANGE_RESOURCE,
+    models.Place: const.CHANGE_PLACE,
+}
+
+
+class ChangeFeed(object):
+    """Log of committed changes shared by provider sessions.
+
+    Changes are collected from session flushes and become visible
+    on commit, so sync thread and dbus service writes both go here.
+    """
+
+    def __init__(self, size=const.CHANGES_LOG_SIZE):
+        self._lock = threading.Lock()
+        self._log = deque(maxlen=size)
+        # tokens of previous provider process are always too old
+        self._token = int(time.time() * 1000)
+        self._pending = {}
+        self._listeners = []
+
+    @property
+    def token(self):
+        return self._token
+
+    def subscribe(self, callback):
+        """Call callback with changed entities after each commit"""
+        self._listeners.append(callback)
+
+    def watch(self, session):
+        """Collect changes made with session"""
+        event.listen(session, 'after_flush', self._after_flush)
+        event.listen(session, 'after_bulk_update', self._after_bulk)
+        event.listen(session, 'after_bulk_delete', self._after_bulk)
+        event.listen(session, 'after_commit', self._after_commit)
+        event.listen(session, 'after_rollback', self._after_rollback)
+
+    def _add_pending(self, session, entity, operation, obj_id=0):
+        self._pending.setdefault(session_key(session), []).append(
+            (entity, operation, obj_id),
+        )
+
+    def _after_flush(self, session, flush_context):
+        for obj in session.new:
+            entity = ENTITIES.get(type(obj))
+            if entity:
+                self._add_pending(session, entity, const.CHANGE_CREATE, obj.id)
+        for obj in session.dirty:
+            entity = ENTITIES.get(type(obj))
+            if entity and session.is_modified(
+                obj, include_collections=False, passive=True,
+            ):
+                if getattr(obj, 'action', None) in const.DISABLED_ACTIONS:
+                    operation = const.CHANGE_DELETE
+                else:
+                    operation = const.CHANGE_UPDATE
+                self._add_pending(session, entity, operation, obj.id)
+        for obj in session.deleted:
+            entity = ENTITIES.get(type(obj))
+            if entity:
+                self._add_pending(session, entity, const.CHANGE_DELETE, obj.id)
+
+    def _after_bulk(self, session, query, query_context, result):
+        """Affected ids unknown, clients should reload entity"""
+        for description in query.column_descriptions:
+            entity = ENTITIES.get(description['type'])
+            if entity:
+                self._add_pending(session, entity, const.CHANGE_RELOAD)
+
+    def _after_commit(self, session):
+        pending = self._pending.pop(session_key(session), [])
+        if pending:
+            with self._lock:
+                for change in pending:
+                    self._token += 1
+                    self._log.append((self._token,) + change)
+            entities = set(entity for entity, operation, obj_id in pending)
+            for callback in self._listeners:
+                callback(entities)
+
+    def _after_rollback(self, session):
+        self._pending.pop(session_key(session), None)
+
+    def since(self, token):
+        """Get current token, is delta complete and merged changes"""
+        with self._lock:
+            current = self._token
+            if self._log:
+                oldest = self._log[0][0] - 1
+            else:
+                oldest = current
+            if not (oldest <= token <= current):
+                return current, False, []
+            entries = [entry[1:] for entry in self._log if entry[0] > token]
+        return current, True, merge_changes(entries)
+
+
+def session_key(session):
+    return id(session)
+
+
+def merge_changes(entries):
+    """Merge entries to one change per entity and operation"""
+    reloaded = []
+    operations = OrderedDict()
+    for entity, operation, obj_id in entries:
+        if operation == const.CHANGE_RELOAD:
+            if entity not in reloaded:
+                reloaded.append(entity)
+            continue
+        key = (entity, obj_id)
+        previous = operations.get(key)
+        if previous == const.CHANGE_CREATE:
+            # client never seen created object
+            if operation == const.CHANGE_DELETE:
+                del operations[key]
+        else:
+            operations[key] = operation
+
+    grouped = OrderedDict()
+    for (entity, obj_id), operation in operations.items():
+        if entity not in reloaded:
+            grouped.setdefault((entity, operation), []).append(obj_id)
+
+    return [
+        btype.Change(entity=entity, operation=const.CHANGE_RELOAD, ids=[])
+        for entity in reloaded
+    ] + [
+        btype.Change(entity=entity, operation=operation, ids=ids)
+        for (entity, operation), ids in grouped.items()
+    ]
+
+
+feed = ChangeFeed()
+feed.subscribe(models.invalidate_identity_caches)
@@ -2,13 +2,20 @@
 from everpad.provider.service import ProviderService
 
 from everpad.provider.sync.agent import SyncThread
-from everpad.provider.tools import get_db_session
+from everpad.provider.tools import get_db_session, get_flag
+from everpad.provider.geocoding import PlaceResolver
+from everpad.provider.metrics import metrics, record_rpc
+from evernote.api.client import Store
+from evernote.edam import slotted
+from everpad.const import (
+    EDAM_FIELD_MASK, GEOCODING, GEOCODE_URL, SYNC_STOP_TIMEOUT,
+)
 from everpad.specific import AppClass
 from everpad.tools import print_version
 import everpad.provider.models
 from everpad.provider.enauth import get_auth_token,change_auth_token,delete_auth_token 
 
-from PySide.QtCore import Slot, QSettings
+from PySide.QtCore import Slot, QSettings, QTimer
 
 # do I need full dbus? MKG
 import dbus
@@ -97,10 +104,9 @@ class ProviderApp(AppClass):
             Slot(int)(self.service.sync_state_changed),
         )
 
-        # connect Sync thread data_changed
-        self.sync_thread.data_changed.connect(
-            Slot()(self.service.data_changed),
-        )
+        # connect Sync thread data_changed, changes are
+        # coalesced and sent to clients by service
+        self.sync_thread.data_changed.connect(self.service.changed)
         
         self.logger.debug("SyncThread init complete")
                 
@@ -128,9 +134,39 @@ class ProviderApp(AppClass):
             self.on_remove_authenticated,
         )
         self.service.qobject.terminate.connect(self.terminate)
+
+        self._init_metrics()
+        self._init_place_resolver()
         
         self.logger.info('Provider started.')
 
+    # Store calls are measured, metrics are dumped to log
+    # each metrics_dump_interval seconds when it is set
+    def _init_metrics(self):
+        Store.call_listeners.append(record_rpc)
+        interval = int(self.settings.value('metrics_dump_interval') or 0)
+        if interval > 0:
+            self.metrics_timer = QTimer()
+            self.metrics_timer.timeout.connect(self.dump_metrics)
+            self.metrics_timer.start(interval * 1000)
+
+    @Slot()
+    def dump_metrics(self):
+        self.logger.info('Metrics:\n%s' % metrics.format())
+
+    # Places of synced notes are resolved in background
+    # thread, geocode_url setting points to other service
+    def _init_place_resolver(self):
+        self.place_resolver = None
+        if not get_flag(self.settings, 'geocoding', GEOCODING):
+            return
+        self.place_resolver = PlaceResolver(
+            url=self.settings.value('geocode_url') or GEOCODE_URL,
+        )
+        self.place_resolver.start()
+        self.sync_thread.data_changed.connect(self.place_resolver.wakeup)
+        self.place_resolver.wakeup()
+
     # ************************************************************
     #          Authentication and Termination 
     # ************************************************************
@@ -157,8 +193,8 @@ class ProviderApp(AppClass):
     def on_remove_authenticated(self):
 
         self.logger.debug("Signal to remove authenticate")
-        self.sync_thread.timer.stop()
-        self.sync_thread.quit()
+        self.sync_thread.stop()
+        self.sync_thread.wait(SYNC_STOP_TIMEOUT)
         self.sync_thread.update_count = 0
 
         # delete_auth_token - enauth.py        
@@ -191,7 +227,10 @@ class ProviderApp(AppClass):
     # stop SyncThread 
     @Slot()
     def terminate(self):
-        self.sync_thread.quit()
+        self.sync_thread.stop()
+        self.sync_thread.wait(SYNC_STOP_TIMEOUT)
+        if self.place_resolver:
+            self.place_resolver.stop()
         self.quit()
 
 
@@ -229,6 +268,9 @@ def main():
     if args.version:
         print_version()
 
+    # slotted evernote types skipping fields everpad doesn't use
+    slotted.install(EDAM_FIELD_MASK)
+
     # lockfile using usr name getpass.getuser()
     # start main loop or error out
     fp = open('/tmp/gvernote-provider-%s.lock' % getpass.getuser(), 'w')
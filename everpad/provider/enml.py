@@ -0,0 +1,158 @@
+"""Streaming conversion of note html to ENML.
+
+Html is parsed once, allowed tags and attributes are written as
+well-formed ENML while parsing. Size of written ENML is counted, when
+next part doesn't fit in limit conversion stops on tag boundary and
+open tags are closed, so content is never cut mid-tag.
+"""
+from HTMLParser import HTMLParser, HTMLParseError
+from htmlentitydefs import name2codepoint
+from xml.sax.saxutils import escape, quoteattr
+from evernote.edam.limits import constants as limits
+from ..tools import ALLOWED_TAGS, DISALLOWED_ATTRS, ALLOWED_PROTOCOLS, clean
+
+ENML_HEADER = (
+    '<!DOCTYPE en-note SYSTEM "http://xml.evernote.com/pub/enml2.dtd">\n'
+    '<en-note>'
+)
+ENML_FOOTER = '</en-note>'
+EMPTY_TAGS = ('area', 'br', 'col', 'hr', 'img', 'en-media', 'en-todo')
+# html fed to parser by parts, written ENML yielded after each
+FEED_SIZE = 65536
+
+
+class ENMLConverter(HTMLParser):
+    """Convert html to ENML in one pass, size and truncated
+    are set after conversion"""
+
+    def __init__(self, limit=limits.EDAM_NOTE_CONTENT_LEN_MAX):
+        HTMLParser.__init__(self)
+        self.limit = limit
+        self.size = 0
+        self.truncated = False
+        self._open = []
+        # size of closing tags of open tags and note
+        self._closing = len(ENML_FOOTER)
+        self._parts = []
+
+    def convert(self, html):
+        """Yield utf8 encoded parts of ENML"""
+        if isinstance(html, str):
+            html = html.decode('utf8')
+        self._write(ENML_HEADER)
+        try:
+            for pos in xrange(0, len(html), FEED_SIZE):
+                self.feed(html[pos:pos + FEED_SIZE])
+                for part in self._flush():
+                    yield part
+                if self.truncated:
+                    break
+            else:
+                self.close()
+        except HTMLParseError:
+            # rest of broken html is dropped
+            self.truncated = True
+        while self._open:
+            self._close_tag()
+        self._parts.append(ENML_FOOTER)
+        self.size += len(ENML_FOOTER)
+        for part in self._flush():
+            yield part
+
+    def _flush(self):
+        parts, self._parts = self._parts, []
+        return parts
+
+    def _write(self, part, closing=0):
+        """Write utf8 part when fits in limit with all closing tags"""
+        if self.truncated:
+            return False
+        if isinstance(part, unicode):
+            part = part.encode('utf8')
+        if self.size + len(part) + self._closing + closing > self.limit:
+            self.truncated = True
+            return False
+        self._parts.append(part)
+        self.size += len(part)
+        return True
+
+    def _close_tag(self):
+        part = ('</%s>' % self._open.pop()).encode('utf8')
+        self._parts.append(part)
+        self.size += len(part)
+        self._closing -= len(part)
+
+    def _format_attrs(self, attrs):
+        result = u''
+        for name, value in attrs:
+            if name in DISALLOWED_ATTRS:
+                continue
+            if value is None:
+                value = name
+            if name == 'href' and not any(
+                value.startswith(proto + '://') for proto in ALLOWED_PROTOCOLS
+            ):
+                continue
+            result += u' %s=%s' % (name, quoteattr(clean(value)))
+        return result
+
+    def handle_starttag(self, tag, attrs):
+        if tag not in ALLOWED_TAGS:
+            return
+        if tag in EMPTY_TAGS:
+            self._write(u'<%s%s/>' % (tag, self._format_attrs(attrs)))
+            return
+        closing = len('</%s>' % tag)
+        if self._write(
+            u'<%s%s>' % (tag, self._format_attrs(attrs)), closing,
+        ):
+            self._open.append(tag)
+            self._closing += closing
+
+    def handle_startendtag(self, tag, attrs):
+        self.handle_starttag(tag, attrs)
+        if tag not in EMPTY_TAGS:
+            self.handle_endtag(tag)
+
+    def handle_endtag(self, tag):
+        # unbalanced tags are closed with parent
+        if tag in self._open:
+            while self._open[-1] != tag:
+                self._close_tag()
+            self._close_tag()
+
+    def handle_data(self, data):
+        if self.truncated:
+            return
+        part = escape(clean(data)).encode('utf8')
+        available = self.limit - self.size - self._closing
+        # text is cut to fill the rest of limit
+        while len(part) > available:
+            self.truncated = True
+            data = data[:max(len(data) * available // len(part), 1) - 1]
+            part = escape(clean(data)).encode('utf8')
+        self._parts.append(part)
+        self.size += len(part)
+
+    def handle_entityref(self, name):
+        if name in name2codepoint:
+            self.handle_data(unichr(name2codepoint[name]))
+        else:
+            self.handle_data(u'&%s;' % name)
+
+    def handle_charref(self, name):
+        try:
+            if name[:1] in ('x', 'X'):
+                char = unichr(int(name[1:], 16))
+            else:
+                char = unichr(int(name))
+        except (ValueError, OverflowError):
+            return
+        self.handle_data(char)
+
+
+def html_to_enml(html, limit=limits.EDAM_NOTE_CONTENT_LEN_MAX):
+    """Convert html to ENML, returns ENML and converter
+    with size and truncated"""
+    converter = ENMLConverter(limit)
+    return ''.join(converter.convert(html)), converter
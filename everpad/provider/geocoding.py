@@ -0,0 +1,118 @@
+"""Resolving places of notes by coordinates.
+
+Notes with coordinates but without place name get place by geocode
+lookup. Lookups run in background thread with interval between
+requests, names are kept by rounded coordinates in geocodes table,
+so each place requested once.
+"""
+from sqlalchemy.orm.exc import NoResultFound
+from . import models
+from .tools import get_db_session
+from .. import const
+import threading
+import logging
+import urllib2
+import socket
+import json
+import time
+
+logger = logging.getLogger('gevernote-provider')
+
+
+def get_latlng(latitude, longitude):
+    """Key of coordinates, ~10m precision"""
+    return '%.4f,%.4f' % (latitude, longitude)
+
+
+class PlaceResolver(threading.Thread):
+    """Resolve places of notes when woken up after sync"""
+
+    def __init__(
+        self, url=const.GEOCODE_URL, interval=const.GEOCODE_INTERVAL,
+        timeout=const.GEOCODE_TIMEOUT, session=None,
+    ):
+        super(PlaceResolver, self).__init__(name='PlaceResolver')
+        self.daemon = True
+        self.url = url
+        self.interval = interval
+        self.timeout = timeout
+        self.session = session
+        self._wakeup = threading.Event()
+        self._stopped = False
+        self._requested = 0
+
+    def wakeup(self):
+        self._wakeup.set()
+
+    def stop(self):
+        self._stopped = True
+        self._wakeup.set()
+
+    def run(self):
+        if not self.session:
+            self.session = get_db_session()
+        while not self._stopped:
+            self._wakeup.wait()
+            self._wakeup.clear()
+            try:
+                self.resolve()
+            except Exception:
+                logger.exception('Resolving places failed')
+                self.session.rollback()
+
+    def resolve(self):
+        """Resolve places of notes, returns count of resolved notes"""
+        notes = {}
+        for note in self.session.query(models.Note).filter(
+            (models.Note.place_id == None)
+            & (models.Note.latitude != None)
+            & (models.Note.longitude != None)
+            & (models.Note.action != const.ACTION_DELETE)
+        ):
+            notes.setdefault(
+                get_latlng(note.latitude, note.longitude), [],
+            ).append(note)
+
+        resolved = 0
+        for latlng, same_place in notes.items():
+            if self._stopped:
+                break
+            try:
+                name = self._get_name(latlng, same_place[0])
+            except (IOError, socket.error, ValueError), e:
+                # resolved on next wake up
+                logger.debug('Geocode lookup failed: %s' % e)
+                continue
+            if name:
+                for note in same_place:
+                    note.set_place(name, self.session)
+                resolved += len(same_place)
+            self.session.commit()
+        return resolved
+
+    def _get_name(self, latlng, note):
+        try:
+            return self.session.query(models.Geocode).filter(
+                models.Geocode.latlng == latlng,
+            ).one().name
+        except NoResultFound:
+            pass
+
+        name = self.lookup(note.latitude, note.longitude)
+        self.session.add(models.Geocode(latlng=latlng, name=name))
+        return name
+
+    def lookup(self, latitude, longitude):
+        """Request name of place, None when nothing found"""
+        wait = self._requested + self.interval - time.time()
+        if wait > 0:
+            time.sleep(wait)
+        self._requested = time.time()
+
+        data = json.load(urllib2.urlopen(
+            self.url % (latitude, longitude), timeout=self.timeout,
+        ))
+        try:
+            return data['results'][0]['formatted_address']
+        except (IndexError, KeyError, TypeError):
+            return None
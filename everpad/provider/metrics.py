@@ -0,0 +1,118 @@
+from contextlib import contextmanager
+from sqlalchemy import event
+from .. import const, basetypes as btype
+import functools
+import threading
+import time
+
+
+class Metrics(object):
+    """Counters of provider hot paths.
+
+    Each metric keeps count, total and max of recorded values,
+    durations are in seconds and sizes in bytes.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def record(self, name, value):
+        with self._lock:
+            count, total, maximum = self._values.get(name, (0, 0, 0))
+            self._values[name] = (count + 1, total + value, max(maximum, value))
+
+    @contextmanager
+    def timer(self, name):
+        """Record duration of block"""
+        started = time.time()
+        try:
+            yield
+        finally:
+            self.record(name, time.time() - started)
+
+    def get(self, name):
+        """Get count, total and max of metric"""
+        with self._lock:
+            return self._values.get(name, (0, 0, 0))
+
+    def snapshot(self):
+        with self._lock:
+            return [
+                btype.Metric(
+                    name=name, count=count, total=total, max=maximum,
+                ) for name, (count, total, maximum) in sorted(
+                    self._values.items(),
+                )
+            ]
+
+    def reset(self):
+        with self._lock:
+            self._values.clear()
+
+    def format(self):
+        """Human readable snapshot for log"""
+        return '\n'.join(
+            '%s: count %d, total %.3f, max %.3f' % (
+                metric.name, metric.count, metric.total, metric.max,
+            ) for metric in self.snapshot()
+        )
+
+
+def timed(prefix):
+    """Record latency and result size of method.
+
+    Apply above dbus.service.method, wrapper keeps dbus attributes.
+    """
+    def decorator(method):
+        name = '%s.%s' % (prefix, method.__name__)
+        # structs are tuples too, only arrays are counted
+        signature = getattr(method, '_dbus_out_signature', None)
+
+        @functools.wraps(method)
+        def wrapper(*args, **kwargs):
+            with metrics.timer(name):
+                result = method(*args, **kwargs)
+            if signature:
+                is_array = signature.startswith('a')
+            else:
+                is_array = isinstance(result, list)
+            if is_array:
+                metrics.record('%s.results' % name, len(result))
+            return result
+        return wrapper
+    return decorator
+
+
+def record_rpc(name, seconds, sent, received):
+    """Listener for evernote store calls"""
+    metrics.record('rpc.%s' % name, seconds)
+    metrics.record('rpc.%s.sent' % name, sent)
+    metrics.record('rpc.%s.received' % name, received)
+
+
+def sync_state_name(state):
+    for name in dir(const):
+        if name.startswith('SYNC_STATE_') and getattr(const, name) == state:
+            return name[len('SYNC_STATE_'):].lower()
+    return str(state)
+
+
+def watch_engine(engine):
+    """Record sql statements per thread, sessions are thread scoped"""
+    started = threading.local()
+
+    def before_execute(conn, cursor, statement, *args):
+        started.at = time.time()
+
+    def after_execute(conn, cursor, statement, *args):
+        metrics.record(
+            'sql.%s' % threading.current_thread().name,
+            time.time() - getattr(started, 'at', time.time()),
+        )
+
+    event.listen(engine, 'before_cursor_execute', before_execute)
+    event.listen(engine, 'after_cursor_execute', after_execute)
+
+
+metrics = Metrics()
@@ -0,0 +1,126 @@
+from sqlalchemy import text
+from .models import Base, search_lower, html_to_text
+from .. import const
+import logging
+
+logger = logging.getLogger('gevernote-provider')
+
+# schema of databases created before migrations
+BASE_SCHEMA_VERSION = 5
+
+
+def get_version(connection):
+    return connection.execute('PRAGMA user_version').scalar()
+
+
+def set_version(connection, version):
+    connection.execute('PRAGMA user_version = %d' % version)
+
+
+def create_indexes(connection):
+    """Add indexes declared in models to existing tables"""
+    existing = set(name for name, in connection.execute(
+        "SELECT name FROM sqlite_master WHERE type = 'index'",
+    ))
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            if index.name not in existing:
+                index.create(connection)
+
+
+def add_column(connection, table, column, type_='VARCHAR'):
+    """Add column if table created without it"""
+    columns = [row[1] for row in connection.execute(
+        'PRAGMA table_info(%s)' % table,
+    )]
+    if column not in columns:
+        connection.execute('ALTER TABLE %s ADD COLUMN %s %s' % (
+            table, column, type_,
+        ))
+
+
+def add_search_columns(connection):
+    """Fill lowercased search columns, python lower is unicode aware"""
+    connection.connection.create_function('search_lower', 1, search_lower)
+    for table, column, source in (
+        ('notes', 'title_lower', 'title'),
+        ('notes', 'content_lower', 'content'),
+        ('notebooks', 'name_lower', 'name'),
+        ('tags', 'name_lower', 'name'),
+    ):
+        add_column(connection, table, column)
+        connection.execute('UPDATE %s SET %s = search_lower(%s)' % (
+            table, column, source,
+        ))
+
+
+def add_text_columns(connection):
+    """Fill plain text and snippet, search by text instead of html"""
+    add_column(connection, 'notes', 'content_text')
+    add_column(connection, 'notes', 'snippet')
+    rows = []
+    for note_id, content in connection.execute(
+        'SELECT id, content FROM notes',
+    ):
+        content_text = html_to_text(content)
+        rows.append({
+            'id': note_id,
+            'content_text': content_text,
+            'content_lower': search_lower(content_text),
+            'snippet': content_text and content_text[:const.SNIPPET_LENGTH],
+        })
+    if rows:
+        connection.execute(text(
+            'UPDATE notes SET content_text = :content_text,'
+            ' content_lower = :content_lower, snippet = :snippet'
+            ' WHERE id = :id'
+        ), rows)
+
+
+def add_content_pending(connection):
+    """Notes stored by metadata wait for content"""
+    add_column(connection, 'notes', 'content_pending', 'BOOLEAN')
+
+
+def add_resource_cache_columns(connection):
+    """Resources data cached by access time, offline notebooks pinned"""
+    add_column(connection, 'resources', 'accessed', 'INTEGER')
+    add_column(connection, 'notebooks', 'offline', 'BOOLEAN')
+
+
+def add_coordinates(connection):
+    """Places of notes resolved by coordinates in background"""
+    add_column(connection, 'notes', 'latitude', 'FLOAT')
+    add_column(connection, 'notes', 'longitude', 'FLOAT')
+
+
+# schema version: migration upgrading from previous version
+MIGRATIONS = {
+    6: create_indexes,
+    7: add_search_columns,
+    8: add_text_columns,
+    9: add_content_pending,
+    10: add_resource_cache_columns,
+    11: add_coordinates,
+}
+
+
+def migrate(engine):
+    """Create missing tables and upgrade database to SCHEMA_VERSION"""
+    Base.metadata.create_all(engine)
+    connection = engine.connect()
+    try:
+        version = max(get_version(connection), BASE_SCHEMA_VERSION)
+        if version > const.SCHEMA_VERSION:
+            logger.warning(
+                'Database schema %d is newer than %d',
+                version, const.SCHEMA_VERSION,
+            )
+            return
+        for version in range(version + 1, const.SCHEMA_VERSION + 1):
+            logger.info('Migrating database to schema %d', version)
+            with connection.begin():
+                MIGRATIONS[version](connection)
+                set_version(connection, version)
+    finally:
+        connection.close()
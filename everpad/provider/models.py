@@ -1,18 +1,20 @@
-from BeautifulSoup import BeautifulSoup
+from BeautifulSoup import BeautifulSoup, Comment
 
-from sqlalchemy import Table, Column, ForeignKey, Integer, String, Boolean
-from sqlalchemy.orm import relationship
+from sqlalchemy import (
+    Table, Column, ForeignKey, Integer, String, Boolean, Float, Index, event,
+)
+from sqlalchemy.orm import relationship, validates
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm.exc import NoResultFound
 
 from ..tools import prepare_file_path
 from .. import const
 import binascii
+import threading
+import weakref
 import os
-import urllib
-import json
 import dbus
-import socket
+import re
 
 
 # The declarative_base() callable returns a new base class from 
@@ -24,10 +26,33 @@ Base = declarative_base()
 # engine = create_engine('sqlite:///%s' % db_path)
 # in tools.py
 
+
+def search_lower(value):
+    """Lowercase value for search columns, unicode aware"""
+    if value is None:
+        return None
+    return unicode(value).lower()
+
+
+def html_to_text(content):
+    """Plain text of note html with collapsed whitespaces"""
+    if content is None:
+        return None
+    soup = BeautifulSoup(
+        content, convertEntities=BeautifulSoup.HTML_ENTITIES,
+    )
+    return re.sub(r'\s+', ' ', u' '.join(
+        text for text in soup.findAll(text=True)
+        if not isinstance(text, Comment)
+    ), flags=re.UNICODE).strip()
+
 notetags_table = Table(
     'notetags', Base.metadata,
     Column('note', Integer, ForeignKey('notes.id')),
-    Column('tag', Integer, ForeignKey('tags.id'))
+    Column('tag', Integer, ForeignKey('tags.id')),
+    # both directions used, note tags and tag notes
+    Index('ix_notetags_note_tag', 'note', 'tag'),
+    Index('ix_notetags_tag_note', 'tag', 'note'),
 )
 
 
@@ -54,23 +79,31 @@ notetags_table = Table(
 class Note(Base):
     __tablename__ = 'notes'
     id = Column(Integer, primary_key=True)
-    guid = Column(String)
+    guid = Column(String, index=True)
     title = Column(String)
     content = Column(String)
+
+    # kept by validators, content_lower is lowercased plain text
+    title_lower = Column(String)
+    content_lower = Column(String)
+    content_text = Column(String)
+    snippet = Column(String)
     
     # MKG added for playing
     contentHash = Column(String)   
     contentLength = Column(Integer)
     
     created = Column(Integer)
-    updated = Column(Integer)
+    updated = Column(Integer, index=True)
     
     
     #deleted
     #active
     
     updated_local = Column(Integer)
-    notebook_id = Column(Integer, ForeignKey('notebooks.id'))
+    # stored by sync metadata, content and resources not pulled yet
+    content_pending = Column(Boolean, default=False)
+    notebook_id = Column(Integer, ForeignKey('notebooks.id'), index=True)
     notebook = relationship("Notebook", backref='note')
     tags = relationship(
         "Tag",
@@ -81,10 +114,13 @@ class Note(Base):
     resources = relationship("Resource")
     place_id = Column(Integer, ForeignKey('places.id'))
     place = relationship("Place", backref='note')
-    action = Column(Integer)
+    # place of note without name resolved by PlaceResolver
+    latitude = Column(Float)
+    longitude = Column(Float)
+    action = Column(Integer, index=True)
     conflict_parent = relationship("Note", post_update=False)
     conflict_parent_id = Column(
-        Integer, ForeignKey('notes.id'), nullable=True,
+        Integer, ForeignKey('notes.id'), nullable=True, index=True,
     )
 
     # sharing data:
@@ -92,6 +128,19 @@ class Note(Base):
     share_status = Column(Integer, default=const.SHARE_NONE)
     share_url = Column(String)
 
+    @validates('title')
+    def _validate_title(self, key, value):
+        self.title_lower = search_lower(value)
+        return value
+
+    @validates('content')
+    def _validate_content(self, key, value):
+        self.content_text = html_to_text(value)
+        self.content_lower = search_lower(self.content_text)
+        if self.content_text is not None:
+            self.snippet = self.content_text[:const.SNIPPET_LENGTH]
+        return value
+
 
     # not real good with @property in python
     # following are getters/setters
@@ -104,17 +153,16 @@ class Note(Base):
 
     @tags_dbus.setter
     def tags_dbus(self, val):
+        cache = get_identity_cache(self.session)
         tags = []
         for tag in val:
             if tag and tag != ' ':  # for blank array and other
                 try:
-                    tags.append(self.session.query(Tag).filter(
-                        (Tag.name == tag)
-                        & (Tag.action != const.ACTION_DELETE)
-                    ).one())
+                    tags.append(cache.tag_by_name(tag))
                 except NoResultFound:
                     tg = Tag(name=tag, action=const.ACTION_CREATE)
                     self.session.add(tg)
+                    cache.add_tag(tg)
                     tags.append(tg)
         self.tags = tags
 
@@ -124,20 +172,15 @@ class Note(Base):
         if self.notebook:
             return self.notebook.id
         else:
-            return self.session.query(Notebook).filter(
-                Notebook.default == True,
-            ).one().id
+            return get_identity_cache(self.session).default_notebook().id
 
     @notebook_dbus.setter
     def notebook_dbus(self, val):
+        cache = get_identity_cache(self.session)
         try:
-            self.notebook = self.session.query(Notebook).filter(
-                Notebook.id == val,
-            ).one()
+            self.notebook = cache.notebook_by_id(val)
         except NoResultFound:
-            self.notebook = self.session.query(Notebook).filter(
-                Notebook.default == True,
-            ).one()
+            self.notebook = cache.default_notebook()
 
     # -- get/set note's place
     @property
@@ -193,32 +236,38 @@ class Note(Base):
     @share_url_dbus.setter
     def share_url_dbus(self, val):
         pass
+
+    # -- snippet computed from content
+    @property
+    def snippet_dbus(self):
+        return self.snippet or ''
+
+    @snippet_dbus.setter
+    def snippet_dbus(self, val):
+        pass
     
     # stuff the database with the note values
     # passed note and database session
     def from_api(self, note, session):
-        """Fill data from api"""
+        """Fill data from api, content kept when note has none"""
         
-        # handle note content 
-        soup = BeautifulSoup(note.content.decode('utf8'))
-        content = reduce(
-            lambda txt, cur: txt + unicode(cur),
-            soup.find('en-note').contents, u'',
-        )
+        # handle note content, sync metadata comes without it
+        if note.content is not None:
+            self.set_enml(note.content)
+        elif self.content is None:
+            self.content = u''
         
         # record stuffing ...
         self.title = note.title.decode('utf8')
-        self.content = content
         self.created = note.created
         self.updated = note.updated
         self.action = const.ACTION_NONE
         
         # shouldn't there always be a notebook guid????
+        cache = get_identity_cache(session)
         try:        
             if note.notebookGuid:
-                self.notebook = session.query(Notebook).filter(
-                    Notebook.guid == note.notebookGuid,
-                ).one()
+                self.notebook = cache.notebook_by_guid(note.notebookGuid)
         except NoResultFound:
             print note.notebookGuid
             self.shit = session.query(Notebook).filter(
@@ -227,9 +276,7 @@ class Note(Base):
             
         # note tags    
         if note.tagGuids:
-            self.tags = session.query(Tag).filter(
-                Tag.guid.in_(note.tagGuids),
-            ).all()
+            self.tags = cache.tags_by_guids(note.tagGuids)
         
         # handle places ....
         #
@@ -240,29 +287,32 @@ class Note(Base):
         # NOT automatically add place name values based on geolocation without confirmation from the 
         # user; that is, the value in this field should be more useful than a simple automated lookup 
         # based on the note's latitude and longitude. 
-        place_name = None
+        # Place of note with coordinates only is resolved in background
+        # by geocoding.PlaceResolver, lookup here stalls sync.
         if getattr(note, 'attributes'):
+            if (
+                self.latitude != note.attributes.latitude
+                or self.longitude != note.attributes.longitude
+            ):
+                self.latitude = note.attributes.latitude
+                self.longitude = note.attributes.longitude
+                self.place = None
             if note.attributes.placeName:
-                place_name = note.attributes.placeName.decode('utf8')
-            elif note.attributes.longitude:
-                try:
-                    data = json.loads(urllib.urlopen(
-                        'http://maps.googleapis.com/maps/api/geocode/json?latlng=%.4f,%.4f&sensor=false' % (
-                            note.attributes.latitude,
-                            note.attributes.longitude,
-                        ),
-                    ).read())
-                    try:
-                        place_name = data['results'][0]['formatted_address']
-                    except (IndexError, KeyError):
-                        pass
-                except socket.error:
-                    pass
-        if place_name:
-            self.set_place(place_name, session)
+                self.set_place(
+                    note.attributes.placeName.decode('utf8'), session,
+                )
         
         # end of stuffin :)
         
+    def set_enml(self, enml):
+        """Set content from note enml"""
+        soup = BeautifulSoup(enml.decode('utf8'))
+        self.content = reduce(
+            lambda txt, cur: txt + unicode(cur),
+            soup.find('en-note').contents, u'',
+        )
+        self.content_pending = False
+
     # just a local to set places
     def set_place(self, name, session):
         try:
@@ -296,8 +346,9 @@ class Note(Base):
 class Notebook(Base):
     __tablename__ = 'notebooks'
     id = Column(Integer, primary_key=True)
-    guid = Column(String)
+    guid = Column(String, index=True)
     name = Column(String)
+    name_lower = Column(String)
     usn = Column(Integer)
     default = Column(Boolean)
     service_created = Column(Integer)
@@ -306,6 +357,13 @@ class Notebook(Base):
 
     # local use
     action = Column(Integer)
+    # resources data of notes always kept, see resources.py
+    offline = Column(Boolean, default=False)
+
+    @validates('name')
+    def _validate_name(self, key, value):
+        self.name_lower = search_lower(value)
+        return value
 
     # Generate database notebook record
     def from_api(self, notebook):
@@ -344,13 +402,19 @@ class Notebook(Base):
 class Tag(Base):
     __tablename__ = 'tags'
     id = Column(Integer, primary_key=True)
-    guid = Column(String)
+    guid = Column(String, index=True)
     name = Column(String)
+    name_lower = Column(String)
     parentGuid = Column(String)
 
     # local use
     action = Column(Integer)
 
+    @validates('name')
+    def _validate_name(self, key, value):
+        self.name_lower = search_lower(value)
+        return value
+
     def from_api(self, tag):
         """Fill data from api"""
         self.name = tag.name.decode('utf8')
@@ -456,13 +520,15 @@ class Searches(Base):
 class Resource(Base):
     __tablename__ = 'resources'
     id = Column(Integer, primary_key=True)
-    note_id = Column(Integer, ForeignKey('notes.id'))
+    note_id = Column(Integer, ForeignKey('notes.id'), index=True)
     file_name = Column(String)
     file_path = Column(String)
-    guid = Column(String)
+    guid = Column(String, index=True)
     hash = Column(String)
     mime = Column(String)
     action = Column(Integer)
+    # ms, data files removed least recently accessed first
+    accessed = Column(Integer)
 
     def from_api(self, resource):
         """Fill data from api"""
@@ -499,6 +565,137 @@ class Place(Base):
     id = Column(Integer, primary_key=True)
     name = Column(String)
 
+
+# Coordinates resolved to place name, name is None when
+# nothing found
+class Geocode(Base):
+    __tablename__ = 'geocodes'
+    id = Column(Integer, primary_key=True)
+    latlng = Column(String, index=True, unique=True)
+    name = Column(String)
+
+# *************************************************************
+# Tags and notebooks of session by name, guid and id
+#
+# Tables are small, so they are loaded whole on first lookup and
+# dropped when tags or notebooks are written by own session or
+# committed by other, see changes.feed.
+class IdentityCache(object):
+
+    def __init__(self, session):
+        # session keeps listeners, so cache doesn't keep session
+        self._session = weakref.proxy(session)
+        self._tags = None
+        self._notebooks = None
+        event.listen(session, 'after_flush', self._after_flush)
+        event.listen(session, 'after_bulk_update', self.clear)
+        event.listen(session, 'after_bulk_delete', self.clear)
+        event.listen(session, 'after_rollback', self.clear)
+
+    def clear(self, *args):
+        self._tags = None
+        self._notebooks = None
+
+    def _after_flush(self, session, flush_context):
+        for obj in session.dirty:
+            # notes added to tag by backref don't change it
+            if isinstance(obj, (Tag, Notebook)) and session.is_modified(
+                obj, include_collections=False, passive=True,
+            ):
+                self.clear()
+                return
+        for objects in (session.new, session.deleted):
+            for obj in objects:
+                if isinstance(obj, (Tag, Notebook)):
+                    self.clear()
+                    return
+
+    def invalidate(self, entities):
+        if const.CHANGE_TAG in entities:
+            self._tags = None
+        if const.CHANGE_NOTEBOOK in entities:
+            self._notebooks = None
+
+    def _get_tags(self):
+        tags = self._tags
+        if tags is None:
+            tags = {'name': {}, 'guid': {}}
+            for tag in self._session.query(Tag):
+                self._index_tag(tags, tag)
+            self._tags = tags
+        return tags
+
+    def _index_tag(self, tags, tag):
+        if tag.guid:
+            tags['guid'][tag.guid] = tag
+        if tag.action != const.ACTION_DELETE:
+            tags['name'][tag.name] = tag
+
+    def _get_notebooks(self):
+        notebooks = self._notebooks
+        if notebooks is None:
+            notebooks = {'id': {}, 'guid': {}, 'default': []}
+            for notebook in self._session.query(Notebook):
+                notebooks['id'][notebook.id] = notebook
+                if notebook.guid:
+                    notebooks['guid'][notebook.guid] = notebook
+                if notebook.default:
+                    notebooks['default'].append(notebook)
+            self._notebooks = notebooks
+        return notebooks
+
+    def _get(self, index, key):
+        try:
+            return index[key]
+        except KeyError:
+            raise NoResultFound()
+
+    def tag_by_name(self, name):
+        """Not deleted tag by name"""
+        return self._get(self._get_tags()['name'], name)
+
+    def tags_by_guids(self, guids):
+        tags = self._get_tags()['guid']
+        return [tags[guid] for guid in guids if guid in tags]
+
+    def add_tag(self, tag):
+        """Tag added to session before flush"""
+        self._index_tag(self._get_tags(), tag)
+
+    def notebook_by_id(self, id):
+        return self._get(self._get_notebooks()['id'], id)
+
+    def notebook_by_guid(self, guid):
+        return self._get(self._get_notebooks()['guid'], guid)
+
+    def default_notebook(self):
+        default = self._get_notebooks()['default']
+        if len(default) != 1:
+            raise NoResultFound()
+        return default[0]
+
+
+_identity_caches = weakref.WeakKeyDictionary()
+_identity_caches_lock = threading.Lock()
+
+
+def get_identity_cache(session):
+    with _identity_caches_lock:
+        try:
+            return _identity_caches[session]
+        except KeyError:
+            cache = _identity_caches[session] = IdentityCache(session)
+            return cache
+
+
+def invalidate_identity_caches(entities):
+    """Drop cached tags and notebooks of all sessions"""
+    with _identity_caches_lock:
+        caches = _identity_caches.values()
+    for cache in caches:
+        cache.invalidate(entities)
+
+
 # *************************************************************
 # Internal table for provider use
 #
@@ -0,0 +1,78 @@
+"""Local cache of resources data.
+
+In lazy mode sync stores only resource rows, data is downloaded when
+resource is opened. Files of least recently accessed resources are
+removed when cache grows over its size. Resources of offline notebooks
+are pinned: always downloaded and never removed. Resources created or
+changed locally are never removed too, their file is the only copy.
+"""
+from sqlalchemy import or_
+from . import models
+from .tools import get_flag
+from .. import const
+import logging
+import time
+import os
+
+logger = logging.getLogger('gevernote-provider')
+
+
+def is_lazy(settings):
+    return get_flag(settings, 'lazy_resources', const.LAZY_RESOURCES)
+
+
+def get_cache_size(settings):
+    """Cache size in bytes"""
+    try:
+        size = int(settings.value('resource_cache_size') or 0)
+    except ValueError:
+        size = 0
+    return (size or const.RESOURCE_CACHE_SIZE) * 1024 * 1024
+
+
+def is_pinned(note):
+    return bool(note.notebook and note.notebook.offline)
+
+
+def is_touched(resource):
+    """Resource accessed recently, access time not written again"""
+    return bool(resource.accessed) and resource.accessed > (
+        time.time() - const.RESOURCE_TOUCH_INTERVAL
+    ) * 1000
+
+
+def touch(session, resource_ids):
+    """Mark resources accessed without change notifications"""
+    if not resource_ids:
+        return
+    session.execute(models.Resource.__table__.update().where(
+        models.Resource.id.in_(resource_ids),
+    ).values(accessed=int(time.time() * 1000)))
+    session.commit()
+
+
+def evict(session, size):
+    """Remove data over size of least recently accessed resources,
+    returns count of removed files"""
+    query = session.query(
+        models.Resource.file_path,
+    ).join(models.Note).outerjoin(models.Notebook).filter(
+        (models.Resource.action == const.ACTION_NONE)
+        & or_(
+            models.Notebook.offline == None,
+            models.Notebook.offline == False,
+        )
+    ).order_by(models.Resource.accessed.desc(), models.Resource.id.desc())
+
+    total = removed = 0
+    for file_path, in query:
+        try:
+            total += os.path.getsize(file_path)
+        except (OSError, TypeError):
+            continue
+        if total > size:
+            os.remove(file_path)
+            removed += 1
+    if removed:
+        logger.debug('Removed %d resources data over cache size' % removed)
+    return removed
@@ -1,15 +1,18 @@
-from PySide.QtCore import Signal, QObject
-from sqlalchemy import or_, and_, func
+from PySide.QtCore import Signal, QObject, QTimer, Slot
+from sqlalchemy import or_, and_, func, case
 from sqlalchemy.orm.exc import NoResultFound
 from dbus.exceptions import DBusException
 from .. import const, basetypes as btype
 from ..specific import AppClass
-from . import models
+from . import models, changes, resources
+from .cache import QueryCache, cache_key, user_cache
+from .metrics import metrics, timed
 from .tools import get_db_session
 from everpad.provider.enauth import get_auth_token, change_auth_token
 import dbus
 import dbus.service
 import time
+import os
 
 from evernote.edam.userstore.constants import EDAM_VERSION_MAJOR, EDAM_VERSION_MINOR
 
@@ -27,13 +30,11 @@ class NoteFilterer(object):
         if words:
             words = '%' + words.replace(' ', '%').lower() + '%'
             self._filters.append(
-                func.lower(models.Note.title).like(words)
-                | func.lower(models.Note.content).like(words)
-                | models.Note.tags.any(
-                    func.lower(models.Tag.name).like(words),
-                )
+                models.Note.title_lower.like(words)
+                | models.Note.content_lower.like(words)
+                | models.Note.tags.any(models.Tag.name_lower.like(words))
                 | models.Note.notebook.has(
-                    func.lower(models.Notebook.name).like(words)
+                    models.Notebook.name_lower.like(words),
                 )
             )
         return self
@@ -106,6 +107,44 @@ class ProviderService(dbus.service.Object):
         super(ProviderService, self).__init__(*args, **kwargs)
         self.qobject = ProviderServiceQObject()
         self.app = AppClass.instance()
+        self._init_changes()
+        self._query_cache = QueryCache()
+        changes.feed.subscribe(self._query_cache.invalidate)
+
+    def _init_changes(self):
+        """Coalesce change notifications within short window"""
+        self._changes_token = changes.feed.token
+        self._changes_timer = QTimer()
+        self._changes_timer.setSingleShot(True)
+        self._changes_timer.setInterval(const.CHANGES_DELAY)
+        self._changes_timer.timeout.connect(self._emit_changes)
+
+    @Slot()
+    def changed(self):
+        """Notify clients about changes after delay"""
+        if not self._changes_timer.isActive():
+            self._changes_timer.start()
+
+    def _local_changed(self):
+        """Notify clients and push local changes shortly"""
+        self.changed()
+        self.app.sync_thread.request_push()
+
+    @Slot()
+    def _emit_changes(self):
+        since = self._changes_token
+        token, complete, items = changes.feed.since(since)
+        if not complete:
+            # log overflowed, clients should reload everything
+            items = [
+                btype.Change(
+                    entity=entity, operation=const.CHANGE_RELOAD, ids=[],
+                ) for entity in const.CHANGE_ENTITIES
+            ]
+        self._changes_token = token
+        if items:
+            self.changes_available(since, token, btype.Change.list >> items)
+        self.data_changed()
 
     @property
     def session(self):
@@ -122,23 +161,28 @@ class ProviderService(dbus.service.Object):
 
 
     #*** dbus get note by note id
+    @timed('service')
     @dbus.service.method(
         "com.everpad.Provider", in_signature='i',
         out_signature=btype.Note.signature,
     )
     def get_note(self, id):
-        """Get note by id"""
+        """Get note by id, content of note stored by metadata
+        is pulled before others and sent with changes"""
         try:
             note = self.session.query(models.Note).filter(
                 (models.Note.id == id)
                 & (models.Note.action != const.ACTION_DELETE)
             ).one()
 
+            if note.content_pending:
+                self.app.sync_thread.request_note_content(note.id)
             return btype.Note >> note
         except NoResultFound:
             raise DBusException('models.Note not found')
 
     #*** dbus get note by note guid
+    @timed('service')
     @dbus.service.method(
         "com.everpad.Provider", in_signature='s',
         out_signature=btype.Note.signature,
@@ -156,6 +200,7 @@ class ProviderService(dbus.service.Object):
             raise DBusException('Note not found')
 
     #*** dbus get note conflict
+    @timed('service')
     @dbus.service.method(
         "com.everpad.Provider", in_signature='i',
         out_signature='a{}'.format(btype.Note.signature),
@@ -168,6 +213,7 @@ class ProviderService(dbus.service.Object):
         return btype.Note.list >> notes
 
     #*** dbus find note
+    @timed('service')
     @dbus.service.method(
         "com.everpad.Provider", in_signature='saiaiiiii',
         out_signature='a{}'.format(btype.Note.signature),
@@ -178,32 +224,106 @@ class ProviderService(dbus.service.Object):
         pinnded=const.NOT_PINNDED,
     ):
         """Find notes by filters"""
-        notes = btype.Note.list >> NoteFilterer(self.session)\
-            .by_words(words)\
-            .by_notebooks(notebooks)\
-            .by_tags(tags)\
-            .by_place(place)\
-            .by_pinnded(pinnded)\
-            .order_by(order)\
-            .all()\
-            .limit(limit)
+        return self._query_cache.get(
+            cache_key(
+                'find_notes', words, notebooks, tags,
+                place, limit, order, pinnded,
+            ),
+            (
+                const.CHANGE_NOTE, const.CHANGE_NOTEBOOK,
+                const.CHANGE_TAG, const.CHANGE_PLACE,
+            ),
+            lambda: btype.Note.list >> NoteFilterer(self.session)\
+                .by_words(words)\
+                .by_notebooks(notebooks)\
+                .by_tags(tags)\
+                .by_place(place)\
+                .by_pinnded(pinnded)\
+                .order_by(order)\
+                .all()\
+                .limit(limit),
+        )
 
-        return notes
+    #*** dbus
+    @timed('service')
+    @dbus.service.method(
+        "com.everpad.Provider", in_signature='',
+        out_signature=btype.Menu.signature,
+    )
+    def get_menu(self):
+        """Get everything indicator menu shows with one call"""
+        menu = btype.Menu(
+            version=const.API_VERSION,
+            authenticated=self.is_authenticated(),
+            first_synced=self.is_first_synced(),
+            status=self.get_status(),
+            last_sync=self.get_last_sync(),
+            sort_by_notebook=bool(int(
+                self.app.settings.value('sort-by-notebook') or 0
+            )),
+            pin_notes=[],
+            notes=[],
+            notebooks=[],
+        )
+        if not menu.authenticated:
+            return menu.struct
+
+        menu.pin_notes = map(tuple, self._menu_notes_query(True).order_by(
+            models.Note.updated.desc(),
+        ).limit(const.MENU_NOTES_LIMIT))
+        limit = const.MENU_NOTES_LIMIT - len(menu.pin_notes)
+
+        if not menu.sort_by_notebook:
+            menu.notes = map(tuple, self._menu_notes_query(False).order_by(
+                models.Note.updated.desc(),
+            ).limit(limit))
+        else:
+            # notebooks are few, top notes of each taken by limit
+            menu.notebooks = [
+                (notebook_id, name, map(
+                    tuple, self._menu_notes_query(False).filter(
+                        models.Note.notebook_id == notebook_id,
+                    ).order_by(
+                        models.Note.updated.desc(), models.Note.id.desc(),
+                    ).limit(limit),
+                ))
+                for notebook_id, name in self.session.query(
+                    models.Notebook.id, models.Notebook.name,
+                ).filter(
+                    models.Notebook.action != const.ACTION_DELETE,
+                ).order_by(models.Notebook.name)
+            ]
+
+        return menu.struct
+
+    def _menu_notes_query(self, pinnded):
+        """Query of id and title for menu notes"""
+        return self.session.query(
+            models.Note.id, models.Note.title,
+        ).filter(
+            (models.Note.pinnded == pinnded)
+            & ~models.Note.action.in_(const.DISABLED_ACTIONS)
+        )
 
     #*** dbus
+    @timed('service')
     @dbus.service.method(
         "com.everpad.Provider", in_signature='',
         out_signature='a{}'.format(btype.Notebook.signature),
     )
     def list_notebooks(self):
         """List available notebooks"""
-        notebooks = self.session.query(models.Notebook).filter(
-            models.Notebook.action != const.ACTION_DELETE,
-        ).order_by(models.Notebook.name)
-
-        return btype.Notebook.list >> notebooks
+        return self._query_cache.get(
+            cache_key('list_notebooks'), (const.CHANGE_NOTEBOOK,),
+            lambda: btype.Notebook.list >> self.session.query(
+                models.Notebook,
+            ).filter(
+                models.Notebook.action != const.ACTION_DELETE,
+            ).order_by(models.Notebook.name),
+        )
 
     #*** dbus
+    @timed('service')
     @dbus.service.method(
         "com.everpad.Provider", in_signature='i',
         out_signature=btype.Notebook.signature,
@@ -221,18 +341,24 @@ class ProviderService(dbus.service.Object):
             raise DBusException('Notebook does not exist')
 
     #*** dbus
+    @timed('service')
     @dbus.service.method(
         "com.everpad.Provider", in_signature='i',
         out_signature='i',
     )
     def get_notebook_notes_count(self, id):
         """Get count of notes in notebook"""
-        return self.session.query(models.Note).filter(
-            (models.Note.notebook_id == id)
-            & ~models.Note.action.in_(const.DISABLED_ACTIONS)
-        ).count()
+        return self._query_cache.get(
+            cache_key('get_notebook_notes_count', id),
+            (const.CHANGE_NOTE, const.CHANGE_NOTEBOOK),
+            lambda: self.session.query(models.Note).filter(
+                (models.Note.notebook_id == id)
+                & ~models.Note.action.in_(const.DISABLED_ACTIONS)
+            ).count(),
+        )
 
     #*** dbus
+    @timed('service')
     @dbus.service.method(
         "com.everpad.Provider", in_signature=btype.Notebook.signature,
         out_signature=btype.Notebook.signature,
@@ -259,13 +385,47 @@ class ProviderService(dbus.service.Object):
             notebook_btype.give_to_obj(notebook)
             self.session.commit()
 
-            self.data_changed()
+            self._local_changed()
 
             return btype.Notebook >> notebook
         except NoResultFound:
             raise DBusException('Notebook does not exist')
 
+    #*** dbus keep resources data of notebook in cache
+    @timed('service')
+    @dbus.service.method(
+        "com.everpad.Provider", in_signature='ib',
+        out_signature='',
+    )
+    def set_notebook_offline(self, id, offline):
+        """Pin notebook resources data, pulled on next sync"""
+        try:
+            notebook = self.session.query(models.Notebook).filter(
+                models.Notebook.id == id,
+            ).one()
+        except NoResultFound:
+            raise DBusException('Notebook does not exist')
+
+        notebook.offline = bool(offline)
+        self.session.commit()
+        if offline:
+            self.app.sync_thread.sync()
+
+    #*** dbus
+    @timed('service')
+    @dbus.service.method(
+        "com.everpad.Provider", in_signature='',
+        out_signature='ai',
+    )
+    def get_offline_notebooks(self):
+        """Get ids of notebooks with pinned resources"""
+        return [id for id, in self.session.query(models.Notebook.id).filter(
+            (models.Notebook.offline == True)
+            & (models.Notebook.action != const.ACTION_DELETE)
+        )]
+
     #*** dbus
+    @timed('service')
     @dbus.service.method(
         "com.everpad.Provider", in_signature='i',
         out_signature='b',
@@ -278,37 +438,45 @@ class ProviderService(dbus.service.Object):
             ).one()
             notebook.action = const.ACTION_DELETE
             self.session.commit()
-            self.data_changed()
+            self._local_changed()
             return True
         except NoResultFound:
             raise DBusException('Notebook does not exist')
 
     #*** dbus
+    @timed('service')
     @dbus.service.method(
         "com.everpad.Provider", in_signature='',
         out_signature='a{}'.format(btype.Tag.signature),
     )
     def list_tags(self):
         """List all tags"""
-        tags = self.session.query(models.Tag).filter(
-            models.Tag.action != const.ACTION_DELETE,
-        ).order_by(models.Tag.name)
-
-        return btype.Tag.list >> tags
+        return self._query_cache.get(
+            cache_key('list_tags'), (const.CHANGE_TAG,),
+            lambda: btype.Tag.list >> self.session.query(models.Tag).filter(
+                models.Tag.action != const.ACTION_DELETE,
+            ).order_by(models.Tag.name),
+        )
 
     #*** dbus
+    @timed('service')
     @dbus.service.method(
         "com.everpad.Provider", in_signature='i',
         out_signature='i',
     )
     def get_tag_notes_count(self, id):
         """Get count of notes with tag"""
-        return self.session.query(models.Note).filter(
-            models.Note.tags.any(models.Tag.id == id)
-            & ~models.Note.action.in_(const.DISABLED_ACTIONS)
-        ).count()
+        return self._query_cache.get(
+            cache_key('get_tag_notes_count', id),
+            (const.CHANGE_NOTE, const.CHANGE_TAG),
+            lambda: self.session.query(models.Note).filter(
+                models.Note.tags.any(models.Tag.id == id)
+                & ~models.Note.action.in_(const.DISABLED_ACTIONS)
+            ).count(),
+        )
 
     #*** dbus
+    @timed('service')
     @dbus.service.method(
         "com.everpad.Provider", in_signature='i',
         out_signature='b',
@@ -322,19 +490,18 @@ class ProviderService(dbus.service.Object):
             ).one()
 
             tag.action = const.ACTION_DELETE
-
-            for note in self.session.query(models.Note).filter(
-                models.Note.tags.contains(tag),
-            ).all():
-                note.tags.remove(tag)
+            self.session.execute(models.notetags_table.delete().where(
+                models.notetags_table.c.tag == tag.id,
+            ))
 
             self.session.commit()
-            self.data_changed()
+            self._local_changed()
             return True
         except NoResultFound:
             raise DBusException('Tag does not exist')
 
     #*** dbus
+    @timed('service')
     @dbus.service.method(
         "com.everpad.Provider", in_signature=btype.Tag.signature,
         out_signature=btype.Tag.signature,
@@ -359,13 +526,14 @@ class ProviderService(dbus.service.Object):
             tag.action = const.ACTION_CHANGE
             tag_btype.give_to_obj(tag)
             self.session.commit()
-            self.data_changed()
+            self._local_changed()
 
             return btype.Tag >> tag
         except NoResultFound:
             raise DBusException('Tag does not exist')
     
     #*** dbus
+    @timed('service')
     @dbus.service.method(
         "com.everpad.Provider",
         in_signature=btype.Note.signature,
@@ -385,11 +553,12 @@ class ProviderService(dbus.service.Object):
 
         self.session.add(note)
         self.session.commit()
-        self.data_changed()
+        self._local_changed()
 
         return btype.Note >> note
         
     #*** dbus
+    @timed('service')
     @dbus.service.method(
         "com.everpad.Provider",
         in_signature=btype.Note.signature,
@@ -416,11 +585,12 @@ class ProviderService(dbus.service.Object):
 
         note.updated_local = int(time.time() * 1000)
         self.session.commit()
-        self.data_changed()
+        self._local_changed()
 
         return btype.Note >> note
 
     #*** dbus
+    @timed('service')
     @dbus.service.method(
         "com.everpad.Provider", in_signature='i',
         out_signature='a{}'.format(btype.Resource.signature),
@@ -434,7 +604,32 @@ class ProviderService(dbus.service.Object):
 
         return btype.Resource.list >> resources
 
+    #*** dbus fetch resource data, pulled when missing
+    @timed('service')
+    @dbus.service.method(
+        "com.everpad.Provider", in_signature='i',
+        out_signature='b',
+    )
+    def fetch_resource(self, id):
+        """Check resource data ready, missing data is pulled
+        and resource update sent with changes"""
+        try:
+            resource = self.session.query(models.Resource).filter(
+                (models.Resource.id == id)
+                & (models.Resource.action != const.ACTION_DELETE)
+            ).one()
+        except NoResultFound:
+            raise DBusException('Resource not found')
+
+        if not resources.is_touched(resource):
+            resources.touch(self.session, [resource.id])
+        if os.path.exists(resource.file_path):
+            return True
+        self.app.sync_thread.request_resource(resource.id)
+        return False
+
     #*** dbus
+    @timed('service')
     @dbus.service.method(
         "com.everpad.Provider",
         in_signature='ia{}'.format(btype.Resource.signature),
@@ -466,10 +661,11 @@ class ProviderService(dbus.service.Object):
             note.action = const.ACTION_CHANGE
 
         self.session.commit()
-        self.data_changed()
+        self._local_changed()
         return btype.Note >> note
 
     #*** dbus
+    @timed('service')
     @dbus.service.method(
         "com.everpad.Provider",
         in_signature='i', out_signature='b',
@@ -491,12 +687,160 @@ class ProviderService(dbus.service.Object):
                 note.action = const.ACTION_DELETE
 
             self.session.commit()
-            self.data_changed()
+            self._local_changed()
             return True
         except NoResultFound:
             raise DBusException('models.Note not found')
 
+    def _bulk_notes_query(self, note_ids):
+        return self.session.query(models.Note).filter(
+            models.Note.id.in_(note_ids)
+            & ~models.Note.action.in_(const.DISABLED_ACTIONS)
+        )
+
+    def _bulk_notes_changed(self, note_ids, values=None):
+        """Update notes with one statement and mark them for push"""
+        values = dict(values or {})
+        values[models.Note.action] = case(
+            [(models.Note.action == const.ACTION_CREATE, const.ACTION_CREATE)],
+            else_=const.ACTION_CHANGE,
+        )
+        values[models.Note.updated_local] = int(time.time() * 1000)
+        return self._bulk_notes_query(note_ids).update(
+            values, synchronize_session=False,
+        )
+
     #*** dbus
+    @timed('service')
+    @dbus.service.method(
+        "com.everpad.Provider", in_signature='aii',
+        out_signature='i',
+    )
+    def move_notes(self, note_ids, notebook_id):
+        """Move notes to notebook, returns count of moved notes"""
+        if not note_ids:
+            return 0
+        if not self.session.query(models.Notebook).filter(
+            (models.Notebook.id == notebook_id)
+            & (models.Notebook.action != const.ACTION_DELETE)
+        ).count():
+            raise DBusException('Notebook does not exist')
+        count = self._bulk_notes_changed(note_ids, {
+            models.Note.notebook_id: notebook_id,
+        })
+        self.session.commit()
+        self._local_changed()
+        return count
+
+    #*** dbus
+    @timed('service')
+    @dbus.service.method(
+        "com.everpad.Provider", in_signature='aii',
+        out_signature='i',
+    )
+    def tag_notes(self, note_ids, tag_id):
+        """Add tag to notes, returns count of tagged notes"""
+        if not note_ids:
+            return 0
+        if not self.session.query(models.Tag).filter(
+            (models.Tag.id == tag_id)
+            & (models.Tag.action != const.ACTION_DELETE)
+        ).count():
+            raise DBusException('Tag does not exist')
+        untagged_ids = [note_id for note_id, in self._bulk_notes_query(
+            note_ids,
+        ).filter(
+            ~models.Note.tags.any(models.Tag.id == tag_id),
+        ).values(models.Note.id)]
+        if untagged_ids:
+            self.session.execute(models.notetags_table.insert(), [
+                {'note': note_id, 'tag': tag_id} for note_id in untagged_ids
+            ])
+            self._bulk_notes_changed(untagged_ids)
+        self.session.commit()
+        self._local_changed()
+        return len(untagged_ids)
+
+    #*** dbus
+    @timed('service')
+    @dbus.service.method(
+        "com.everpad.Provider", in_signature='aii',
+        out_signature='i',
+    )
+    def untag_notes(self, note_ids, tag_id):
+        """Remove tag from notes, returns count of untagged notes"""
+        if not note_ids:
+            return 0
+        tagged_ids = [note_id for note_id, in self._bulk_notes_query(
+            note_ids,
+        ).filter(
+            models.Note.tags.any(models.Tag.id == tag_id),
+        ).values(models.Note.id)]
+        if tagged_ids:
+            self.session.execute(models.notetags_table.delete().where(
+                (models.notetags_table.c.tag == tag_id)
+                & models.notetags_table.c.note.in_(tagged_ids)
+            ))
+            self._bulk_notes_changed(tagged_ids)
+        self.session.commit()
+        self._local_changed()
+        return len(tagged_ids)
+
+    #*** dbus
+    @timed('service')
+    @dbus.service.method(
+        "com.everpad.Provider", in_signature='ai',
+        out_signature='i',
+    )
+    def delete_notes(self, note_ids):
+        """Delete notes, returns count of deleted notes"""
+        if not note_ids:
+            return 0
+        # conflicts exists only locally and removed at once
+        conflicts = self.session.query(models.Note.id).filter(
+            models.Note.id.in_(note_ids)
+            & (models.Note.action == const.ACTION_CONFLICT)
+        )
+        conflict_ids = [note_id for note_id, in conflicts]
+        if conflict_ids:
+            self.session.execute(models.notetags_table.delete().where(
+                models.notetags_table.c.note.in_(conflict_ids),
+            ))
+            conflicts.delete(synchronize_session=False)
+        count = self._bulk_notes_query(note_ids).update({
+            models.Note.action: const.ACTION_DELETE,
+        }, synchronize_session=False)
+        self.session.commit()
+        self._local_changed()
+        return count + len(conflict_ids)
+
+    #*** dbus
+    @timed('service')
+    @dbus.service.method(
+        "com.everpad.Provider", in_signature='ss',
+        out_signature='i',
+    )
+    def rename_stack(self, stack, new_stack):
+        """Rename stack or remove it with empty name"""
+        count = self.session.query(models.Notebook).filter(
+            (models.Notebook.stack == stack)
+            & (models.Notebook.action != const.ACTION_DELETE)
+        ).update({
+            models.Notebook.stack: new_stack,
+            models.Notebook.action: case(
+                [(
+                    models.Notebook.action == const.ACTION_CREATE,
+                    const.ACTION_CREATE,
+                )],
+                else_=const.ACTION_CHANGE,
+            ),
+        }, synchronize_session=False)
+        self.session.commit()
+        self._local_changed()
+        return count
+
+    #*** dbus
+    @timed('service')
     @dbus.service.method(
         "com.everpad.Provider",
         in_signature='ss',
@@ -517,7 +861,7 @@ class ProviderService(dbus.service.Object):
         )
         self.session.add(notebook)
         self.session.commit()
-        self.data_changed()
+        self._local_changed()
         return btype.Notebook >> notebook
 
     #************************************************
@@ -535,7 +879,8 @@ class ProviderService(dbus.service.Object):
         #if self.app.sync_thread.status != const.STATUS_SYNC:
         #    self.app.sync_thread.force_sync()
         change_auth_token( )
-        self.data_changed()
+        user_cache.invalidate()
+        self.changed()
 
     #************************************************
     #   remove_authenticate
@@ -548,7 +893,8 @@ class ProviderService(dbus.service.Object):
     def remove_authentication(self):
         """Remove authentication"""
         self.qobject.remove_authenticate_signal.emit()
-        self.data_changed()
+        user_cache.invalidate()
+        self.changed()
 
     #************************************************
     #   is_authenticated
@@ -563,16 +909,34 @@ class ProviderService(dbus.service.Object):
         return bool(get_auth_token())
 
     #*** dbus
+    @timed('service')
     @dbus.service.method(
         "com.everpad.Provider",
         in_signature='', out_signature='a%s' % btype.Place.signature,
     )
     def list_places(self):
         """List places"""
-        places = self.session.query(models.Place).all()
-        return btype.Place.list >> places
+        return self._query_cache.get(
+            cache_key('list_places'), (const.CHANGE_PLACE,),
+            lambda: btype.Place.list >> self.session.query(
+                models.Place,
+            ).all(),
+        )
+
+    #*** dbus
+    @dbus.service.method(
+        "com.everpad.Provider",
+        in_signature='', out_signature='iii',
+    )
+    def get_query_cache_stats(self):
+        """Get query cache hits, misses and size"""
+        return (
+            self._query_cache.hits, self._query_cache.misses,
+            len(self._query_cache),
+        )
 
     #*** dbus
+    @timed('service')
     @dbus.service.method(
         "com.everpad.Provider",
         in_signature='i', out_signature='',
@@ -586,11 +950,12 @@ class ProviderService(dbus.service.Object):
             ).one()
             note.share_status = const.SHARE_NEED_SHARE
             self.session.commit()
-            self.sync()
+            self._local_changed()
         except NoResultFound:
             raise DBusException('models.Note not found')
 
     #*** dbus
+    @timed('service')
     @dbus.service.method(
         "com.everpad.Provider",
         in_signature='i', out_signature=''
@@ -605,7 +970,7 @@ class ProviderService(dbus.service.Object):
             note.share_status = const.SHARE_NEED_STOP
             note.share_url = ''
             self.session.commit()
-            self.sync()
+            self._local_changed()
         except NoResultFound:
             raise DBusException('models.Note not found')
 
@@ -702,6 +1067,26 @@ class ProviderService(dbus.service.Object):
 #            EDAM_VERSION_MINOR
 #        )
 
+    #*** dbus
+    @dbus.service.method(
+        "com.everpad.Provider",
+        in_signature='', out_signature='a%s' % btype.Metric.signature,
+    )
+    def get_metrics(self):
+        """Get count, total and max of recorded metrics"""
+        return btype.Metric.list >> metrics.snapshot()
+
+    #*** dbus
+    @timed('service')
+    @dbus.service.method(
+        "com.everpad.Provider", in_signature='x',
+        out_signature='xba%s' % btype.Change.signature,
+    )
+    def get_changes_since(self, token):
+        """Get new token, is delta complete and changes after token"""
+        token, complete, items = changes.feed.since(token)
+        return token, complete, btype.Change.list >> items
+
     #*** dbus
     @dbus.service.method(
         "com.everpad.Provider", in_signature='s',
@@ -747,6 +1132,14 @@ class ProviderService(dbus.service.Object):
         """Emit when data changed"""
         return
 
+    #*** dbus
+    @dbus.service.signal(
+        'com.everpad.provider', signature='xxa%s' % btype.Change.signature,
+    )
+    def changes_available(self, since, token, changes):
+        """Emit changes between since and token tokens"""
+        return
+
     #*** dbus
     @dbus.service.signal(
         'com.everpad.provider', signature='ss',
@@ -1,16 +1,22 @@
+# -*- coding: utf-8 -*-
 from PySide import QtCore
 from datetime import datetime
 from ... import const
 from ...specific import AppClass
 from .. import tools
 from . import note, notebook, tag, notebooklinked, savedsearch
-from .. import models
+from .. import models, resources
+from ..metrics import metrics, sync_state_name
+from ..cache import user_cache
+from .scheduler import SyncScheduler, SyncCancelled
+import threading
 import time
 import traceback
 import socket
 
 from evernote.edam.error.ttypes import EDAMUserException, EDAMSystemException, EDAMErrorCode
-from evernote.api.client import EvernoteClient
+from evernote.api.client import EvernoteClient, StorePool
+from thrift.transport.THttpClient import THttpClient
 
 # Keep track of various sync errors, etc.
 from .base import SyncStatus
@@ -23,12 +29,11 @@ logger = logging.getLogger('gevernote-provider')
 """
     Rate Limit handling:
     1.  If provider starts in a Rate Limit period, it will be caught 
-    	at _init_network. A sleep command will execute and indicator 
-    	will display Rate Limit.  There is really nothing else to do
-    	but sleep at that point.
+    	at _init_network. The thread waits on scheduler and indicator 
+    	will display Rate Limit, stop still interrupts the wait.
 
-    2.  Early in perform( ) check sync_state.rate_limit and if true
-        then sleep until clear.
+    2.  After a rate limited job the scheduler is postponed by
+        rate limit duration and the job queued again.
 
 """
 
@@ -62,44 +67,32 @@ class SyncThread(QtCore.QThread):
         # Returns a pointer to the application's QCoreApplication (or QApplication) instance.
         self.app = AppClass.instance()
         
-        # setup timer
-        self._init_timer()
-        
-        # setup wait_condition and mutex
-        self._init_locks()
+        # queue of sync jobs, setup periodic sync
+        self.scheduler = SyncScheduler()
+        self.update_timer()
+
+        # current sync phase and when it started
+        self._phase = None
+        self._perform_started = None
+
+        # ids of opened notes waiting for content
+        self._content_requests = set()
+        self._content_lock = threading.Lock()
+        self._resource_requests = set()
 
     # **************************************************************
     # *                                                            *
-    # *  Timer routines called by __init__ during initialization   *
-    # *     _init_timer(), _init_locks(), update_timer()           *   
+    # *  Timer routine called by __init__ and set_sync_delay      *
+    # *     update_timer()                                         *   
     # *                                                            *
     # **************************************************************
-                
-    # *** Initialize Timer
-    # Initialize timer, connect to sync signal, set delay,
-    # and start timer.
-    # http://qt-project.org/doc/qt-4.8/qtimer.html
-    def _init_timer(self):
-        """Init timer"""
-        
-        # Constructs a timer
-        self.timer = QtCore.QTimer()
-        
-        # This signal is emitted when the timer times out - sync
-        self.timer.timeout.connect(self.sync)
-        
-        # call update_timer to set time and start
-        self.update_timer()
 
     # *** Update Timer
-    # Stop the timmer, Set the timer delay to user settings,
-    # default value, or nothing if manual. Finally, start the timer.
+    # Set the periodic sync delay to user settings,
+    # default value, or nothing if manual.
     def update_timer(self):
         """Update sync timer"""
         
-        # stop timer
-        self.timer.stop()
-        
         # initial value of timer from settings
         delay = int(self.app.settings.value('sync_delay') or 0)
         
@@ -110,23 +103,11 @@ class SyncThread(QtCore.QThread):
             delay = const.DEFAULT_SYNC_DELAY
 
         # if delay is not set to manual - SYNC_MANUAL = -1
-        # then start the timer - seconds
-        if delay != const.SYNC_MANUAL:
-            self.timer.start(delay)
-
-    # *** Initialize Locks
-    # PySide
-    # self.wait_condition and self.mutex
-    def _init_locks(self):
-        """Init locks"""
-        
-        # provides a condition variable for synchronizing threads
-        # http://srinikom.github.io/pyside-docs/PySide/QtCore/QWaitCondition.html
-        self.wait_condition = QtCore.QWaitCondition()
-        
-        # class provides access serialization between threads
-        # http://srinikom.github.io/pyside-docs/PySide/QtCore/QMutex.html
-        self.mutex = QtCore.QMutex()
+        # then sync periodically - delay in ms
+        if delay == const.SYNC_MANUAL:
+            self.scheduler.set_interval(None)
+        else:
+            self.scheduler.set_interval(delay / 1000.0)
 
     # **************************************************************
     # *                                                            *
@@ -200,15 +181,21 @@ class SyncThread(QtCore.QThread):
             	 # pull token from keyring
                 logger.debug("init network auth_token")
                 self.auth_token = get_auth_token( )
+                user_cache.invalidate()
                                              
                 # use EvernoteClient() to get userstore and notestore
+                self._close_network()
                 client = EvernoteClient(token=self.auth_token, sandbox=False)
                 self.user_store = client.get_user_store()
-                self.note_store = client.get_note_store()
+                # pool keeps several note requests in flight
+                self.note_store = client.get_note_store_pool(
+                    const.NOTE_STORE_POOL_SIZE, const.NOTE_STORE_TIMEOUT,
+                )
                 
                 # self.note_store = tools.get_note_store(self.auth_token)
                 # self.user_store = tools.get_user_store(self.auth_token)
 
+                self.scheduler.succeeded()
                 break
             except EDAMSystemException, e:
                 if e.errorCode == EDAMErrorCode.RATE_LIMIT_REACHED:
@@ -217,9 +204,9 @@ class SyncThread(QtCore.QThread):
                         (e.rateLimitDuration/60)
                     )
                     self.status = const.STATUS_RATE
-                    # nothing I can think of doing other than sleeping here
-                    # until the rate limit clears
-                    time.sleep(e.rateLimitDuration)
+                    # nothing I can think of doing other than waiting
+                    # here until the rate limit clears
+                    self.scheduler.wait(e.rateLimitDuration)
                     self.status = const.STATUS_NONE
             except socket.error, e:
                 logger.error(
@@ -229,8 +216,15 @@ class SyncThread(QtCore.QThread):
                 SyncStatus.connect_error_count+=1
                 logger.error(
                     "Total connect errors: %d" % SyncStatus.connect_error_count)
-                time.sleep(30)
+                self.scheduler.wait(self.scheduler.failed())
                 
+    def _close_network(self):
+        """Stop worker threads of note store pool"""
+        note_store = getattr(self, 'note_store', None)
+        if isinstance(note_store, StorePool):
+            note_store.close()
+        self.note_store = None
+
     # ***** reimplement PySide.QtCore.QThread.run() *****
     #
     # This is the main loop of the thread
@@ -245,25 +239,70 @@ class SyncThread(QtCore.QThread):
         # complete before _init_network, so I swapped the execution order to
         # _init_db, _init_sync, _init_network
         # 
+        # sql metrics are recorded per thread name
+        threading.current_thread().name = 'sync'
+        self.scheduler.restart()
         self._init_db()         # setup database
         self._init_sync()       # setup Sync table times
-        self._init_network()    # get evernote info
+        try:
+            self._init_network()    # get evernote info
+        except SyncCancelled:
+            logger.debug("Sync thread stopped while connecting.")
+        else:
+            self._run_jobs()
+        finally:
+            # workers of store pool end with the thread
+            self._close_network()
 
-        # Note: Deprecated since version 2.6: mutex module removed in Python 3.
+    def _run_jobs(self):
+        """Take jobs one by one until stopped"""
         while True:
-            self.mutex.lock()
-            self.wait_condition.wait(self.mutex)
-            
-            if get_auth_token():
-                # do sync ....
-                self.perform()
+            job = self.scheduler.next_job()
+            if job is None:
+                break
+            try:
+                self._run_job(job)
+            except SyncCancelled:
+                logger.info("Sync job cancelled.")
+                self._abort()
+            except Exception:
+                logger.exception("Sync job failed.")
+                self._abort()
+                logger.error(
+                    "Retry in %d seconds." % self.scheduler.failed())
+                self.scheduler.schedule(job.kind, full=job.full)
             else:
-                logger.error("I shouldn't even be here!")
+                if SyncStatus.rate_limit:
+                    # rest of job is done after rate limit
+                    self.scheduler.postpone(SyncStatus.rate_limit)
+                    SyncStatus.rate_limit = 0
+                    self.scheduler.schedule(job.kind, full=job.full)
+                else:
+                    self.scheduler.succeeded()
+            finally:
+                self.scheduler.done(job)
+        logger.debug("Sync thread stopped.")
+
+    def _run_job(self, job):
+        """Run sync job in sync thread"""
+        logger.debug("Running %r" % job)
+        if not get_auth_token():
+            logger.error("I shouldn't even be here!")
+        elif job.kind == const.SYNC_JOB_PUSH:
+            self.push()
+        elif job.kind == const.SYNC_JOB_FETCH:
+            self.fetch()
+        else:
+            if job.full:
+                self.sync_state.need_full_sync = 1
+            self.perform()
 
-            self.mutex.unlock()
-            
-            # sleep 1 second
-            time.sleep(1)  # prevent cpu eating
+    def _abort(self):
+        """Rollback interrupted job"""
+        self.session.rollback()
+        self.status = const.STATUS_NONE
+        self._enter_phase(const.SYNC_STATE_FINISH)
+        self.data_changed.emit()
             
     # ********** end main running loop **************
 
@@ -274,19 +313,11 @@ class SyncThread(QtCore.QThread):
         
         logger.debug("Execute perform( )")
 
-        # A good place to check and wait if rate limited
-        if SyncStatus.rate_limit:
-            logger.error("RateLimit early perform( ) - sleeping")
-            self.status = const.STATUS_RATE
-            time.sleep(SyncStatus.rate_limit)
-            # clear rate limit
-            SyncStatus.rate_limit = 0
-
         # set status to sync
         self.status = const.STATUS_SYNC
         
         # Tell the world we are start sync
-        self.sync_state_changed.emit(const.SYNC_STATE_START)
+        self._enter_phase(const.SYNC_STATE_START)
 
         # update server sync info
         self._get_sync_state( )
@@ -329,6 +360,11 @@ class SyncThread(QtCore.QThread):
             logger.debug("Agent: running local.")
             # If not rate limit then do local changes            
             self.local_changes( )
+
+        # Content of notes stored by metadata and resources data are
+        # pulled by fetch jobs, pushes and stop run between batches
+        if not SyncStatus.rate_limit:
+            self.scheduler.schedule(const.SYNC_JOB_FETCH)
             
         # If Rate Limit in either remote or local, tell us
         # cleanup and get out        
@@ -338,9 +374,16 @@ class SyncThread(QtCore.QThread):
             self._init_db()
             self.data_changed.emit()
             self.status = const.STATUS_RATE
-            self.sync_state_changed.emit(const.SYNC_STATE_FINISH) 
+            self._enter_phase(const.SYNC_STATE_FINISH)
         else:
             logger.info("Sync performed.")	
+            if THttpClient.total_compressed:
+                logger.info(
+                    "Compressed responses: %d bytes, inflated %d bytes" % (
+                        THttpClient.total_compressed,
+                        THttpClient.total_inflated,
+                    )
+                )
 
             # if we get a good finish - update the count to match server
             self.sync_state.update_count = self.sync_state.srv_update_count
@@ -351,7 +394,7 @@ class SyncThread(QtCore.QThread):
             # tell everyone we are done
             self.data_changed.emit()
             self.status = const.STATUS_NONE
-            self.sync_state_changed.emit(const.SYNC_STATE_FINISH)
+            self._enter_phase(const.SYNC_STATE_FINISH)
             
             logger.debug("Agent: Sync signals complete.")
 
@@ -378,9 +421,9 @@ class SyncThread(QtCore.QThread):
                         (e.rateLimitDuration/60)
                     )
                     self.status = const.STATUS_RATE
-                    # nothing I can think of doing other than sleeping here
-                    # until the rate limit clears
-                    time.sleep(e.rateLimitDuration)
+                    # wait until the rate limit clears, stop or
+                    # cancel interrupts the wait
+                    self.scheduler.wait(e.rateLimitDuration)
                     self.status = const.STATUS_NONE        
             except socket.error, e:
                 # MKG: I want to track connect errors
@@ -390,29 +433,57 @@ class SyncThread(QtCore.QThread):
                     traceback.format_exc())
                 logger.error(
                     "Total connect errors: %d" % SyncStatus.connect_error_count)
-                # This is most likely a network failure. Return False so
-                # everpad-provider won't lock up and can try to sync up in the
-                # next run.        
+                # This is most likely a network failure. Fail the job so
+                # everpad-provider won't lock up and scheduler retries it
+                # with backoff.
+                raise
 
     # ****************** Force Sync *********************
     # Handles self.app.provider.sync(  )
     # This is a sync started by and external trigger so 
-    # need_full_sync will be true
+    # need_full_sync will be true, it's set by sync thread
     #
     def force_sync(self):
         """Start sync"""
         logger.debug("Force sync called")
-        self.timer.stop( )
-        self.sync_state.need_full_sync = 1
-        self.sync( )
-        self.update_timer( )
-        logger.debug("Force sync complete")
+        self.scheduler.schedule(const.SYNC_JOB_SYNC, full=True)
 
     @QtCore.Slot()
     def sync(self):
         """Do sync"""
-        logger.debug("Sync slot - wakeall")
-        self.wait_condition.wakeAll()
+        logger.debug("Sync slot - schedule")
+        self.scheduler.schedule(const.SYNC_JOB_SYNC)
+
+    def cancel(self):
+        """Drop queued jobs and interrupt running one"""
+        self.scheduler.cancel()
+
+    def stop(self):
+        """Stop thread, running job interrupted on next phase or wait"""
+        self.scheduler.stop()
+
+    # *** Sync phases
+    # Emit sync state and record duration of previous phase,
+    # START begins and FINISH ends whole perform
+    def _enter_phase(self, state):
+        """Emit sync state and record phase metrics, cancelled
+        job stops between phases"""
+        if state != const.SYNC_STATE_FINISH:
+            self.scheduler.check()
+        now = time.time()
+        if self._phase:
+            name, started = self._phase
+            metrics.record('sync.%s' % name, now - started)
+        if state == const.SYNC_STATE_START:
+            self._perform_started = now
+        if state == const.SYNC_STATE_FINISH:
+            self._phase = None
+            if self._perform_started:
+                metrics.record('sync.perform', now - self._perform_started)
+                self._perform_started = None
+        else:
+            self._phase = (sync_state_name(state), now)
+        self.sync_state_changed.emit(state)
 
     # ******** Process Remote Changes *********
     # Get all changes from server (evernote) 
@@ -423,7 +494,7 @@ class SyncThread(QtCore.QThread):
         
         # Notebooks
         logger.debug("Agent: PullNotebook.")
-        self.sync_state_changed.emit(const.SYNC_STATE_NOTEBOOKS_REMOTE)
+        self._enter_phase(const.SYNC_STATE_NOTEBOOKS_REMOTE)
         notebook.PullNotebook(*self._get_sync_args()).pull(chunk_start_after, chunk_end)
         #if not SyncStatus.rate_limit and chunk_start_after:
         #   notebook.ExpungeNotebook(*self._get_sync_args()).pull(chunk_start_after, chunk_end)
@@ -432,28 +503,35 @@ class SyncThread(QtCore.QThread):
         	
         # Tags
         logger.debug("Agent: PullTag.")
-        self.sync_state_changed.emit(const.SYNC_STATE_TAGS_REMOTE)
+        self._enter_phase(const.SYNC_STATE_TAGS_REMOTE)
         tag.PullTag(*self._get_sync_args()).pull(chunk_start_after, chunk_end)
         if SyncStatus.rate_limit:
             return
             
-        # Notes and Resources
+        # Notes and Resources, full sync stores notes by metadata
         logger.debug("Agent: PullNote.")
-        self.sync_state_changed.emit(const.SYNC_STATE_NOTES_REMOTE)
-        note.PullNote(*self._get_sync_args()).pull(chunk_start_after, chunk_end)
+        self._enter_phase(const.SYNC_STATE_NOTES_REMOTE)
+        metadata_only = self._is_metadata_first(chunk_start_after)
+        note.PullNote(
+            *self._get_sync_args(), metadata_only=metadata_only,
+            lazy_resources=resources.is_lazy(self.app.settings)
+        ).pull(chunk_start_after, chunk_end)
         if SyncStatus.rate_limit:
             return
+        if metadata_only:
+            # notes are browsable before content pulled
+            self.data_changed.emit()
             
         # Linked Notebooks
         logger.debug("Agent: PullNoteLBN.")
-        self.sync_state_changed.emit(const.SYNC_STATE_LBN_REMOTE)
+        self._enter_phase(const.SYNC_STATE_LBN_REMOTE)
         notebooklinked.PullLBN(*self._get_sync_args()).pull(chunk_start_after, chunk_end)
         if SyncStatus.rate_limit:
             return
                     
         # Searches
         logger.debug("Agent: PullSearch.")
-        self.sync_state_changed.emit(const.SYNC_STATE_SEARCHES_REMOTE)
+        self._enter_phase(const.SYNC_STATE_SEARCHES_REMOTE)
         savedsearch.PullSearch(*self._get_sync_args()).pull(chunk_start_after, chunk_end)
 
     # ******** Process Local Changes *********
@@ -465,23 +543,123 @@ class SyncThread(QtCore.QThread):
 
         # Notebooks
         logger.debug("Agent: PushNotebook.")
-        self.sync_state_changed.emit(const.SYNC_STATE_NOTEBOOKS_LOCAL)
+        self._enter_phase(const.SYNC_STATE_NOTEBOOKS_LOCAL)
         notebook.PushNotebook(*self._get_sync_args()).push()
         if SyncStatus.rate_limit:
             return
             
         # Tags
         logger.debug("Agent: PushTags.")
-        self.sync_state_changed.emit(const.SYNC_STATE_TAGS_LOCAL)
+        self._enter_phase(const.SYNC_STATE_TAGS_LOCAL)
         tag.PushTag(*self._get_sync_args()).push()
         if SyncStatus.rate_limit:
             return
             
         # Notes and Resources
         logger.debug("Agent: PushNote.")
-        self.sync_state_changed.emit(const.SYNC_STATE_NOTES_LOCAL)
+        self._enter_phase(const.SYNC_STATE_NOTES_LOCAL)
         note.PushNote(*self._get_sync_args()).push()
         
+    # ******** Pull Notes Content *********
+    # Notes stored by metadata get content in batches, notes
+    # requested with request_note_content first
+    def pull_content(self):
+        """Pull content of next batch of notes stored by metadata,
+        returns count of pulled notes"""
+        self._enter_phase(const.SYNC_STATE_NOTES_CONTENT)
+        with self._content_lock:
+            note_ids = list(self._content_requests)
+            self._content_requests.clear()
+        count = note.PullNoteContent(
+            *self._get_sync_args(),
+            lazy_resources=resources.is_lazy(self.app.settings)
+        ).pull(note_ids)
+        if count:
+            self.data_changed.emit()
+        return count
+
+    def request_note_content(self, note_id):
+        """Pull content of opened note before others"""
+        with self._content_lock:
+            self._content_requests.add(note_id)
+        self.scheduler.schedule(const.SYNC_JOB_FETCH)
+
+    # ******** Pull Resources *********
+    # In lazy mode data is pulled when opened, cache kept
+    # in its size by removing least recently accessed data
+    def pull_resources(self):
+        """Pull requested resources data and of offline notebooks"""
+        self._enter_phase(const.SYNC_STATE_RESOURCES)
+        with self._content_lock:
+            resource_ids = list(self._resource_requests)
+            self._resource_requests.clear()
+        note.PullResource(*self._get_sync_args()).pull(resource_ids)
+        if resources.is_lazy(self.app.settings):
+            resources.evict(
+                self.session, resources.get_cache_size(self.app.settings),
+            )
+
+    def request_resource(self, resource_id):
+        """Pull data of opened resource"""
+        with self._content_lock:
+            self._resource_requests.add(resource_id)
+        self.scheduler.schedule(const.SYNC_JOB_FETCH)
+
+    # ******** Jobs without remote sync *********
+    # Don't get sync state and don't walk sync chunks
+    def request_push(self):
+        """Push local changes shortly, burst of changes pushed once"""
+        delay = int(self.app.settings.value('push_delay') or const.PUSH_DELAY)
+        if delay != const.SYNC_MANUAL:
+            self.scheduler.schedule(
+                const.SYNC_JOB_PUSH, delay, debounce=True,
+            )
+
+    def push(self):
+        """Send local changes only"""
+        self.status = const.STATUS_SYNC
+        self._enter_phase(const.SYNC_STATE_START)
+        self.local_changes()
+        self._finish_job()
+
+    def fetch(self):
+        """Pull one batch of content, resources when requested or
+        all content is pulled"""
+        self.status = const.STATUS_SYNC
+        self._enter_phase(const.SYNC_STATE_START)
+        pending = self.pull_content()
+        if pending and not SyncStatus.rate_limit:
+            # next batch is queued, pushes and stop run before it
+            self.scheduler.schedule(const.SYNC_JOB_FETCH)
+        if not SyncStatus.rate_limit and (
+            not pending or self._resource_requests
+        ):
+            self.pull_resources()
+        self._finish_job()
+
+    def _finish_job(self):
+        if SyncStatus.rate_limit:
+            logger.error("Rate limit, job queued again.")
+            self.session.rollback()
+            self.status = const.STATUS_RATE
+        else:
+            self.status = const.STATUS_NONE
+        self.data_changed.emit()
+        self._enter_phase(const.SYNC_STATE_FINISH)
+
+    def _is_metadata_first(self, chunk_start_after):
+        """Only initial sync stores notes by metadata, full resync
+        keeps bodies of local notes; initial sync retried after rate
+        limit has only notes without content"""
+        if chunk_start_after or not tools.get_flag(
+            self.app.settings, 'metadata_first_sync',
+            const.METADATA_FIRST_SYNC,
+        ):
+            return False
+        return not self.session.query(models.Note.id).filter(
+            models.Note.content_pending == False,
+        ).first()
+
     # ******** Sync Args *********
     # get sync args for local_changes and remote_changes
     def _get_sync_args(self):
@@ -1,15 +1,20 @@
-from BeautifulSoup import BeautifulSoup
 from sqlalchemy.orm.exc import NoResultFound
-from everpad.tools import sanitize
-from evernote.edam.error.ttypes import EDAMUserException, EDAMSystemException, EDAMErrorCode
+from sqlalchemy import case
+from evernote.edam.error.ttypes import EDAMUserException, EDAMSystemException, EDAMNotFoundException, EDAMErrorCode
 from evernote.edam.limits import constants as limits
 from evernote.edam.type import ttypes
 from evernote.edam.notestore.ttypes import SyncChunk, SyncChunkFilter
+from evernote.api.client import StorePool
 from ... import const
-from .. import models
+from .. import models, resources
+from ..cache import user_cache
+from ..enml import html_to_enml
+from ..metrics import metrics
 from .base import BaseSync, SyncStatus
+from collections import deque
 import time
 import binascii
+import os
 
 # python built-in logging 
 import logging
@@ -27,8 +32,8 @@ class ShareNoteMixin(object):
     """Mixin with methods for sharing notes"""
 
     def _get_shard_id(self):
-        """Receive shard id, not cached because can change"""
-        return self.user_store.getUser(self.auth_token).shardId
+        """Receive shard id, cached for a while because can change"""
+        return user_cache.get_user(self.user_store, self.auth_token).shardId
 
     def _share_note(self, note, share_date=None):
         """Share or receive info about sharing"""
@@ -62,11 +67,20 @@ class PushNote(BaseSync, ShareNoteMixin):
     def push(self):
         """Push note to remote server"""
         
+        # ids and local update times of pushed notes
+        self._pushed = []
+
         # for all notes where the action is not None, Noexsist, or Conflict
+        # and not changed notes waiting for sharing
         for note in self.session.query(models.Note).filter(
             ~models.Note.action.in_((
                 const.ACTION_NONE, const.ACTION_NOEXSIST, const.ACTION_CONFLICT,
-            ))
+            )) | (
+                (models.Note.action == const.ACTION_NONE)
+                & models.Note.share_status.in_((
+                    const.SHARE_NEED_SHARE, const.SHARE_NEED_STOP,
+                ))
+            )
         ):
 
             # Push sequence:
@@ -90,9 +104,17 @@ class PushNote(BaseSync, ShareNoteMixin):
             #                     |
             #                     |- NEED_STOP - _stop_sharing_note
  
-            self.app.log('Pushing note "%s" to remote server.' % note.title)
-            
-            note_ttype = self._create_ttype(note)
+            # changed before its content pulled, pushed after
+            # PullNoteContent keeps server version as conflict
+            if note.content_pending and note.action == const.ACTION_CHANGE:
+                continue
+
+            if note.action == const.ACTION_NONE:
+                # only sharing changed
+                note_ttype = None
+            else:
+                self.app.log('Pushing note "%s" to remote server.' % note.title)
+                note_ttype = self._create_ttype(note)
             
             # create note
             if note.action == const.ACTION_CREATE:
@@ -111,8 +133,23 @@ class PushNote(BaseSync, ShareNoteMixin):
                 self._stop_sharing_note(note)
 
         # commit changes to database
+        self._mark_pushed()
         self.session.commit()
 
+    def _mark_pushed(self):
+        """Notes saved again while pushing stay changed and deleted
+        stay deleted, core update doesn't overwrite columns of newer save"""
+        notes = models.Note.__table__
+        for note_id, updated_local in self._pushed:
+            self.session.execute(notes.update().where(
+                (notes.c.id == note_id)
+                & notes.c.action.in_((const.ACTION_CREATE, const.ACTION_CHANGE))
+            ).values(action=case(
+                [(notes.c.updated_local == updated_local, const.ACTION_NONE)],
+                else_=const.ACTION_CHANGE,
+            )))
+        self._pushed = []
+
     # **************** Create Note ****************
     #
     # note is a database note data structure
@@ -141,7 +178,7 @@ class PushNote(BaseSync, ShareNoteMixin):
         return map(
             lambda resource: ttypes.Resource(
                 noteGuid=note.guid,
-                data=ttypes.Data(body=open(resource.file_path).read()),
+                data=self._prepare_data(resource),
                 mime=resource.mime,
                 attributes=ttypes.ResourceAttributes(
                     fileName=resource.file_name.encode('utf8'),
@@ -152,20 +189,22 @@ class PushNote(BaseSync, ShareNoteMixin):
             ),
         )
 
-    def _prepare_content(self, content):
-        """Prepare content"""
-        enml_content = (u"""
-            <!DOCTYPE en-note SYSTEM "http://xml.evernote.com/pub/enml2.dtd">
-            <en-note>{}</en-note>
-        """.format(sanitize(
-            html=content[:limits.EDAM_NOTE_CONTENT_LEN_MAX]
-        ))).strip().encode('utf8')
-
-        soup = BeautifulSoup(enml_content, selfClosingTags=[
-            'img', 'en-todo', 'en-media', 'br', 'hr',
-        ])
+    def _prepare_data(self, resource):
+        """Data of resource not pulled or evicted from cache is
+        referenced by hash, server keeps body of existing resource"""
+        if resource.guid and not os.path.exists(resource.file_path):
+            return ttypes.Data(bodyHash=binascii.a2b_hex(resource.hash))
+        return ttypes.Data(body=open(resource.file_path).read())
 
-        return str(soup)
+    def _prepare_content(self, content):
+        """Prepare content, html converted to ENML in one pass"""
+        enml_content, converter = html_to_enml(content)
+        metrics.record('push.content_size', converter.size)
+        if converter.truncated:
+            logger.warning(
+                'Note content truncated to %d bytes' % converter.size,
+            )
+        return enml_content
 
     # **************** Push Note ****************
     # Uses API call
@@ -176,7 +215,7 @@ class PushNote(BaseSync, ShareNoteMixin):
         try:
             note_ttype = self.note_store.createNote(self.auth_token, note_ttype)
             note.guid = note_ttype.guid
-            note.action = const.ACTION_NON
+            self._pushed.append((note.id, note.updated_local))
         except EDAMSystemException, e:
             if e.errorCode == EDAMErrorCode.RATE_LIMIT_REACHED:
             	self.app.log("Rate limit _push_changed_note: %d seconds" % e.rateLimitDuration)
@@ -212,7 +251,7 @@ class PushNote(BaseSync, ShareNoteMixin):
             self.app.log(note)
             self.app.log(e)
         finally:
-            note.action = const.ACTION_NONE
+            self._pushed.append((note.id, note.updated_local))
 
     # **************** Delete Note ****************
     # Uses API call
@@ -242,10 +281,18 @@ class PullNote(BaseSync, ShareNoteMixin):
     # Args:
     #    self.auth_token, self.session, 
     #    self.note_store, self.user_store
+    #    metadata_only - store notes by sync chunk metadata, content
+    #    and resources data are pulled later by PullNoteContent
+    #    lazy_resources - pull resources data only of offline notebooks,
+    #    other data pulled when opened by PullResource
     #
     def __init__(self, *args, **kwargs):
+        self.metadata_only = kwargs.pop('metadata_only', False)
+        self.lazy_resources = kwargs.pop('lazy_resources', False)
         super(PullNote, self).__init__(*args, **kwargs)
         self._exists = []
+        self._prefetch_guids = deque()
+        self._full_notes = {}
 
     # chunk_start_after - from agent.py <remote_changes>
     #    Low USN, Start sync after this USN - 0 == Full sync
@@ -381,6 +428,8 @@ class PullNote(BaseSync, ShareNoteMixin):
                     SyncStatus.rate_limit = e.rateLimitDuration
                     break
             
+            self._prefetch_full_notes(sync_chunk.notes)
+
             # https://www.jeffknupp.com/blog/2013/04/07/
             #       improve-your-python-yield-and-generators-explained/
             # https://wiki.python.org/moin/Generators
@@ -405,6 +454,43 @@ class PullNote(BaseSync, ShareNoteMixin):
             # getFilteredSyncChunk again - got it?
             chunk_start_after = sync_chunk.chunkHighUSN
 
+    # **************** Prefetch Full Notes ****************
+    #
+    # With StorePool note store getNote for notes which will be
+    # created or updated are requested ahead, at most
+    # NOTE_PREFETCH_WINDOW at once, _get_full_note takes results
+    #
+    def _prefetch_full_notes(self, notes_meta_ttype):
+        """Queue full notes of chunk for prefetch"""
+        if (
+            not isinstance(self.note_store, StorePool)
+            or not notes_meta_ttype or self.metadata_only
+        ):
+            return
+
+        guids = [note.guid for note in notes_meta_ttype if note.guid]
+        local_updated = dict(self.session.query(
+            models.Note.guid, models.Note.updated,
+        ).filter(models.Note.guid.in_(guids)))
+        for note_meta_ttype in notes_meta_ttype:
+            guid = note_meta_ttype.guid
+            if guid and (
+                guid not in local_updated
+                or local_updated[guid] < note_meta_ttype.updated
+            ):
+                self._prefetch_guids.append(guid)
+        self._prefetch_next()
+
+    def _prefetch_next(self):
+        while (
+            self._prefetch_guids
+            and len(self._full_notes) < const.NOTE_PREFETCH_WINDOW
+        ):
+            guid = self._prefetch_guids.popleft()
+            self._full_notes[guid] = self.note_store.submit(
+                'getNote', self.auth_token, guid, True, True, True, True,
+            )
+
     # **************** Update Note****************
     #
     # note_meta_ttype is a getFilteredSyncChunk -> SyncChunk.notes 
@@ -431,8 +517,12 @@ class PullNote(BaseSync, ShareNoteMixin):
         	
             logger.debug("Note: Update note.")
             
-            # I have to get the full note
-            note_full_ttype = self._get_full_note(note_meta_ttype)
+            # I have to get the full note, conflict note needs
+            # content even when only metadata pulled
+            if note.action == const.ACTION_CHANGE or not self.metadata_only:
+                note_full_ttype = self._get_full_note(note_meta_ttype)
+            else:
+                note_full_ttype = note_meta_ttype
             
             # EEE Catch Rate Limit and get out of _update_note
             if SyncStatus.rate_limit:
@@ -448,6 +538,8 @@ class PullNote(BaseSync, ShareNoteMixin):
             else:
                 # else update database with new sever note
                 note.from_api(note_full_ttype, self.session)
+                if self.metadata_only:
+                    note.content_pending = True
 
         else:
             logger.debug("Note: No update required.")        
@@ -498,7 +590,10 @@ class PullNote(BaseSync, ShareNoteMixin):
         
         # returns Types.Note with Note content, binary contents 
         # of the resources and their recognition data will be omitted
-        note_full_ttype = self._get_full_note(note_meta_ttype)
+        if self.metadata_only:
+            note_full_ttype = note_meta_ttype
+        else:
+            note_full_ttype = self._get_full_note(note_meta_ttype)
         
         # Note at this point:  
         #    note_meta_ttype - data return from getFilteredSyncChunk
@@ -515,6 +610,7 @@ class PullNote(BaseSync, ShareNoteMixin):
         note = models.Note(guid=note_full_ttype.guid)
         #    ... add other note information
         note.from_api(note_full_ttype, self.session)
+        note.content_pending = self.metadata_only
         
         # ... commit note data
         self.session.add(note)
@@ -568,7 +664,16 @@ class PullNote(BaseSync, ShareNoteMixin):
                 const.SHARE_NEED_SHARE, const.SHARE_NEED_STOP,
             )
         ):
-            self._share_note(note, note_ttype.attributes.shareDate)
+            self._receive_sharing(note, note_ttype.attributes.shareDate)
+
+    def _receive_sharing(self, note, share_date):
+        """Take sharing from metadata without sharing note again,
+        url of note shared elsewhere is received when share dialog
+        opened by share_note"""
+        if note.share_status != const.SHARE_SHARED:
+            note.share_url = None
+        note.share_status = const.SHARE_SHARED
+        note.share_date = share_date
             
     # **************** Receive Resource ****************
     #
@@ -599,12 +704,16 @@ class PullNote(BaseSync, ShareNoteMixin):
 
                 # If the resource exists local has it changed (hash does not match)?
                 # If no then re-get resource
-                if resource.hash != binascii.b2a_hex(
+                # Data of notes stored by metadata could be not pulled
+                # yet, then file is missing
+                changed = resource.hash != binascii.b2a_hex(
                     resource_ttype.data.bodyHash,
-                ):
-                    resource.from_api(resource_ttype)
+                )
+                if changed or not os.path.exists(resource.file_path):
+                    if changed:
+                        resource.from_api(resource_ttype)
                     
-                    self._get_resource_data(resource)
+                    self._get_resource_data(resource, note)
 
                     # EEE Get Rate Limit then break
                     if SyncStatus.rate_limit:
@@ -621,7 +730,7 @@ class PullNote(BaseSync, ShareNoteMixin):
                 )
                 resource.from_api(resource_ttype)
                 
-                self._get_resource_data(resource)
+                self._get_resource_data(resource, note)
                 
                 # EEE Get Rate Limit then break
                 if SyncStatus.rate_limit:
@@ -657,6 +766,11 @@ class PullNote(BaseSync, ShareNoteMixin):
         # resource in the note, but the binary contents of the resources 
         # and their recognition data will be omitted
         try:
+            future = self._full_notes.pop(note_ttype.guid, None)
+            if future:
+                self._prefetch_next()
+                return future.result()
+
             note_full_ttype = self.note_store.getNote(
                 self.auth_token, note_ttype.guid,
                 True, True, True, True,
@@ -670,6 +784,7 @@ class PullNote(BaseSync, ShareNoteMixin):
                         (e.rateLimitDuration/60)
                 )
                 SyncStatus.rate_limit = e.rateLimitDuration
+                self._prefetch_guids.clear()
                 
                 return None
 
@@ -677,16 +792,34 @@ class PullNote(BaseSync, ShareNoteMixin):
     #
     # Get the note data from API and return it
     # Could get Rate Limit calling getResourceData
-    def _get_resource_data(self, resource):
+    def _get_resource_data(self, resource, note=None):
         """Get resource data"""
         
+        # data of note stored by metadata pulled with its content,
+        # in lazy mode data pulled when opened, outdated file is
+        # removed to be pulled again
+        if note is not None and (note.content_pending or (
+            self.lazy_resources and not resources.is_pinned(note)
+        )):
+            if os.path.exists(resource.file_path):
+                os.remove(resource.file_path)
+            return
+
         # string getResourceData(
         #         string authenticationToken,
         #         Types.Guid guid)
+        # body goes from response to file without being kept in memory,
+        # partial file is removed when request fails
+        part_path = resource.file_path + '.part'
         try:
-            data_body = self.note_store.getResourceData(
-                self.auth_token, resource.guid)
+            with open(part_path, 'wb') as data:
+                self.note_store.getResourceDataTo(
+                    self.auth_token, resource.guid, data,
+                )
         except EDAMSystemException, e:
+            # open itself can fail, its error is kept
+            if os.path.exists(part_path):
+                os.remove(part_path)
             if e.errorCode == EDAMErrorCode.RATE_LIMIT_REACHED:
                 self.app.log(
                     "Rate limit _get_resource_data: %d minutes" % 
@@ -694,7 +827,149 @@ class PullNote(BaseSync, ShareNoteMixin):
                 )
                 SyncStatus.rate_limit = e.rateLimitDuration
                 return
+            raise
+        except Exception:
+            if os.path.exists(part_path):
+                os.remove(part_path)
+            raise
+
+        os.rename(part_path, resource.file_path)
+
+
+# *************************************************
+# ****************  Pull Content   ****************
+# *************************************************
+#
+# Notes stored by sync chunk metadata are browsable right away,
+# content and resources data are pulled here in batches after
+# sync, notes opened by user first.
+#
+class PullNoteContent(PullNote):
+    """Pull content of notes stored by metadata"""
+
+    def pull(self, note_ids=(), limit=const.NOTE_CONTENT_BATCH):
+        """Pull content of requested and next pending notes,
+        returns count of pulled notes"""
+        notes = self._get_pending_notes(note_ids, limit)
+        contents = self._request_contents(notes)
+        for note in notes:
+            self.app.log('Pulling content of note "%s".' % note.title)
+            try:
+                self._pull_content(note, contents.pop(note.guid, None))
+            except EDAMNotFoundException:
+                # removed on server, note removed on next sync
+                note.content_pending = False
+            
+            # EEE Rate limit, content pulled on next sync
+            if SyncStatus.rate_limit:
+                break
+            
+            self.session.commit()
+        return len(notes)
+
+    def _get_pending_notes(self, note_ids, limit):
+        query = self.session.query(models.Note).filter(
+            (models.Note.content_pending == True)
+            & (models.Note.action != const.ACTION_DELETE)
+        )
+        requested = query.filter(
+            models.Note.id.in_(note_ids),
+        ).all() if note_ids else []
+        return requested + query.filter(
+            ~models.Note.id.in_([note.id for note in requested] or [0]),
+        ).order_by(models.Note.updated.desc()).limit(
+            max(limit - len(requested), 0),
+        ).all()
+
+    def _request_contents(self, notes):
+        """With StorePool contents of batch are requested at once"""
+        if not isinstance(self.note_store, StorePool):
+            return {}
+        return dict((note.guid, self.note_store.submit(
+            'getNoteContent', self.auth_token, note.guid,
+        )) for note in notes if note.action != const.ACTION_CHANGE)
+
+    def _pull_content(self, note, future):
+        """Pull content and missing resources data of note"""
+        try:
+            if note.action == const.ACTION_CHANGE:
+                # changed before content pulled, server version
+                # is kept as conflict note
+                note_full_ttype = self.note_store.getNote(
+                    self.auth_token, note.guid, True, True, True, True,
+                )
+                self._create_conflict(note, note_full_ttype)
+                note.content_pending = False
+            elif future is not None:
+                note.set_enml(future.result())
+            else:
+                note.set_enml(self.note_store.getNoteContent(
+                    self.auth_token, note.guid,
+                ))
+        except EDAMSystemException, e:
+            if e.errorCode == EDAMErrorCode.RATE_LIMIT_REACHED:
+                self.app.log(
+                    "Rate limit _pull_content: %d minutes" %
+                        (e.rateLimitDuration/60)
+                )
+                SyncStatus.rate_limit = e.rateLimitDuration
+                return
+            raise
+
+        for resource in note.resources:
+            if (
+                resource.action != const.ACTION_DELETE
+                and not os.path.exists(resource.file_path)
+            ):
+                self._get_resource_data(resource, note)
+                if SyncStatus.rate_limit:
+                    # content pulled again with missing data
+                    note.content_pending = True
+                    return
 
-        with open(resource.file_path, 'w') as data:
-            data.write(data_body)
 
+# *************************************************
+# ****************  Pull Resource  ****************
+# *************************************************
+#
+# In lazy mode resources data is pulled when opened by user,
+# data of offline notebooks is pulled right after sync.
+#
+class PullResource(PullNote):
+    """Pull data of requested resources and offline notebooks"""
+
+    def pull(self, resource_ids=()):
+        """Pull missing data, returns count of pulled resources"""
+        pulled = 0
+        for resource in self._get_missing_resources(resource_ids):
+            self._get_resource_data(resource)
+
+            # EEE Rate limit, data pulled when opened again
+            if SyncStatus.rate_limit:
+                break
+
+            # update notifies ui that data is ready
+            resource.accessed = int(time.time() * 1000)
+            self.session.commit()
+            pulled += 1
+        return pulled
+
+    def _get_missing_resources(self, resource_ids):
+        query = self.session.query(models.Resource).filter(
+            (models.Resource.guid != None)
+            & (models.Resource.action != const.ACTION_DELETE)
+        )
+        requested = query.filter(
+            models.Resource.id.in_(resource_ids),
+        ).all() if resource_ids else []
+        pinned = query.join(models.Note).join(models.Notebook).filter(
+            models.Notebook.offline == True,
+        ).all()
+        missing = []
+        for resource in requested + pinned:
+            if (
+                resource not in missing
+                and not os.path.exists(resource.file_path)
+            ):
+                missing.append(resource)
+        return missing
@@ -0,0 +1,185 @@
+"""Jobs of sync thread.
+
+Sync timer, dbus clients and sync itself add jobs to one queue, job of
+kind already queued is coalesced with it, debounced job is moved after
+each trigger until max delay from first one. When several jobs are due
+local pushes run before remote pulls. Failed jobs postpone queue with
+exponential backoff. Waits of sync thread go through scheduler, so
+stop and cancel interrupt them instead of sleeping out rate limits.
+"""
+from ... import const
+import threading
+import time
+
+
+class SyncCancelled(Exception):
+    """Running job cancelled or scheduler stopped"""
+
+
+class SyncJob(object):
+    """Queued sync job, full forces full sync"""
+
+    def __init__(self, kind, due, full=False):
+        self.kind = kind
+        self.due = due
+        self.full = full
+        self.created = time.time()
+
+    def __repr__(self):
+        return '<SyncJob kind=%d full=%s>' % (self.kind, self.full)
+
+
+class SyncScheduler(object):
+    """Queue of sync jobs shared by sync thread and its triggers"""
+
+    def __init__(
+        self, backoff_min=const.SYNC_BACKOFF_MIN,
+        backoff_max=const.SYNC_BACKOFF_MAX,
+        debounce_max=const.PUSH_MAX_DELAY,
+    ):
+        self.backoff_min = backoff_min
+        self.backoff_max = backoff_max
+        self.debounce_max = debounce_max
+        self._condition = threading.Condition()
+        self._jobs = {}
+        self._running = None
+        self._interval = None
+        self._periodic_due = None
+        self._not_before = 0
+        self._failures = 0
+        self._cancelled = False
+        self._stopped = False
+
+    @property
+    def stopped(self):
+        return self._stopped
+
+    @property
+    def running(self):
+        return self._running
+
+    def schedule(self, kind, delay=0, full=False, debounce=False):
+        """Queue job after delay seconds, queued job of same kind
+        runs at earliest due and is full when any trigger was full,
+        debounced job runs after delay from last trigger"""
+        with self._condition:
+            self._queue(kind, time.time() + delay, full, debounce)
+            self._condition.notify_all()
+
+    def _queue(self, kind, due, full=False, debounce=False):
+        job = self._jobs.get(kind)
+        if not job:
+            self._jobs[kind] = SyncJob(kind, due, full)
+        elif debounce:
+            job.due = min(due, job.created + self.debounce_max)
+            job.full = job.full or full
+        else:
+            job.due = min(job.due, due)
+            job.full = job.full or full
+
+    def unschedule(self, kind):
+        """Drop queued job of kind"""
+        with self._condition:
+            self._jobs.pop(kind, None)
+
+    def set_interval(self, interval):
+        """Queue sync each interval seconds after previous sync,
+        None disables periodic sync"""
+        with self._condition:
+            self._interval = interval
+            if interval is None:
+                self._periodic_due = None
+            else:
+                self._periodic_due = time.time() + interval
+            self._condition.notify_all()
+
+    def next_job(self):
+        """Wait for due job, None when stopped"""
+        with self._condition:
+            while not self._stopped:
+                now = time.time()
+                if self._periodic_due is not None and self._periodic_due <= now:
+                    # armed again when sync is done
+                    self._periodic_due = None
+                    self._queue(const.SYNC_JOB_SYNC, now)
+                due = [job for job in self._jobs.values() if job.due <= now]
+                if due and now >= self._not_before:
+                    job = min(due, key=lambda job: job.kind)
+                    del self._jobs[job.kind]
+                    self._running = job
+                    self._cancelled = False
+                    return job
+                self._condition.wait(self._get_timeout(now))
+            return None
+
+    def _get_timeout(self, now):
+        dues = [job.due for job in self._jobs.values()]
+        if self._periodic_due is not None:
+            dues.append(self._periodic_due)
+        if not dues:
+            return None
+        return max(min(dues), self._not_before, now) - now
+
+    def done(self, job):
+        """Mark job finished, sync restarts periodic interval"""
+        with self._condition:
+            self._running = None
+            self._cancelled = False
+            if job.kind == const.SYNC_JOB_SYNC and self._interval is not None:
+                self._periodic_due = time.time() + self._interval
+
+    def succeeded(self):
+        with self._condition:
+            self._failures = 0
+
+    def failed(self):
+        """Postpone queue by doubled backoff, returns delay"""
+        with self._condition:
+            delay = min(
+                self.backoff_min * 2 ** min(self._failures, 16),
+                self.backoff_max,
+            )
+            self._failures += 1
+            self._not_before = time.time() + delay
+            return delay
+
+    def postpone(self, seconds):
+        """Run no job before seconds passed, for rate limits"""
+        with self._condition:
+            self._not_before = max(self._not_before, time.time() + seconds)
+
+    def wait(self, seconds):
+        """Sleep interrupted by stop or cancel of running job"""
+        deadline = time.time() + seconds
+        with self._condition:
+            while not (self._stopped or self._cancelled):
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    return
+                self._condition.wait(remaining)
+        raise SyncCancelled()
+
+    def check(self):
+        """Raise when running job should stop"""
+        if self._stopped or self._cancelled:
+            raise SyncCancelled()
+
+    def cancel(self):
+        """Drop queued jobs and interrupt running one"""
+        with self._condition:
+            self._jobs.clear()
+            if self._running:
+                self._cancelled = True
+            self._condition.notify_all()
+
+    def stop(self):
+        """Cancel all, next_job returns None"""
+        with self._condition:
+            self._stopped = True
+            self._jobs.clear()
+            self._condition.notify_all()
+
+    def restart(self):
+        with self._condition:
+            self._stopped = False
+            self._cancelled = False
@@ -1,39 +1,102 @@
-from sqlalchemy import create_engine, __version__ 
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy import create_engine, event, __version__ 
+from sqlalchemy.orm import sessionmaker, scoped_session
+from sqlalchemy.pool import QueuePool
+from PySide.QtCore import QSettings
 
-from everpad.provider.models import Base
-from everpad.const import DB_PATH
+from everpad.provider import changes
+from everpad.provider.metrics import watch_engine
+from everpad.provider.migrations import migrate
+from everpad.const import DB_PATH, DB_PRAGMAS
 
+import threading
 import os
 
 DB_MSG_ECHO = False
+DB_POOL_SIZE = 5
+
+# process wide session factories by database path
+_session_factories = {}
+_session_factories_lock = threading.Lock()
+
+def get_db_pragmas():
+    """Sqlite pragmas with values from provider settings"""
+    settings = QSettings('everpad', 'everpad-provider')
+    pragmas = []
+    for pragma, name, default in DB_PRAGMAS:
+        value = settings.value(name) or default
+        try:
+            if isinstance(default, int):
+                value = int(value)
+            elif not str(value).isalpha():
+                raise ValueError(value)
+        except ValueError:
+            value = default
+        pragmas.append((pragma, value))
+    return pragmas
+
+
+def get_flag(settings, name, default):
+    """Boolean provider setting, unset gives default"""
+    value = settings.value(name)
+    if value in (None, ''):
+        return default
+    return str(value).lower() not in ('0', 'false')
+
+
+def _setup_connection(pragmas):
+    """Apply pragmas to each new connection"""
+    def on_connect(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for pragma, value in pragmas:
+            cursor.execute('PRAGMA %s = %s' % (pragma, value))
+        cursor.close()
+    return on_connect
+
+
+def _create_session_factory(db_path, **kwargs):
+    """Create engine, migrate database and watch changes"""
+    # Ex: engine = create_engine('sqlite:///:memory:', echo=True)
+    # echo True - logging to python
+    # uses mysql-python as the default DBAPI
+
+    # postgresql can I swap??? to
+    engine = create_engine(
+        'sqlite:///%s' % db_path, echo=DB_MSG_ECHO, **kwargs
+    )
+    # WAL lets dbus service read while sync thread writes
+    event.listen(engine, 'connect', _setup_connection(get_db_pragmas()))
+    watch_engine(engine)
+    migrate(engine)
+
+    # creates a factory and assign the name Session    
+    Session = sessionmaker(bind=engine)
+    changes.feed.watch(Session)
+    return Session
 
-# change item to lower case
-# used local only
-def _nocase_lower(item):
-    return unicode(item).lower()
 
 # Setup database
 # Ref:  http://docs.sqlalchemy.org/en/rel_0_9/orm/tutorial.html
 #       http://pypix.com/tools-and-tips/essential-sqlalchemy/
 def get_db_session(db_path=None):
+    """Get session of current thread"""
     # DB_PATH defined in const.py
     if not db_path:
         db_path = os.path.expanduser(DB_PATH)
-    # Ex: engine = create_engine('sqlite:///:memory:', echo=True)
-    # echo True - logging to python
-    # uses mysql-python as the default DBAPI
 
-    # postgresql can I swap??? to
-    engine = create_engine('sqlite:///%s' % db_path, echo=DB_MSG_ECHO)
-    Base.metadata.create_all(engine)
+    if db_path == ':memory:':
+        # each memory database is private, so not shared
+        return _create_session_factory(db_path)()
 
-    # creates a factory and assign the name Session    
-    Session = sessionmaker(bind=engine)
-    session = Session()
-    conn = session.connection()
-    conn.connection.create_function('lower', 1, _nocase_lower)
-    return session
+    with _session_factories_lock:
+        if db_path not in _session_factories:
+            # connections are used by one thread at once
+            _session_factories[db_path] = scoped_session(
+                _create_session_factory(
+                    db_path, poolclass=QueuePool, pool_size=DB_POOL_SIZE,
+                    connect_args={'check_same_thread': False},
+                ),
+            )
+    return _session_factories[db_path]()
 
 def get_sqlalchemy_version( ):
-    return sqlalchemy.__version__
\ No newline at end of file
+    return sqlalchemy.__version__
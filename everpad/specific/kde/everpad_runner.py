@@ -1,7 +1,6 @@
 from PyKDE4 import plasmascript
 from PyKDE4.plasma import Plasma
 from PyKDE4.kdeui import KIcon
-from html2text import html2text
 from everpad.basetypes import Note
 from everpad.tools import get_provider, get_pad
 import dbus
@@ -43,9 +42,7 @@ class EverpadRunner(plasmascript.Runner):
             note = Note.from_tuple(note_struct)
             action = Plasma.QueryMatch(self.runner)
             action.setText(note.title)
-            content = html2text(note.content)
-            content = content[:200]
-            action.setSubtext(content)
+            action.setSubtext(note.snippet)
             action.setType(Plasma.QueryMatch.ExactMatch)
             action.setIcon(KIcon("everpad"))
             action.setData(str(note.id))
@@ -5,7 +5,9 @@ from gi.repository import Gio, Unity, Notify
 from singlet.utils import run_lens
 from everpad.tools import get_provider, get_pad, resource_filename
 from everpad.basetypes import Note, Tag, Notebook, Place, Resource
-from everpad.const import API_VERSION
+from everpad.const import (
+    API_VERSION, CHANGE_TAG, CHANGE_NOTEBOOK, CHANGE_PLACE,
+)
 from html2text import html2text
 from datetime import datetime
 import dbus
@@ -41,8 +43,8 @@ class EverpadLens(SingleScopeLens):
     def __init__(self):
         SingleScopeLens.__init__(self)
         provider.connect_to_signal(
-            'data_changed',
-            self.update_props,
+            'changes_available',
+            self.changes_available,
             dbus_interface="com.everpad.provider",
         )
         provider.connect_to_signal(
@@ -53,6 +55,13 @@ class EverpadLens(SingleScopeLens):
         self.update_props()
         self._scope.connect('preview-uri', self.preview)
 
+    def changes_available(self, since, token, changes):
+        """Filters contain only tags, notebooks and places"""
+        for entity, operation, ids in changes:
+            if entity in (CHANGE_TAG, CHANGE_NOTEBOOK, CHANGE_PLACE):
+                self.update_props()
+                return
+
     def settings_changed(self, name, value):
         if name == 'search-on-home':
             self.update_props()
@@ -120,7 +129,7 @@ class EverpadLens(SingleScopeLens):
             note = Note.from_tuple(note_struct)
             results.append(json.dumps({'id': note.id, 'search': search}),
                 'everpad-note', self.pin_notes if note.pinnded else self.all_notes,
-                "text/html", note.title, html2text(note.content),
+                "text/html", note.title, note.snippet,
             '')
 
     def global_search(self, phrase, results):
@@ -140,7 +149,8 @@ class EverpadLens(SingleScopeLens):
         image = None
         for _res in provider.get_note_resources(note.id):
             res = Resource.from_tuple(_res)
-            if 'image' in res.mime:
+            # data missing in lazy mode is pulled for next preview
+            if 'image' in res.mime and provider.fetch_resource(res.id):
                 image = 'file://%s' % res.file_path
         if image:
             preview.props.image_source_uri = image
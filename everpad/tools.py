@@ -56,52 +56,57 @@ def get_pad(bus=None):
     return dbus.Interface(pad, "com.everpad.App")
 
 
-def clean(text):  # from http://stackoverflow.com/questions/1707890/fast-way-to-filter-illegal-xml-unicode-chars-in-python
-    illegal_unichrs = [
-        (0x00, 0x08), (0x0B, 0x1F), (0x7F, 0x84), (0x86, 0x9F),
-        (0xD800, 0xDFFF), (0xFDD0, 0xFDDF), (0xFFFE, 0xFFFF),
-        (0x1FFFE, 0x1FFFF), (0x2FFFE, 0x2FFFF), (0x3FFFE, 0x3FFFF),
-        (0x4FFFE, 0x4FFFF), (0x5FFFE, 0x5FFFF), (0x6FFFE, 0x6FFFF),
-        (0x7FFFE, 0x7FFFF), (0x8FFFE, 0x8FFFF), (0x9FFFE, 0x9FFFF),
-        (0xAFFFE, 0xAFFFF), (0xBFFFE, 0xBFFFF), (0xCFFFE, 0xCFFFF),
-        (0xDFFFE, 0xDFFFF), (0xEFFFE, 0xEFFFF), (0xFFFFE, 0xFFFFF),
-        (0x10FFFE, 0x10FFFF)
-    ]
-
-    illegal_ranges = [
-        "%s-%s" % (unichr(low), unichr(high))
-        for (low, high) in illegal_unichrs
-        if low < sys.maxunicode
-    ]
-    illegal_xml_re = re.compile(u'[%s]' % u''.join(illegal_ranges))
-    return illegal_xml_re.sub('', text)
+# from http://stackoverflow.com/questions/1707890/fast-way-to-filter-illegal-xml-unicode-chars-in-python
+_illegal_unichrs = [
+    (0x00, 0x08), (0x0B, 0x1F), (0x7F, 0x84), (0x86, 0x9F),
+    (0xD800, 0xDFFF), (0xFDD0, 0xFDDF), (0xFFFE, 0xFFFF),
+    (0x1FFFE, 0x1FFFF), (0x2FFFE, 0x2FFFF), (0x3FFFE, 0x3FFFF),
+    (0x4FFFE, 0x4FFFF), (0x5FFFE, 0x5FFFF), (0x6FFFE, 0x6FFFF),
+    (0x7FFFE, 0x7FFFF), (0x8FFFE, 0x8FFFF), (0x9FFFE, 0x9FFFF),
+    (0xAFFFE, 0xAFFFF), (0xBFFFE, 0xBFFFF), (0xCFFFE, 0xCFFFF),
+    (0xDFFFE, 0xDFFFF), (0xEFFFE, 0xEFFFF), (0xFFFFE, 0xFFFFF),
+    (0x10FFFE, 0x10FFFF)
+]
+_illegal_xml_re = re.compile(u'[%s]' % u''.join(
+    "%s-%s" % (unichr(low), unichr(high))
+    for (low, high) in _illegal_unichrs
+    if low < sys.maxunicode
+))
+
+
+def clean(text):
+    """Remove chars illegal in xml"""
+    return _illegal_xml_re.sub('', text)
+
+
+# html allowed in notes, shared with ENML converter of provider
+ALLOWED_TAGS = (
+    'a', 'abbr', 'acronym', 'address', 'area', 'b', 'bdo',
+    'big', 'blockquote', 'br', 'caption', 'center', 'cite',
+    'code', 'col', 'colgroup', 'dd', 'del', 'dfn', 'div',
+    'dl', 'dt', 'em', 'font', 'h1', 'h2', 'h3', 'h4', 'h5',
+    'h6', 'hr', 'i', 'img', 'ins', 'kbd', 'li', 'map', 'ol',
+    'p', 'pre', 'q', 's', 'samp', 'small', 'span', 'strike',
+    'strong', 'sub', 'sup', 'table', 'tbody', 'td', 'tfoot',
+    'th', 'thead', 'title', 'tr', 'tt', 'u', 'ul', 'var', 'xmp',
+    'en-media', 'en-todo', 'en-crypt',
+)
+DISALLOWED_ATTRS = (
+    'id', 'class', 'onclick', 'ondblclick', 'rel',
+    'accesskey', 'data', 'dynsrc', 'tabindex', 'typeof',
+    'property',
+)
+ALLOWED_PROTOCOLS = (
+    'http', 'https', 'file', 'evernote',
+)
 
 
 def sanitize(soup=None, html=None):
-    _allowed_tags = (
-        'a', 'abbr', 'acronym', 'address', 'area', 'b', 'bdo',
-        'big', 'blockquote', 'br', 'caption', 'center', 'cite',
-        'code', 'col', 'colgroup', 'dd', 'del', 'dfn', 'div',
-        'dl', 'dt', 'em', 'font', 'h1', 'h2', 'h3', 'h4', 'h5',
-        'h6', 'hr', 'i', 'img', 'ins', 'kbd', 'li', 'map', 'ol',
-        'p', 'pre', 'q', 's', 'samp', 'small', 'span', 'strike',
-        'strong', 'sub', 'sup', 'table', 'tbody', 'td', 'tfoot',
-        'th', 'thead', 'title', 'tr', 'tt', 'u', 'ul', 'var', 'xmp',
-        'en-media', 'en-todo', 'en-crypt',
-    )
-    _disallowed_attrs = (
-        'id', 'class', 'onclick', 'ondblclick', 'rel',
-        'accesskey', 'data', 'dynsrc', 'tabindex', 'typeof',
-        'property',
-    )
-    _protocols = (
-        'http', 'https', 'file', 'evernote',
-    )
     if not soup:
         soup = BeautifulSoup(html)
     for tag in soup.findAll(True):
-        if tag.name in _allowed_tags:
-            for attr in _disallowed_attrs:
+        if tag.name in ALLOWED_TAGS:
+            for attr in DISALLOWED_ATTRS:
                 try:
                     del tag[attr]
                 except KeyError:
@@ -109,7 +114,7 @@ def sanitize(soup=None, html=None):
             try:
                 if not sum(map(
                     lambda proto: tag['href'].find(proto + '://') == 0,
-                _protocols)):
+                ALLOWED_PROTOCOLS)):
                     del tag['href']
             except KeyError:
                 pass
@@ -0,0 +1,115 @@
+"""Benchmark of thrift struct codecs.
+
+Compares decoding of synthetic sync chunk with generated ttypes,
+slotted types read by protocol and precompiled codecs:
+
+    python -m tests.codec_bench --notes 250 --repeat 5
+"""
+from evernote.edam import slotted
+from evernote.edam.notestore import ttypes as notestore_ttypes
+from evernote.edam.type import ttypes
+from everpad import const
+from thrift.protocol import TBinaryProtocol, TCodec
+from thrift.transport import TTransport
+import argparse
+import time
+
+
+def create_chunk(notes):
+    return notestore_ttypes.SyncChunk(
+        currentTime=1000L,
+        chunkHighUSN=notes,
+        updateCount=notes,
+        notes=[ttypes.Note(
+            guid='note-%d' % num,
+            title='Note %d' % num,
+            content='<en-note>%s</en-note>' % ('content ' * 256),
+            contentHash='hash-%d' % num,
+            contentLength=2048,
+            created=num * 1000L,
+            updated=num * 1000L,
+            active=True,
+            updateSequenceNum=num,
+            notebookGuid='notebook',
+            tagGuids=['tag-1', 'tag-2'],
+            attributes=ttypes.NoteAttributes(
+                latitude=1.5, longitude=2.5, source='desktop',
+            ),
+            resources=[ttypes.Resource(
+                guid='resource-%d' % num,
+                noteGuid='note-%d' % num,
+                mime='image/png',
+                width=640,
+                height=480,
+                data=ttypes.Data(bodyHash='body-hash', size=4096),
+                recognition=ttypes.Data(body='<recoIndex/>' * 32),
+                attributes=ttypes.ResourceAttributes(fileName='a.png'),
+            )],
+        ) for num in range(notes)],
+    )
+
+
+def encode(obj):
+    buf = TTransport.TMemoryBuffer()
+    obj.write(TBinaryProtocol.TBinaryProtocol(buf))
+    return buf.getvalue()
+
+
+def measure(func, repeat):
+    """Best time of func in seconds"""
+    best = None
+    for _ in range(repeat):
+        started = time.time()
+        func()
+        spent = time.time() - started
+        best = spent if best is None else min(best, spent)
+    return best
+
+
+def run(notes, repeat):
+    chunk = create_chunk(notes)
+    data = encode(chunk)
+    types = slotted.create_types(const.EDAM_FIELD_MASK)
+    slotted_chunk = types[notestore_ttypes.SyncChunk]
+
+    def generated_read():
+        notestore_ttypes.SyncChunk().read(TBinaryProtocol.TBinaryProtocol(
+            TTransport.TMemoryBuffer(data),
+        ))
+
+    def protocol_read():
+        # buffered transport doesn't expose whole response
+        slotted_chunk().read(TBinaryProtocol.TBinaryProtocol(
+            TTransport.TBufferedTransport(TTransport.TMemoryBuffer(data)),
+        ))
+
+    def codec_read():
+        slotted_chunk().read(TBinaryProtocol.TBinaryProtocol(
+            TTransport.TMemoryBuffer(data),
+        ))
+
+    decoded = slotted_chunk()
+    TCodec.decode(slotted_chunk, decoded, data)
+    return len(data), [
+        ('generated read', measure(generated_read, repeat)),
+        ('slotted protocol read', measure(protocol_read, repeat)),
+        ('codec read', measure(codec_read, repeat)),
+        ('generated write', measure(lambda: encode(chunk), repeat)),
+        ('codec write', measure(lambda: TCodec.encode(decoded), repeat)),
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark thrift codecs')
+    parser.add_argument('--notes', type=int, default=250)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    size, results = run(args.notes, args.repeat)
+    print 'chunk of %d notes, %d bytes' % (args.notes, size)
+    for name, spent in results:
+        print '%s: %.1f ms' % (name, spent * 1000)
+
+
+if __name__ == '__main__':
+    main()
@@ -11,17 +11,31 @@ from everpad.basetypes import (
 from everpad.provider import models
 from everpad.pad.editor import Editor
 from everpad.pad.editor.content import set_links
+from everpad.pad.tools import AsyncProvider
 from datetime import datetime
 import unittest
 import sys
 import os
 
 
+class FakeReplies(object):
+    """Call service methods with dbus style reply handlers"""
+
+    def __init__(self, service):
+        self.service = service
+
+    def __getattr__(self, name):
+        def call(*args, **kwargs):
+            kwargs['reply_handler'](getattr(self.service, name)(*args))
+        return call
+
+
 class FakeApp(QApplication):
     data_changed = Signal()
 
     def update(self, service):
         self.provider = service
+        self.async_provider = AsyncProvider(FakeReplies(service))
         self.settings = QSettings('everpad-test', str(datetime.now()))
 
 
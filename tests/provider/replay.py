@@ -0,0 +1,552 @@
+"""Offline replay of evernote sync.
+
+Fake note store serves synthetic account, so full and incremental
+sync can be measured without network:
+
+    python -m tests.provider.replay --notes 10000 --latency 0.05
+
+Peak rss is per process, run one account size per invocation.
+"""
+from evernote.api.client import StorePool
+from evernote.edam.error.ttypes import EDAMSystemException, EDAMErrorCode
+from evernote.edam.notestore.ttypes import SyncChunk, SyncState
+from evernote.edam.type import ttypes
+from everpad.provider.sync import agent
+from everpad.provider.sync.base import SyncStatus
+from everpad.provider.metrics import sync_state_name
+from everpad.provider import models, tools
+from everpad import const
+from sqlalchemy import event
+from collections import Counter
+from mock import MagicMock, patch
+import argparse
+import hashlib
+import threading
+import resource
+import tempfile
+import shutil
+import time
+import os
+
+
+TOKEN = 'replay-token'
+CHUNK_SIZE = 100
+RATE_LIMIT_DURATION = 60
+RATE_LIMITED_METHODS = (
+    'getFilteredSyncChunk', 'getNote', 'getNoteContent', 'getResourceData',
+)
+
+
+class FakeAccount(object):
+    """Synthetic evernote account with update sequence numbers"""
+
+    def __init__(
+        self, notes=1000, notebooks=None, tags=None, resource_every=4,
+        resource_size=2048,
+    ):
+        self.update_count = 0
+        self.resource_size = resource_size
+        self.current_time = int(time.time() * 1000)
+        # entry usn is position + 1, outdated entries are skipped
+        self._log = []
+        self._objects = {}
+        self.notebook_guids = [
+            self.add('notebook', 'notebook%d' % num, {
+                'name': 'Notebook %d' % num,
+                'default': num == 0,
+            }) for num in range(notebooks or max(1, notes // 200))
+        ]
+        self.tag_guids = [
+            self.add('tag', 'tag%d' % num, {'name': 'tag%d' % num})
+            for num in range(tags or max(1, notes // 50))
+        ]
+        self.note_guids = []
+        for num in range(notes):
+            guid = 'note%d' % num
+            self.note_guids.append(self.add('note', guid, {
+                'title': 'Note %d' % num,
+                'notebook': self.notebook_guids[
+                    num % len(self.notebook_guids)],
+                'tags': [self.tag_guids[num % len(self.tag_guids)]],
+                'place': 'Place %d' % (num % 10) if num % 3 == 0 else None,
+                'resources': [
+                    'resource%d' % num,
+                ] if resource_every and num % resource_every == 0 else [],
+                'version': 0,
+            }))
+
+    def add(self, kind, guid, fields):
+        fields.update(kind=kind, guid=guid)
+        self._objects[guid] = fields
+        self.bump(guid)
+        return guid
+
+    def bump(self, guid):
+        self.update_count += 1
+        self.current_time += 1
+        self._objects[guid].update(
+            usn=self.update_count, updated=self.current_time,
+        )
+        self._log.append((self._objects[guid]['kind'], guid))
+
+    def get(self, guid):
+        return self._objects[guid]
+
+    def touch(self, count):
+        """Change first count notes on server"""
+        for guid in self.note_guids[:count]:
+            self._objects[guid]['version'] += 1
+            self.bump(guid)
+
+    def entries(self, after, kinds, limit):
+        """Objects of kinds changed after usn and chunk high usn"""
+        found = []
+        for position in xrange(after, len(self._log)):
+            kind, guid = self._log[position]
+            if kind in kinds and self._objects[guid]['usn'] == position + 1:
+                found.append(self._objects[guid])
+                if len(found) == limit:
+                    return found, position + 1
+        return found, self.update_count
+
+
+def resource_body(guid, size):
+    line = '%s\n' % guid
+    return (line * (size // len(line) + 1))[:size]
+
+
+class FakeNoteStore(object):
+    """Note store serving fake account.
+
+    Counts calls, can sleep `latency` seconds in each call
+    and raise rate limit on each `rate_limit_every` data call.
+    """
+
+    def __init__(self, account, latency=0, rate_limit_every=0):
+        self.account = account
+        self.latency = latency
+        self.rate_limit_every = rate_limit_every
+        self.calls = Counter()
+        self._limited_calls = 0
+        self._lock = threading.Lock()
+
+    def client(self, protocol):
+        """Used as thrift client class for store pool"""
+        return self
+
+    def _call(self, name):
+        with self._lock:
+            self.calls[name] += 1
+            if self.rate_limit_every and name in RATE_LIMITED_METHODS:
+                self._limited_calls += 1
+                limited = not self._limited_calls % self.rate_limit_every
+            else:
+                limited = False
+        if self.latency:
+            time.sleep(self.latency)
+        if limited:
+            raise EDAMSystemException(
+                errorCode=EDAMErrorCode.RATE_LIMIT_REACHED,
+                rateLimitDuration=RATE_LIMIT_DURATION,
+            )
+
+    def getSyncState(self, authenticationToken):
+        self._call('getSyncState')
+        return SyncState(
+            currentTime=self.account.current_time,
+            fullSyncBefore=0,
+            updateCount=self.account.update_count,
+            uploaded=0,
+        )
+
+    def getFilteredSyncChunk(
+        self, authenticationToken, afterUSN, maxEntries, filter,
+    ):
+        """Chunk high usn is update count when nothing left, real
+        server leaves it unset"""
+        self._call('getFilteredSyncChunk')
+        kinds = set()
+        if filter.includeNotes:
+            kinds.add('note')
+        if filter.includeNotebooks:
+            kinds.add('notebook')
+        if filter.includeTags:
+            kinds.add('tag')
+        found, high_usn = self.account.entries(
+            afterUSN, kinds, min(maxEntries, CHUNK_SIZE),
+        )
+        by_kind = {}
+        for fields in found:
+            by_kind.setdefault(fields['kind'], []).append(fields)
+        # thrift leaves empty lists unset
+        return SyncChunk(
+            currentTime=self.account.current_time,
+            chunkHighUSN=high_usn,
+            updateCount=self.account.update_count,
+            notes=[
+                self._note(fields, filter.includeNoteResources)
+                for fields in by_kind['note']
+            ] if 'note' in by_kind else None,
+            notebooks=map(
+                self._notebook, by_kind['notebook'],
+            ) if 'notebook' in by_kind else None,
+            tags=map(self._tag, by_kind['tag']) if 'tag' in by_kind else None,
+        )
+
+    def getNote(
+        self, authenticationToken, guid, withContent, withResourcesData,
+        withResourcesRecognition, withResourcesAlternateData,
+    ):
+        self._call('getNote')
+        fields = self.account.get(guid)
+        note = self._note(fields, True)
+        if withContent:
+            note.content = self._content(fields)
+        return note
+
+    def getNoteContent(self, authenticationToken, guid):
+        self._call('getNoteContent')
+        return self._content(self.account.get(guid))
+
+    def getResourceData(self, authenticationToken, guid):
+        self._call('getResourceData')
+        return self._resource_body(guid)
+
+    def getResourceDataTo(self, authenticationToken, guid, fileobj):
+        # same request as getResourceData
+        body = self.getResourceData(authenticationToken, guid)
+        fileobj.write(body)
+        return len(body)
+
+    def createNote(self, authenticationToken, note):
+        self._call('createNote')
+        note.guid = self.account.add('note', 'local%d' % (
+            self.account.update_count,
+        ), {
+            'title': note.title, 'notebook': note.notebookGuid,
+            'tags': note.tagGuids or [], 'place': None,
+            'resources': [], 'version': 0,
+        })
+        return note
+
+    def updateNote(self, authenticationToken, note):
+        self._call('updateNote')
+        fields = self.account.get(note.guid)
+        fields.update(title=note.title, version=fields['version'] + 1)
+        self.account.bump(note.guid)
+        return self._note(fields, True)
+
+    def deleteNote(self, authenticationToken, guid):
+        self._call('deleteNote')
+        self.account.bump(guid)
+        return self.account.update_count
+
+    def createNotebook(self, authenticationToken, notebook):
+        self._call('createNotebook')
+        notebook.guid = self.account.add('notebook', 'local%d' % (
+            self.account.update_count,
+        ), {'name': notebook.name, 'default': False})
+        return self._notebook(self.account.get(notebook.guid))
+
+    def updateNotebook(self, authenticationToken, notebook):
+        self._call('updateNotebook')
+        self.account.get(notebook.guid)['name'] = notebook.name
+        self.account.bump(notebook.guid)
+        return self.account.update_count
+
+    def createTag(self, authenticationToken, tag):
+        self._call('createTag')
+        tag.guid = self.account.add('tag', 'local%d' % (
+            self.account.update_count,
+        ), {'name': tag.name})
+        return self._tag(self.account.get(tag.guid))
+
+    def updateTag(self, authenticationToken, tag):
+        self._call('updateTag')
+        self.account.get(tag.guid)['name'] = tag.name
+        self.account.bump(tag.guid)
+        return self.account.update_count
+
+    def shareNote(self, authenticationToken, guid):
+        self._call('shareNote')
+        return 'key-%s' % guid
+
+    def _resource_body(self, guid):
+        return resource_body(guid, self.account.resource_size)
+
+    def _resource(self, guid, note_guid):
+        body = self._resource_body(guid)
+        return ttypes.Resource(
+            guid=guid,
+            noteGuid=note_guid,
+            mime='text/plain',
+            data=ttypes.Data(
+                bodyHash=hashlib.md5(body).digest(), size=len(body),
+            ),
+            attributes=ttypes.ResourceAttributes(
+                fileName='%s.txt' % guid,
+            ),
+        )
+
+    def _content(self, fields):
+        return (
+            '<?xml version="1.0" encoding="UTF-8"?>'
+            '<!DOCTYPE en-note SYSTEM '
+            '"http://xml.evernote.com/pub/enml2.dtd">'
+            '<en-note><div>%s version %d</div>%s</en-note>'
+        ) % (fields['title'], fields['version'], ''.join(
+            '<en-media type="text/plain" hash="%s"/>' % (
+                hashlib.md5(self._resource_body(guid)).hexdigest()
+            ) for guid in fields['resources']
+        ))
+
+    def _note(self, fields, with_resources):
+        return ttypes.Note(
+            guid=fields['guid'],
+            title=fields['title'],
+            created=fields['updated'],
+            updated=fields['updated'],
+            notebookGuid=fields['notebook'],
+            tagGuids=fields['tags'],
+            updateSequenceNum=fields['usn'],
+            attributes=ttypes.NoteAttributes(placeName=fields['place']),
+            resources=[
+                self._resource(guid, fields['guid'])
+                for guid in fields['resources']
+            ] if with_resources and fields['resources'] else None,
+        )
+
+    def _notebook(self, fields):
+        return ttypes.Notebook(
+            guid=fields['guid'],
+            name=fields['name'],
+            updateSequenceNum=fields['usn'],
+            defaultNotebook=fields['default'],
+            serviceCreated=fields['updated'],
+            serviceUpdated=fields['updated'],
+        )
+
+    def _tag(self, fields):
+        return ttypes.Tag(
+            guid=fields['guid'],
+            name=fields['name'],
+            updateSequenceNum=fields['usn'],
+        )
+
+
+class FakeUserStore(object):
+    """User store for sharing"""
+
+    def getUser(self, authenticationToken):
+        return ttypes.User(shardId='s1')
+
+
+class SyncReplay(object):
+    """Sync of fake account into temporary home.
+
+    Runs SyncThread.remote_changes and local_changes in caller
+    thread and measures each sync.
+    """
+
+    def __init__(
+        self, account, latency=0, rate_limit_every=0,
+        pool_size=const.NOTE_STORE_POOL_SIZE, max_passes=1000,
+        metadata_first=const.METADATA_FIRST_SYNC,
+    ):
+        self.note_store = FakeNoteStore(account, latency, rate_limit_every)
+        self.user_store = FakeUserStore()
+        self.pool_size = pool_size
+        self.metadata_first = metadata_first
+        self.max_passes = max_passes
+        self.statements = 0
+
+    def __enter__(self):
+        self.home = tempfile.mkdtemp()
+        self._old_home = os.environ.get('HOME')
+        # resources are saved to ~/.everpad/data
+        os.environ['HOME'] = self.home
+        os.makedirs(os.path.join(self.home, '.everpad', 'data'))
+        app = MagicMock()
+        settings = {
+            'sync_delay': const.SYNC_MANUAL,
+            'metadata_first_sync': '1' if self.metadata_first else '0',
+        }
+        app.settings.value.side_effect = lambda name, *args: settings.get(
+            name,
+        )
+        self._patches = [
+            patch('everpad.provider.sync.agent.AppClass'),
+            patch('everpad.provider.sync.base.AppClass'),
+        ]
+        for app_class in self._patches:
+            app_class.start().instance.return_value = app
+
+        self.session = tools.get_db_session(
+            os.path.join(self.home, '.everpad', 'everpad.db'),
+        )
+        event.listen(
+            self.session.get_bind(), 'before_cursor_execute',
+            self._count_statement,
+        )
+        if self.pool_size:
+            self.store = StorePool(
+                TOKEN, self.note_store.client, 'http://localhost/',
+                self.pool_size,
+            )
+        else:
+            self.store = self.note_store
+        self.thread = agent.SyncThread()
+        self.thread.auth_token = TOKEN
+        self.thread.session = self.session
+        self.thread.note_store = self.store
+        self.thread.user_store = self.user_store
+        self.thread._init_sync()
+        self.thread.sync_state_changed.connect(self._state_changed)
+        return self
+
+    def __exit__(self, *exc_info):
+        if self.pool_size:
+            self.store.close()
+        self.session.close()
+        for app_class in self._patches:
+            app_class.stop()
+        if self._old_home is None:
+            del os.environ['HOME']
+        else:
+            os.environ['HOME'] = self._old_home
+        shutil.rmtree(self.home, ignore_errors=True)
+
+    def _count_statement(self, *args):
+        self.statements += 1
+
+    def _state_changed(self, state):
+        self._phases.append((state, time.time()))
+
+    def edit_local(self, count):
+        """Change first count local notes"""
+        for note in self.session.query(models.Note).order_by(
+            models.Note.id,
+        ).limit(count):
+            note.content = u'%s edited' % note.content
+            note.action = const.ACTION_CHANGE
+        self.session.commit()
+
+    def sync(self, name):
+        """Sync until not rate limited, get measurements"""
+        calls = self.note_store.calls.copy()
+        statements = self.statements
+        self._phases = []
+        started = time.time()
+        sync_state = self.thread.sync_state
+        passes = 0
+        while passes < self.max_passes:
+            passes += 1
+            SyncStatus.rate_limit = 0
+            self.thread._get_sync_state()
+            if sync_state.update_count < sync_state.srv_update_count:
+                self.thread.remote_changes(
+                    sync_state.update_count, sync_state.srv_update_count,
+                )
+            if not SyncStatus.rate_limit:
+                self.thread.local_changes()
+            while not SyncStatus.rate_limit and self.thread.pull_content():
+                pass
+            if not SyncStatus.rate_limit:
+                break
+            self.session.rollback()
+        else:
+            raise RuntimeError('Still rate limited after %d passes' % passes)
+        SyncStatus.rate_limit = 0
+        sync_state.update_count = sync_state.srv_update_count
+        self.session.commit()
+        finished = time.time()
+
+        phases = Counter()
+        for (state, at), (_, till) in zip(
+            self._phases, self._phases[1:] + [(None, finished)],
+        ):
+            phases[sync_state_name(state)] += till - at
+        # notes are browsable when content pulling starts
+        usable = [
+            at for state, at in self._phases
+            if state == const.SYNC_STATE_NOTES_CONTENT
+        ]
+        return {
+            'name': name,
+            'time': finished - started,
+            'usable': (usable[0] if usable else finished) - started,
+            'passes': passes,
+            'calls': self.note_store.calls - calls,
+            'statements': self.statements - statements,
+            'peak_rss': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+            'notes': self.session.query(models.Note).count(),
+            'phases': phases,
+        }
+
+
+def format_result(result):
+    lines = [
+        '%(name)s: %(time).2fs, usable after %(usable).2fs,'
+        ' %(passes)d passes, %(api_calls)d api calls,'
+        ' %(statements)d sql statements, peak rss %(peak_rss)d KB,'
+        ' %(notes)d local notes' % dict(
+            result, api_calls=sum(result['calls'].values()),
+        ),
+    ]
+    for method, count in sorted(result['calls'].items()):
+        lines.append('  %-24s %8d calls' % (method, count))
+    for phase, seconds in sorted(result['phases'].items()):
+        lines.append('  %-24s %8.2fs' % (phase, seconds))
+    return '\n'.join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Replay sync offline')
+    parser.add_argument('--notes', type=int, default=1000)
+    parser.add_argument('--notebooks', type=int, default=None)
+    parser.add_argument('--tags', type=int, default=None)
+    parser.add_argument(
+        '--resource-every', type=int, default=4,
+        help='note with resource each n notes',
+    )
+    parser.add_argument(
+        '--changed', type=int, default=None,
+        help='notes changed on server before incremental sync',
+    )
+    parser.add_argument(
+        '--edited', type=int, default=None,
+        help='notes changed locally before incremental sync',
+    )
+    parser.add_argument(
+        '--latency', type=float, default=0, help='seconds per call',
+    )
+    parser.add_argument('--rate-limit-every', type=int, default=0)
+    parser.add_argument(
+        '--pool', type=int, default=const.NOTE_STORE_POOL_SIZE,
+        help='note store connections, 0 to disable pool',
+    )
+    parser.add_argument(
+        '--full-notes', action='store_true',
+        help='pull full notes while sync instead of metadata first',
+    )
+    args = parser.parse_args()
+
+    account = FakeAccount(
+        args.notes, args.notebooks, args.tags, args.resource_every,
+    )
+    with SyncReplay(
+        account, args.latency, args.rate_limit_every, args.pool,
+        metadata_first=not args.full_notes,
+    ) as replay:
+        print format_result(replay.sync('full sync'))
+        account.touch(
+            args.notes // 100 if args.changed is None else args.changed,
+        )
+        replay.edit_local(
+            args.notes // 1000 if args.edited is None else args.edited,
+        )
+        print format_result(replay.sync('incremental sync'))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,67 @@
+# -*- coding: utf-8 -*-
+from everpad.provider.enml import html_to_enml, ENML_HEADER, ENML_FOOTER
+import unittest
+
+
+class ENMLCase(unittest.TestCase):
+    """Html to ENML conversion case"""
+
+    def _body(self, enml):
+        self.assertTrue(enml.startswith(ENML_HEADER))
+        self.assertTrue(enml.endswith(ENML_FOOTER))
+        return enml[len(ENML_HEADER):-len(ENML_FOOTER)]
+
+    def test_sanitize(self):
+        """Test disallowed tags, attributes and links removed"""
+        enml, converter = html_to_enml(
+            u'<div id="a" style="color: red">Text<script>x</script>'
+            u'<a href="javascript:alert()">bad</a>'
+            u'<a href="http://a.b/?c=1&amp;d=2">good</a></div>',
+        )
+        self.assertEqual(
+            self._body(enml),
+            '<div style="color: red">Textx<a>bad</a>'
+            '<a href="http://a.b/?c=1&amp;d=2">good</a></div>',
+        )
+        self.assertFalse(converter.truncated)
+
+    def test_well_formed(self):
+        """Test empty tags closed and unbalanced tags fixed"""
+        enml, converter = html_to_enml(
+            u'<p>a<br><img src="file:///a.png"><b>b</p>'
+            u'<en-todo checked="true"></en-todo></i>',
+        )
+        self.assertEqual(
+            self._body(enml),
+            '<p>a<br/><img src="file:///a.png"/><b>b</b></p>'
+            '<en-todo checked="true"/>',
+        )
+
+    def test_entities(self):
+        """Test html entities written as text"""
+        enml, converter = html_to_enml(
+            u'&nbsp;&lt;&#1090;&#x442;&unknown; & <b>т\x01</b>',
+        )
+        self.assertEqual(
+            self._body(enml).decode('utf8'),
+            u'\xa0&lt;тт&amp;unknown; &amp; <b>т</b>',
+        )
+
+    def test_limit(self):
+        """Test content over limit cut on tag boundary"""
+        html = u'<div><b>bold</b>%s</div><p>rest</p>' % (u'т' * 100)
+        limit = len(ENML_HEADER) + 100
+        enml, converter = html_to_enml(html, limit)
+
+        self.assertTrue(converter.truncated)
+        self.assertEqual(len(enml), converter.size)
+        self.assertLessEqual(converter.size, limit)
+        body = self._body(enml).decode('utf8')
+        self.assertTrue(body.startswith(u'<div><b>bold</b>тт'))
+        self.assertTrue(body.endswith(u'т</div>'))
+
+    def test_size(self):
+        """Test size of content measured"""
+        enml, converter = html_to_enml(u'<div>тест</div>' * 5000)
+        self.assertEqual(converter.size, len(enml))
+        self.assertFalse(converter.truncated)
@@ -0,0 +1,103 @@
+from .. import settings
+
+from BaseHTTPServer import HTTPServer, BaseHTTPRequestHandler
+from evernote.edam.type import ttypes
+from everpad.provider.geocoding import PlaceResolver
+from everpad.provider.tools import get_db_session
+from everpad.provider import models
+from everpad import const
+from .. import factories
+import unittest
+import threading
+import json
+
+
+class GeocodeHandler(BaseHTTPRequestHandler):
+    """Local stand-in of geocode service"""
+    requests = []
+
+    def do_GET(self):
+        self.requests.append(self.path)
+        body = json.dumps({'results': [
+            {'formatted_address': u'Place %s' % self.path[1:]},
+        ]})
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class PlaceResolverCase(unittest.TestCase):
+    """Background place resolving case"""
+
+    def setUp(self):
+        self.session = get_db_session()
+        models.Note.session = self.session
+        factories.invoke_session(self.session)
+        GeocodeHandler.requests = []
+        self.server = HTTPServer(('127.0.0.1', 0), GeocodeHandler)
+        thread = threading.Thread(target=self.server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        self.resolver = PlaceResolver(
+            url='http://127.0.0.1:%d/%%.4f,%%.4f' % self.server.server_port,
+            interval=0, session=self.session,
+        )
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def _create_note(self, latitude, longitude):
+        note = factories.NoteFactory.create(
+            action=const.ACTION_NONE,
+            latitude=latitude,
+            longitude=longitude,
+        )
+        self.session.commit()
+        return note
+
+    def test_resolve(self):
+        """Test notes at same place resolved by one request"""
+        notes = [self._create_note(1.5, 2.5) for _ in range(2)]
+
+        self.assertEqual(self.resolver.resolve(), 2)
+        for note in notes:
+            self.assertEqual(note.place.name, u'Place 1.5000,2.5000')
+        self.assertEqual(len(GeocodeHandler.requests), 1)
+
+    def test_cached(self):
+        """Test known coordinates not requested again"""
+        self._create_note(1.5, 2.5)
+        self.resolver.resolve()
+        note = self._create_note(1.50001, 2.5)
+
+        self.assertEqual(self.resolver.resolve(), 1)
+        self.assertEqual(note.place.name, u'Place 1.5000,2.5000')
+        self.assertEqual(len(GeocodeHandler.requests), 1)
+
+    def test_unavailable(self):
+        """Test failed lookup not cached"""
+        note = self._create_note(1.5, 2.5)
+        self.resolver.url = 'http://127.0.0.1:1/%.4f,%.4f'
+
+        self.assertEqual(self.resolver.resolve(), 0)
+        self.assertIsNone(note.place)
+        self.assertEqual(self.session.query(models.Geocode).count(), 0)
+
+    def test_from_api_without_lookup(self):
+        """Test coordinates of synced note stored for resolver"""
+        notebook = factories.NotebookFactory.create()
+        note = models.Note()
+        note.from_api(ttypes.Note(
+            title='title',
+            notebookGuid=notebook.guid,
+            attributes=ttypes.NoteAttributes(latitude=1.5, longitude=2.5),
+        ), self.session)
+
+        self.assertEqual((note.latitude, note.longitude), (1.5, 2.5))
+        self.assertIsNone(note.place)
+        self.assertFalse(GeocodeHandler.requests)
@@ -0,0 +1,88 @@
+from everpad.provider.metrics import Metrics, metrics, timed, record_rpc
+from everpad.provider.tools import get_db_session
+from everpad.provider import models
+from evernote.api.client import Store
+import unittest
+import threading
+import tempfile
+import shutil
+import os
+
+
+class FakeClient(object):
+    """Thrift client without network"""
+
+    def __init__(self, protocol):
+        pass
+
+    def getNote(self, authenticationToken, guid):
+        return guid
+
+
+class MetricsCase(unittest.TestCase):
+    """Metrics case"""
+
+    def setUp(self):
+        metrics.reset()
+
+    def test_record(self):
+        """Test count, total and max kept"""
+        values = Metrics()
+        values.record('rpc.getNote', 2)
+        values.record('rpc.getNote', 3)
+        self.assertEqual(values.get('rpc.getNote'), (2, 5, 3))
+        self.assertEqual(values.get('missing'), (0, 0, 0))
+        metric, = values.snapshot()
+        self.assertEqual(
+            (metric.name, metric.count, metric.total, metric.max),
+            ('rpc.getNote', 2, 5, 3),
+        )
+
+    def test_timed(self):
+        """Test timed method keeps attributes and records results"""
+        def list_notes(self):
+            """List notes"""
+            return [1, 2, 3]
+        list_notes._dbus_is_method = True
+        list_notes._dbus_out_signature = 'ai'
+        wrapped = timed('service')(list_notes)
+        self.assertTrue(wrapped._dbus_is_method)
+        self.assertEqual(wrapped.__name__, 'list_notes')
+        self.assertEqual(wrapped(None), [1, 2, 3])
+        self.assertEqual(metrics.get('service.list_notes')[0], 1)
+        self.assertEqual(metrics.get('service.list_notes.results'), (1, 3, 3))
+
+    def test_timed_struct(self):
+        """Test fields of returned struct not counted as results"""
+        def get_note(self):
+            return (1, 'title', 'content')
+        get_note._dbus_out_signature = '(iss)'
+        timed('service')(get_note)(None)
+        self.assertEqual(metrics.get('service.get_note')[0], 1)
+        self.assertEqual(metrics.get('service.get_note.results'), (0, 0, 0))
+
+    def test_store_calls(self):
+        """Test store calls reported to listeners"""
+        Store.call_listeners.append(record_rpc)
+        try:
+            store = Store('token', FakeClient, 'http://localhost/')
+            self.assertEqual(store.getNote('guid'), 'guid')
+        finally:
+            Store.call_listeners.remove(record_rpc)
+        self.assertEqual(metrics.get('rpc.getNote')[0], 1)
+        self.assertEqual(metrics.get('rpc.getNote.received'), (1, 0, 0))
+
+    def test_sql_per_thread(self):
+        """Test sql statements recorded by thread name"""
+        home = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, home)
+        path = os.path.join(home, 'everpad.db')
+
+        def query():
+            get_db_session(path).query(models.Note).count()
+
+        thread = threading.Thread(target=query, name='worker')
+        thread.start()
+        thread.join()
+        self.assertGreater(metrics.get('sql.worker')[0], 0)
+        self.assertEqual(metrics.get('sql.MainThread')[0], 0)
@@ -0,0 +1,174 @@
+# -*- coding: utf-8 -*-
+from .. import settings
+
+from sqlalchemy import create_engine
+from everpad.provider.migrations import (
+    migrate, get_version, set_version, BASE_SCHEMA_VERSION,
+)
+from everpad.provider.models import Base
+from everpad import const
+import unittest
+
+
+class MigrationsCase(unittest.TestCase):
+    """Database migrations case"""
+
+    def setUp(self):
+        self.engine = create_engine('sqlite:///:memory:')
+        self.connection = self.engine.connect()
+
+    def _indexes(self):
+        return set(name for name, in self.connection.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'index'",
+        ))
+
+    def _plan(self, query, *args):
+        return ' '.join(
+            list(row)[-1] for row in self.connection.execute(
+                'EXPLAIN QUERY PLAN ' + query, *args
+            )
+        )
+
+    def test_upgrade_old_database(self):
+        """Test indexes added to database without them"""
+        Base.metadata.create_all(self.engine)
+        for name in self._indexes():
+            if name.startswith('ix_'):
+                self.connection.execute('DROP INDEX %s' % name)
+        set_version(self.connection, 0)
+
+        migrate(self.engine)
+
+        self.assertEqual(get_version(self.connection), const.SCHEMA_VERSION)
+        self.assertIn('ix_notes_guid', self._indexes())
+        self.assertIn('ix_notetags_note_tag', self._indexes())
+
+    def test_search_columns_filled(self):
+        """Test lowercased search columns filled for existing rows"""
+        Base.metadata.create_all(self.engine)
+        self.connection.execute(
+            'INSERT INTO notes (title, content) VALUES (?, ?)',
+            u'Заметка', u'Текст',
+        )
+        set_version(self.connection, 6)
+
+        migrate(self.engine)
+
+        self.assertEqual(
+            tuple(self.connection.execute(
+                'SELECT title_lower, content_lower FROM notes',
+            ).first()),
+            (u'заметка', u'текст'),
+        )
+
+    def test_text_columns_filled(self):
+        """Test plain text and snippet filled for existing notes"""
+        Base.metadata.create_all(self.engine)
+        self.connection.execute(
+            'INSERT INTO notes (content) VALUES (?)',
+            u'<div>First&nbsp;<b>Line</b></div><div>second</div>',
+        )
+        set_version(self.connection, 7)
+
+        migrate(self.engine)
+
+        self.assertEqual(
+            tuple(self.connection.execute(
+                'SELECT content_text, content_lower, snippet FROM notes',
+            ).first()),
+            (u'First Line second', u'first line second', u'First Line second'),
+        )
+
+    def test_content_pending_added(self):
+        """Test content pending column added to notes"""
+        self.connection.execute(
+            'CREATE TABLE notes (id INTEGER PRIMARY KEY, content VARCHAR)',
+        )
+        set_version(self.connection, 8)
+
+        migrate(self.engine)
+
+        self.assertIn('content_pending', [
+            row[1] for row in self.connection.execute(
+                'PRAGMA table_info(notes)',
+            )
+        ])
+
+    def test_resource_cache_columns_added(self):
+        """Test access time and offline columns added"""
+        self.connection.execute('CREATE TABLE resources (id INTEGER)')
+        self.connection.execute('CREATE TABLE notebooks (id INTEGER)')
+        set_version(self.connection, 9)
+
+        migrate(self.engine)
+
+        for table, column in (
+            ('resources', 'accessed'), ('notebooks', 'offline'),
+        ):
+            self.assertIn(column, [
+                row[1] for row in self.connection.execute(
+                    'PRAGMA table_info(%s)' % table,
+                )
+            ])
+
+    def test_coordinates_added(self):
+        """Test coordinates columns and geocodes table added"""
+        self.connection.execute('CREATE TABLE notes (id INTEGER)')
+        set_version(self.connection, 10)
+
+        migrate(self.engine)
+
+        columns = [
+            row[1] for row in self.connection.execute(
+                'PRAGMA table_info(notes)',
+            )
+        ]
+        self.assertIn('latitude', columns)
+        self.assertIn('longitude', columns)
+        self.assertIn('ix_geocodes_latlng', self._indexes())
+
+    def test_newer_database_untouched(self):
+        """Test database with newer schema not migrated"""
+        Base.metadata.create_all(self.engine)
+        set_version(self.connection, const.SCHEMA_VERSION + 1)
+
+        migrate(self.engine)
+
+        self.assertEqual(
+            get_version(self.connection), const.SCHEMA_VERSION + 1,
+        )
+
+    def test_hot_queries_use_indexes(self):
+        """Test sync and service queries use indexes"""
+        migrate(self.engine)
+        queries = (
+            ('SELECT id FROM notes WHERE guid = ?', 'ix_notes_guid'),
+            ('SELECT id FROM notebooks WHERE guid = ?', 'ix_notebooks_guid'),
+            ('SELECT id FROM tags WHERE guid = ?', 'ix_tags_guid'),
+            (
+                'SELECT id FROM resources WHERE guid = ?',
+                'ix_resources_guid',
+            ),
+            (
+                'SELECT id FROM resources WHERE note_id = ?',
+                'ix_resources_note_id',
+            ),
+            (
+                'SELECT count(*) FROM notes WHERE notebook_id = ?',
+                'ix_notes_notebook_id',
+            ),
+            (
+                'SELECT id FROM notes WHERE conflict_parent_id = ?',
+                'ix_notes_conflict_parent_id',
+            ),
+            (
+                'SELECT note FROM notetags WHERE tag = ?',
+                'ix_notetags_tag_note',
+            ),
+            (
+                'SELECT tag FROM notetags WHERE note = ?',
+                'ix_notetags_note_tag',
+            ),
+        )
+        for query, index in queries:
+            self.assertIn(index, self._plan(query, 1))
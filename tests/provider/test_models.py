@@ -0,0 +1,83 @@
+from .. import settings
+
+from sqlalchemy import event
+from sqlalchemy.orm.exc import NoResultFound
+from everpad.provider.tools import get_db_session
+from everpad.provider import models
+from everpad import const
+from .. import factories
+import unittest
+
+
+class IdentityCacheCase(unittest.TestCase):
+    """Tags and notebooks identity cache case"""
+
+    def setUp(self):
+        self.session = get_db_session()
+        models.Note.session = self.session
+        factories.invoke_session(self.session)
+        self.notebook = factories.NotebookFactory.create(default=True)
+        self.tag = factories.TagFactory.create(
+            name='tag', action=const.ACTION_NONE,
+        )
+        self.session.commit()
+        self.cache = models.get_identity_cache(self.session)
+        self.statements = []
+        event.listen(
+            self.session.bind, 'before_cursor_execute',
+            lambda conn, cursor, statement, *args: self.statements.append(
+                statement,
+            ),
+        )
+
+    def _lookups(self):
+        return len([
+            statement for statement in self.statements
+            if 'WHERE' not in statement and (
+                'FROM tags' in statement or 'FROM notebooks' in statement
+            )
+        ])
+
+    def test_lookups_cached(self):
+        """Test tables loaded once for all lookups"""
+        for _ in range(3):
+            self.assertEqual(self.cache.tag_by_name('tag'), self.tag)
+            self.assertEqual(
+                self.cache.tags_by_guids([self.tag.guid, 'missing']),
+                [self.tag],
+            )
+            self.assertEqual(self.cache.default_notebook(), self.notebook)
+            self.assertEqual(
+                self.cache.notebook_by_guid(self.notebook.guid),
+                self.notebook,
+            )
+        self.assertEqual(self._lookups(), 2)
+        with self.assertRaises(NoResultFound):
+            self.cache.notebook_by_id(0)
+
+    def test_created_tag(self):
+        """Test tag created by note found before flush"""
+        note = factories.NoteFactory.create()
+        note.tags_dbus = ['new', 'new']
+        self.assertEqual(len(set(note.tags)), 1)
+        self.session.rollback()
+        with self.assertRaises(NoResultFound):
+            self.cache.tag_by_name('new')
+
+    def test_invalidated_on_write(self):
+        """Test deleted and renamed tags not found"""
+        self.cache.tag_by_name('tag')
+        self.tag.name = 'renamed'
+        self.session.commit()
+        self.assertEqual(self.cache.tag_by_name('renamed'), self.tag)
+
+        self.session.query(models.Tag).delete()
+        with self.assertRaises(NoResultFound):
+            self.cache.tag_by_name('renamed')
+
+    def test_invalidated_by_other_session(self):
+        """Test changes committed by other session drop cache"""
+        self.cache.tag_by_name('tag')
+        models.invalidate_identity_caches(set([const.CHANGE_TAG]))
+        self.cache.tag_by_name('tag')
+        self.assertEqual(self._lookups(), 2)
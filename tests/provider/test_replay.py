@@ -0,0 +1,98 @@
+from .replay import FakeAccount, SyncReplay
+from everpad.provider import models
+from everpad import const
+import unittest
+import threading
+import time
+
+
+class SyncReplayCase(unittest.TestCase):
+    """Offline sync replay case"""
+
+    def _replay(self, **kwargs):
+        self.account = FakeAccount(notes=30, resource_every=3)
+        kwargs.setdefault('metadata_first', False)
+        return SyncReplay(self.account, **kwargs)
+
+    def test_full_sync(self):
+        """Test full sync receives all notes"""
+        with self._replay(pool_size=0) as replay:
+            result = replay.sync('full')
+        self.assertEqual(result['notes'], 30)
+        self.assertEqual(result['calls']['getNote'], 30)
+        self.assertEqual(result['calls']['getResourceData'], 10)
+        self.assertEqual(result['passes'], 1)
+        self.assertGreater(result['statements'], 0)
+        self.assertIn('notes_remote', result['phases'])
+
+    def test_incremental_sync(self):
+        """Test incremental sync receives only changed notes"""
+        with self._replay(pool_size=2) as replay:
+            replay.sync('full')
+            self.account.touch(3)
+            replay.edit_local(1)
+            result = replay.sync('incremental')
+        self.assertEqual(result['calls']['getNote'], 3)
+        self.assertEqual(result['calls']['updateNote'], 1)
+
+    def test_rate_limit(self):
+        """Test sync passes repeated while rate limited"""
+        with self._replay(pool_size=0, rate_limit_every=10) as replay:
+            result = replay.sync('full')
+        self.assertGreater(result['passes'], 1)
+        self.assertEqual(result['notes'], 30)
+
+    def test_metadata_first(self):
+        """Test full sync stores metadata and pulls content after"""
+        with self._replay(pool_size=2, metadata_first=True) as replay:
+            result = replay.sync('full')
+            notes = replay.session.query(models.Note).all()
+            self.assertFalse([note for note in notes if note.content_pending])
+            self.assertTrue(all('version' in note.content for note in notes))
+        self.assertEqual(result['calls']['getNote'], 0)
+        self.assertEqual(result['calls']['getNoteContent'], 30)
+        self.assertEqual(result['calls']['getResourceData'], 10)
+        self.assertIn('notes_content', result['phases'])
+        self.assertLess(result['usable'], result['time'])
+
+    def test_full_resync_with_content(self):
+        """Test full resync pulls full notes, local bodies kept"""
+        with self._replay(pool_size=2, metadata_first=True) as replay:
+            replay.sync('initial')
+            self.account.touch(3)
+            replay.thread.sync_state.update_count = 0
+            result = replay.sync('resync')
+            self.assertFalse(replay.session.query(models.Note).filter(
+                models.Note.content_pending == True,
+            ).count())
+        self.assertEqual(result['calls']['getNoteContent'], 0)
+        self.assertGreater(result['calls']['getNote'], 0)
+
+    def test_close_network(self):
+        """Test workers of note store pool end with network"""
+        with self._replay(pool_size=2) as replay:
+            workers = threading.active_count()
+            replay.thread._close_network()
+            for _ in range(100):
+                if threading.active_count() == workers - 2:
+                    break
+                time.sleep(0.01)
+            self.assertEqual(threading.active_count(), workers - 2)
+            self.assertIsNone(replay.thread.note_store)
+
+    def test_fetch_batches(self):
+        """Test fetch job pulls one batch and queues next one"""
+        with self._replay(pool_size=0, metadata_first=True) as replay:
+            thread = replay.thread
+            replay._phases = []
+            thread._get_sync_state()
+            thread.remote_changes(0, thread.sync_state.srv_update_count)
+            thread.fetch()
+            self.assertEqual(
+                thread.scheduler.next_job().kind, const.SYNC_JOB_FETCH,
+            )
+            thread.fetch()
+            self.assertFalse(thread.scheduler._jobs)
+            self.assertFalse(replay.session.query(models.Note).filter(
+                models.Note.content_pending == True,
+            ).count())
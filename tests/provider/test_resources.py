@@ -0,0 +1,83 @@
+from .. import settings
+
+from mock import MagicMock
+from everpad.provider.tools import get_db_session
+from everpad.provider import models, resources
+from everpad import const
+import unittest
+import tempfile
+import shutil
+import os
+from .. import factories
+
+
+class CacheCase(unittest.TestCase):
+    """Resources data cache case"""
+
+    def setUp(self):
+        self.session = get_db_session()
+        models.Note.session = self.session
+        factories.invoke_session(self.session)
+        self.path = tempfile.mkdtemp()
+        self.notebook = factories.NotebookFactory.create()
+        self.note = factories.NoteFactory.create(
+            action=const.ACTION_NONE, notebook=self.notebook,
+        )
+        self.session.commit()
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def _create_resource(self, accessed, size=1024, **kwargs):
+        file_path = os.path.join(self.path, 'resource%d' % accessed)
+        with open(file_path, 'wb') as data:
+            data.write('x' * size)
+        kwargs.setdefault('action', const.ACTION_NONE)
+        resource = factories.ResourceFactory.create(
+            note_id=self.note.id, file_path=file_path,
+            accessed=accessed, **kwargs
+        )
+        self.session.commit()
+        return resource
+
+    def test_evict(self):
+        """Test least recently accessed data removed over size"""
+        old = self._create_resource(1)
+        recent = self._create_resource(2)
+        local = self._create_resource(0, action=const.ACTION_CREATE)
+
+        self.assertEqual(resources.evict(self.session, 1536), 1)
+        self.assertFalse(os.path.exists(old.file_path))
+        self.assertTrue(os.path.exists(recent.file_path))
+        self.assertTrue(os.path.exists(local.file_path))
+
+    def test_offline_notebook_pinned(self):
+        """Test data of offline notebook not removed"""
+        resource = self._create_resource(1)
+        self.notebook.offline = True
+        self.session.commit()
+
+        self.assertTrue(resources.is_pinned(self.note))
+        self.assertEqual(resources.evict(self.session, 0), 0)
+        self.assertTrue(os.path.exists(resource.file_path))
+
+    def test_touch(self):
+        """Test access time updated"""
+        resource = self._create_resource(1)
+        resources.touch(self.session, [resource.id])
+        self.session.expire_all()
+        self.assertGreater(resource.accessed, 1)
+        self.assertTrue(resources.is_touched(resource))
+        resource.accessed = 1
+        self.assertFalse(resources.is_touched(resource))
+
+    def test_settings(self):
+        """Test lazy mode and cache size read from settings"""
+        values = {'lazy_resources': '1', 'resource_cache_size': 'big'}
+        settings = MagicMock()
+        settings.value.side_effect = values.get
+        self.assertTrue(resources.is_lazy(settings))
+        self.assertEqual(
+            resources.get_cache_size(settings),
+            const.RESOURCE_CACHE_SIZE * 1024 * 1024,
+        )
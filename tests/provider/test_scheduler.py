@@ -0,0 +1,128 @@
+from everpad.provider.sync.scheduler import SyncScheduler, SyncCancelled
+from everpad import const
+import unittest
+import threading
+import time
+
+
+class SyncSchedulerCase(unittest.TestCase):
+    """Sync jobs queue case"""
+
+    def setUp(self):
+        self.scheduler = SyncScheduler(backoff_min=10, backoff_max=60)
+
+    def _in_thread(self, target, delay=0.05):
+        def run():
+            time.sleep(delay)
+            target()
+        thread = threading.Thread(target=run)
+        thread.daemon = True
+        thread.start()
+        return thread
+
+    def test_coalesce(self):
+        """Test repeated triggers run as one job"""
+        self.scheduler.schedule(const.SYNC_JOB_SYNC)
+        self.scheduler.schedule(const.SYNC_JOB_SYNC, full=True)
+        self.scheduler.schedule(const.SYNC_JOB_SYNC)
+
+        job = self.scheduler.next_job()
+        self.assertEqual(job.kind, const.SYNC_JOB_SYNC)
+        self.assertTrue(job.full)
+        self.scheduler.done(job)
+        self.scheduler.stop()
+        self.assertIsNone(self.scheduler.next_job())
+
+    def test_push_first(self):
+        """Test due local push runs before remote sync"""
+        self.scheduler.schedule(const.SYNC_JOB_SYNC)
+        self.scheduler.schedule(const.SYNC_JOB_FETCH)
+        self.scheduler.schedule(const.SYNC_JOB_PUSH)
+
+        kinds = []
+        for _ in range(3):
+            job = self.scheduler.next_job()
+            kinds.append(job.kind)
+            self.scheduler.done(job)
+        self.assertEqual(kinds, [
+            const.SYNC_JOB_PUSH, const.SYNC_JOB_FETCH, const.SYNC_JOB_SYNC,
+        ])
+
+    def test_debounce(self):
+        """Test burst of triggers runs after delay from last one"""
+        for _ in range(3):
+            self.scheduler.schedule(
+                const.SYNC_JOB_PUSH, delay=0.1, debounce=True,
+            )
+            time.sleep(0.05)
+        started = time.time()
+        self.scheduler.next_job()
+        self.assertGreaterEqual(time.time() - started, 0.04)
+
+    def test_debounce_max(self):
+        """Test debounced job not moved after max delay"""
+        self.scheduler.debounce_max = 0.1
+        self.scheduler.schedule(const.SYNC_JOB_PUSH, debounce=True)
+        self.scheduler.schedule(const.SYNC_JOB_PUSH, delay=60, debounce=True)
+        started = time.time()
+        self.scheduler.next_job()
+        self.assertLess(time.time() - started, 5)
+
+    def test_delayed(self):
+        """Test job not taken before due"""
+        self.scheduler.schedule(const.SYNC_JOB_SYNC, delay=0.1)
+        started = time.time()
+        self.scheduler.next_job()
+        self.assertGreaterEqual(time.time() - started, 0.09)
+
+    def test_periodic(self):
+        """Test interval queues sync"""
+        self.scheduler.set_interval(0.05)
+        job = self.scheduler.next_job()
+        self.assertEqual(job.kind, const.SYNC_JOB_SYNC)
+        self.assertFalse(job.full)
+
+    def test_backoff(self):
+        """Test failures double delay up to maximum"""
+        delays = [self.scheduler.failed() for _ in range(4)]
+        self.assertEqual(delays, [10, 20, 40, 60])
+        self.scheduler.succeeded()
+        self.assertEqual(self.scheduler.failed(), 10)
+
+    def test_postponed(self):
+        """Test no job runs while postponed"""
+        self.scheduler.postpone(0.1)
+        self.scheduler.schedule(const.SYNC_JOB_PUSH)
+        started = time.time()
+        self.scheduler.next_job()
+        self.assertGreaterEqual(time.time() - started, 0.09)
+
+    def test_stop_interrupts(self):
+        """Test stop wakes up waiting thread"""
+        self._in_thread(self.scheduler.stop)
+        started = time.time()
+        self.assertIsNone(self.scheduler.next_job())
+        self.assertRaises(SyncCancelled, self.scheduler.wait, 60)
+        self.assertLess(time.time() - started, 5)
+
+    def test_cancel(self):
+        """Test cancel drops queued jobs and interrupts running one"""
+        self.scheduler.schedule(const.SYNC_JOB_SYNC)
+        job = self.scheduler.next_job()
+        self.scheduler.schedule(const.SYNC_JOB_PUSH)
+        self._in_thread(self.scheduler.cancel)
+
+        self.assertRaises(SyncCancelled, self.scheduler.wait, 60)
+        self.assertRaises(SyncCancelled, self.scheduler.check)
+        self.scheduler.done(job)
+        self.scheduler.check()
+        self.scheduler.schedule(const.SYNC_JOB_FETCH)
+        self.assertEqual(
+            self.scheduler.next_job().kind, const.SYNC_JOB_FETCH,
+        )
+
+    def test_wait(self):
+        """Test wait without interruption"""
+        started = time.time()
+        self.scheduler.wait(0.05)
+        self.assertGreaterEqual(time.time() - started, 0.04)
@@ -92,6 +92,7 @@ class FindTestCase(unittest.TestCase):
         """Create service"""
         self.service = ProviderService()
         self.service._session = get_db_session()
+        self.service.app = MagicMock()
         models.Note.session = self.service._session  # TODO: fix that shit
 
     def _to_ids(self, items):
@@ -232,6 +233,17 @@ class MethodsCase(unittest.TestCase):
         note = self._create_note()
         remote_note = btype.Note << self.service.get_note(note.id)
         self.assertEqual(remote_note.title, note.title)
+        self.assertFalse(
+            self.service.app.sync_thread.request_note_content.called,
+        )
+
+    def test_get_pending_note(self):
+        """Test content of opened note requested"""
+        note = self._create_note(content_pending=True)
+        self.service.get_note(note.id)
+        self.service.app.sync_thread.request_note_content.assert_called_with(
+            note.id,
+        )
 
     def test_get_note_by_guid(self):
         """Test get note method"""
@@ -325,6 +337,17 @@ class MethodsCase(unittest.TestCase):
         self.service.delete_notebook(notebook.id)
         self.assertEqual(notebook.action, const.ACTION_DELETE)
 
+    def test_set_notebook_offline(self):
+        """Test notebook resources pinned"""
+        notebook = factories.NotebookFactory.create(
+            action=const.ACTION_NONE,
+        )
+        self.session.commit()
+        self.service.set_notebook_offline(notebook.id, True)
+        self.assertEqual(
+            list(self.service.get_offline_notebooks()), [notebook.id],
+        )
+
     def test_list_tags(self):
         """Test list tags"""
         tags = factories.TagFactory.create_batch(
@@ -420,6 +443,7 @@ class MethodsCase(unittest.TestCase):
 
         self.assertEqual(note_btype.title, new_title)
         self.assertEqual(note.title, new_title)
+        self.service.app.sync_thread.request_push.assert_called_once_with()
 
     def test_get_note_resources(self):
         """Test get note resources"""
@@ -438,6 +462,22 @@ class MethodsCase(unittest.TestCase):
 
         self.assertEqual(resources_btype[0].file_name, resource.file_name)
 
+    def test_fetch_resource(self):
+        """Test missing resource data requested"""
+        note = self._create_note()
+        resource = factories.ResourceFactory.create(
+            file_path='/nonexistent',
+            action=const.ACTION_NONE,
+            note_id=note.id,
+        )
+        self.session.commit()
+
+        self.assertFalse(self.service.fetch_resource(resource.id))
+        self.service.app.sync_thread.request_resource.assert_called_with(
+            resource.id,
+        )
+        self.assertTrue(resource.accessed)
+
     def test_update_note_resources(self):
         """Test update note resources"""
         note = self._create_note()
@@ -460,6 +500,7 @@ class MethodsCase(unittest.TestCase):
         self.service.delete_note(note.id)
 
         self.assertEqual(note.action, const.ACTION_DELETE)
+        self.service.app.sync_thread.request_push.assert_called_once_with()
 
     def test_create_notebook(self):
         """Test create notebook"""
@@ -500,7 +541,7 @@ class MethodsCase(unittest.TestCase):
 
         self.service.share_note(note.id)
         self.assertEqual(note.share_status, const.SHARE_NEED_SHARE)
-        self.service.sync.assert_called_once_with()
+        self.service.app.sync_thread.request_push.assert_called_once_with()
 
     def test_stop_sharing_note(self):
         """Test stop sharing note"""
@@ -508,8 +549,185 @@ class MethodsCase(unittest.TestCase):
 
         self.service.stop_sharing_note(note.id)
         self.assertEqual(note.share_status, const.SHARE_NEED_STOP)
-        self.service.sync.assert_called_once_with()
+        self.service.app.sync_thread.request_push.assert_called_once_with()
 
     def test_is_first_synced(self):
         """Test is first synced"""
         self.assertFalse(self.service.is_first_synced())
+
+    def test_get_menu(self):
+        """Test get menu"""
+        self.service.app.settings.value.return_value = '0'
+        self.service.is_authenticated = MagicMock(return_value=True)
+        pinned = self._create_note(pinnded=True)
+        notes = [self._create_note(pinnded=False) for _ in range(3)]
+
+        menu = btype.Menu << self.service.get_menu()
+
+        self.assertEqual(menu.version, const.API_VERSION)
+        self.assertEqual(menu.pin_notes, [(pinned.id, pinned.title)])
+        self.assertEqual(
+            [note_id for note_id, title in menu.notes],
+            [note.id for note in reversed(notes)],
+        )
+
+    def test_get_menu_by_notebook(self):
+        """Test get menu sorted by notebook"""
+        self.service.app.settings.value.return_value = '1'
+        self.service.is_authenticated = MagicMock(return_value=True)
+        notebook, empty = factories.NotebookFactory.create_batch(2)
+        notes = factories.NoteFactory.create_batch(
+            const.MENU_NOTES_LIMIT + 5, action=const.ACTION_NONE,
+            pinnded=False, notebook=notebook,
+        )
+        self.session.commit()
+
+        menu = btype.Menu << self.service.get_menu()
+
+        notebooks = dict(
+            (notebook_id, note_items)
+            for notebook_id, name, note_items in menu.notebooks
+        )
+        self.assertEqual(notebooks[empty.id], [])
+        self.assertEqual(
+            [note_id for note_id, title in notebooks[notebook.id]],
+            [note.id for note in reversed(notes)][:const.MENU_NOTES_LIMIT],
+        )
+
+    def test_get_changes_since(self):
+        """Test get changes since token"""
+        deleted = self._create_note()
+        token, complete, changes = self.service.get_changes_since(0)
+        self.assertFalse(complete)
+        created = self._create_note()
+        self.service.delete_note(deleted.id)
+        temporary = self._create_note()
+        self.session.delete(temporary)
+        self.session.commit()
+
+        new_token, complete, changes = self.service.get_changes_since(token)
+
+        self.assertTrue(complete)
+        self.assertGreater(new_token, token)
+        note_changes = [
+            (change.operation, change.ids)
+            for change in btype.Change.list << changes
+            if change.entity == const.CHANGE_NOTE
+        ]
+        self.assertEqual(note_changes, [
+            (const.CHANGE_CREATE, [created.id]),
+            (const.CHANGE_DELETE, [deleted.id]),
+        ])
+
+    def test_query_cache(self):
+        """Test query cache invalidated by writes"""
+        notebook = factories.NotebookFactory.create(default=True)
+        self.session.commit()
+        note = self._create_note(title='cached', notebook_id=notebook.id)
+        find = lambda: btype.Note.list << self.service.find_notes(
+            '', dbus.Array([], signature='i'),
+            dbus.Array([], signature='i'), 0,
+            100, btype.Note.ORDER_UPDATED, -1,
+        )
+        self.assertEqual(find()[0].title, 'cached')
+        self.assertEqual(find()[0].title, 'cached')
+        self.assertEqual(self.service.get_query_cache_stats()[:2], (1, 1))
+
+        note_btype = btype.Note.from_obj(note)
+        note_btype.title = 'changed'
+        self.service.update_note(note_btype.struct)
+
+        self.assertEqual(find()[0].title, 'changed')
+        self.assertEqual(self.service.get_query_cache_stats()[:2], (1, 2))
+
+    def test_get_metrics(self):
+        """Test service methods are measured"""
+        self._create_note()
+        self.service.find_notes(
+            '', dbus.Array([], signature='i'),
+            dbus.Array([], signature='i'), 0,
+            100, btype.Note.ORDER_UPDATED, -1,
+        )
+        metrics = dict(
+            (metric.name, metric)
+            for metric in btype.Metric.list << self.service.get_metrics()
+        )
+        self.assertGreaterEqual(metrics['service.find_notes'].count, 1)
+        self.assertGreaterEqual(metrics['service.find_notes.results'].max, 1)
+        self.assertGreater(metrics['sql.MainThread'].count, 0)
+
+    def test_find_notes_by_text(self):
+        """Test search by plain text, not by markup"""
+        self._create_note(content=u'<div>Some <b>bold</b> text</div>')
+        find = lambda words: btype.Note.list << self.service.find_notes(
+            words, dbus.Array([], signature='i'),
+            dbus.Array([], signature='i'), 0,
+            100, btype.Note.ORDER_UPDATED, -1,
+        )
+        self.assertEqual(find('div'), [])
+        self.assertEqual(find('bold text')[0].snippet, u'Some bold text')
+
+    def test_move_notes(self):
+        """Test move notes to notebook"""
+        notebook = factories.NotebookFactory.create()
+        created, deleted = [
+            factories.NoteFactory.create(action=action)
+            for action in (const.ACTION_CREATE, const.ACTION_DELETE)
+        ]
+        note = self._create_note()
+
+        count = self.service.move_notes(
+            [created.id, note.id, deleted.id], notebook.id,
+        )
+
+        self.assertEqual(count, 2)
+        self.session.expire_all()
+        self.assertEqual(created.notebook_id, notebook.id)
+        self.assertEqual(created.action, const.ACTION_CREATE)
+        self.assertEqual(note.notebook_id, notebook.id)
+        self.assertEqual(note.action, const.ACTION_CHANGE)
+        self.assertNotEqual(deleted.notebook_id, notebook.id)
+
+    def test_tag_and_untag_notes(self):
+        """Test add and remove tag on many notes"""
+        tag = factories.TagFactory.create()
+        tagged = self._create_note(tags=[tag])
+        note = self._create_note()
+
+        self.assertEqual(self.service.tag_notes([tagged.id, note.id], tag.id), 1)
+        self.assertEqual(self.service.get_tag_notes_count(tag.id), 2)
+
+        self.assertEqual(
+            self.service.untag_notes([tagged.id, note.id], tag.id), 2,
+        )
+        self.assertEqual(self.service.get_tag_notes_count(tag.id), 0)
+
+    def test_delete_notes(self):
+        """Test delete many notes"""
+        conflict = factories.NoteFactory.create(action=const.ACTION_CONFLICT)
+        note = self._create_note()
+        conflict_id = conflict.id
+
+        self.assertEqual(self.service.delete_notes([note.id, conflict_id]), 2)
+
+        self.session.expire_all()
+        self.assertEqual(note.action, const.ACTION_DELETE)
+        self.assertEqual(self.session.query(models.Note).filter(
+            models.Note.id == conflict_id,
+        ).count(), 0)
+
+    def test_rename_stack(self):
+        """Test rename stack"""
+        notebooks = factories.NotebookFactory.create_batch(
+            2, stack='stack', action=const.ACTION_NONE,
+        )
+        other = factories.NotebookFactory.create(stack='other')
+        self.session.commit()
+
+        self.assertEqual(self.service.rename_stack('stack', 'new'), 2)
+
+        self.session.expire_all()
+        for notebook in notebooks:
+            self.assertEqual(notebook.stack, 'new')
+            self.assertEqual(notebook.action, const.ACTION_CHANGE)
+        self.assertEqual(other.stack, 'other')
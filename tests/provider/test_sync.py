@@ -3,6 +3,7 @@ from .. import settings
 from everpad.provider.sync import note, notebook, tag
 from everpad.provider.tools import get_db_session
 from everpad.provider import models
+from everpad.provider.cache import user_cache
 from everpad import const
 from evernote.edam.type import ttypes
 from evernote import edam
@@ -40,6 +41,7 @@ class BaseSyncCase(unittest.TestCase):
     def _create_user_store(self):
         """Create user store mock"""
         self.user_store = MagicMock()
+        user_cache.invalidate()
 
     def _create_sync(self):
         """Create sync object"""
@@ -312,6 +314,43 @@ class PushNoteCase(BaseSyncCase):
 
         self.assertEqual(pushed.title, note.title)
         self.assertEqual(pushed.resources[0].attributes.fileName, file_name)
+        self.assertEqual(note.action, const.ACTION_NONE)
+
+    def test_changed_while_pushing(self):
+        """Test note saved again while pushing stays changed"""
+        note = factories.NoteFactory.create(
+            action=const.ACTION_CHANGE,
+            updated_local=1,
+        )
+        self.session.commit()
+        notes = models.Note.__table__
+
+        def save_again(*args):
+            self.session.execute(notes.update().where(
+                notes.c.id == note.id,
+            ).values(updated_local=2, action=const.ACTION_CHANGE))
+
+        self.note_store.updateNote.side_effect = save_again
+        self.sync.push()
+
+        self.assertEqual(note.action, const.ACTION_CHANGE)
+        self.assertEqual(note.updated_local, 2)
+
+    def test_deleted_while_pushing(self):
+        """Test note deleted while pushing stays deleted"""
+        note = factories.NoteFactory.create(action=const.ACTION_CHANGE)
+        self.session.commit()
+        notes = models.Note.__table__
+
+        def delete(*args):
+            self.session.execute(notes.update().where(
+                notes.c.id == note.id,
+            ).values(action=const.ACTION_DELETE))
+
+        self.note_store.updateNote.side_effect = delete
+        self.sync.push()
+
+        self.assertEqual(note.action, const.ACTION_DELETE)
 
     def test_delete_note(self):
         """Test delete note"""
@@ -345,6 +384,17 @@ class PushNoteCase(BaseSyncCase):
         self.sync.push()
         self.assertEqual(note.share_status, const.SHARE_NONE)
 
+    def test_push_sharing_only(self):
+        """Test unchanged note shared, shard id requested once"""
+        notes = [factories.NoteFactory.create(
+            action=const.ACTION_NONE,
+            share_status=const.SHARE_NEED_SHARE,
+        ) for _ in range(2)]
+        self.sync.push()
+        for note in notes:
+            self.assertEqual(note.share_status, const.SHARE_SHARED)
+        self.assertFalse(self.note_store.updateNote.called)
+        self.assertEqual(self.user_store.getUser.call_count, 1)
 
 class PullNoteCase(BaseSyncCase):
     """Pull note case"""
@@ -459,6 +509,39 @@ class PullNoteCase(BaseSyncCase):
 
         self.assertEqual(local_note.share_status, const.SHARE_SHARED)
 
+    def test_sharing_from_metadata(self):
+        """Test sharing taken from metadata without sharing again"""
+        shared = factories.NoteFactory.create(
+            action=const.ACTION_NONE,
+            share_status=const.SHARE_SHARED,
+            share_date=1,
+            share_url='url',
+        )
+        not_shared = factories.NoteFactory.create(
+            action=const.ACTION_NONE,
+            share_status=const.SHARE_NONE,
+        )
+        for note in (shared, not_shared):
+            self.sync._check_sharing_information(note, ttypes.Note(
+                attributes=ttypes.NoteAttributes(shareDate=2),
+            ))
+            self.assertEqual(note.share_status, const.SHARE_SHARED)
+            self.assertEqual(note.share_date, 2)
+
+        self.assertEqual(shared.share_url, 'url')
+        self.assertIsNone(not_shared.share_url)
+        self.assertFalse(self.note_store.shareNote.called)
+
+    def test_resource_data_not_writable(self):
+        """Test error of opening resource file not hidden"""
+        resource = factories.ResourceFactory.create(
+            guid='guid',
+            file_path='/nonexistent/dir/resource',
+        )
+        with self.assertRaises(IOError):
+            self.sync._get_resource_data(resource)
+        self.assertFalse(self.note_store.getResourceDataTo.called)
+
     def test_pull_not_shared(self):
         """Test pull not shared note"""
         note_guid = 'guid'
@@ -0,0 +1,72 @@
+from .. import settings
+
+from mock import patch
+from everpad.provider.tools import get_db_session, get_db_pragmas
+from everpad.provider import models
+import unittest
+import threading
+import tempfile
+import shutil
+import os
+
+
+class DbSessionCase(unittest.TestCase):
+    """Database session setup case"""
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.db_path = os.path.join(self.path, 'everpad.db')
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def _pragma(self, session, name):
+        return session.execute('PRAGMA %s' % name).scalar()
+
+    def test_pragmas(self):
+        """Test connection uses WAL and tuned pragmas"""
+        session = get_db_session(self.db_path)
+        self.assertEqual(self._pragma(session, 'journal_mode'), 'wal')
+        self.assertEqual(self._pragma(session, 'synchronous'), 1)
+        self.assertEqual(self._pragma(session, 'temp_store'), 2)
+
+    def test_pragmas_from_settings(self):
+        """Test pragmas overridden by settings, wrong values ignored"""
+        values = {
+            'db-synchronous': 'FULL',
+            'db-cache-size': 'many',
+            'db-temp-store': 'MEMORY; DROP TABLE notes',
+        }
+        with patch('everpad.provider.tools.QSettings') as settings:
+            settings.return_value.value.side_effect = values.get
+            pragmas = dict(get_db_pragmas())
+        self.assertEqual(pragmas['synchronous'], 'FULL')
+        self.assertEqual(pragmas['cache_size'], -16000)
+        self.assertEqual(pragmas['temp_store'], 'MEMORY')
+
+    def _in_thread(self, func):
+        result = []
+        thread = threading.Thread(target=lambda: result.append(func()))
+        thread.start()
+        thread.join()
+        return result[0]
+
+    def test_session_per_thread(self):
+        """Test session shared in thread and not between threads"""
+        session = get_db_session(self.db_path)
+        self.assertIs(get_db_session(self.db_path), session)
+        self.assertIsNot(
+            self._in_thread(lambda: get_db_session(self.db_path)), session,
+        )
+
+    def test_read_while_writing(self):
+        """Test reader not blocked by uncommitted sync write"""
+        writer = get_db_session(self.db_path)
+        count = lambda: get_db_session(self.db_path).query(
+            models.Place,
+        ).count()
+        writer.add(models.Place(name='place'))
+        writer.flush()
+        self.assertEqual(self._in_thread(count), 0)
+        writer.commit()
+        self.assertEqual(self._in_thread(count), 1)
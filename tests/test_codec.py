@@ -0,0 +1,108 @@
+from evernote.edam import slotted
+from evernote.edam.type import ttypes
+from evernote.edam.notestore import ttypes as notestore_ttypes
+from thrift.protocol import TBinaryProtocol, TCodec
+from thrift.protocol.TProtocol import TProtocolException
+from thrift.transport import TTransport
+from thrift.Thrift import TType
+import unittest
+
+
+def encode(obj):
+    buf = TTransport.TMemoryBuffer()
+    obj.write(TBinaryProtocol.TBinaryProtocol(buf))
+    return buf.getvalue()
+
+
+class Nested(object):
+    """Struct with map of maps and list of lists"""
+    thrift_spec = (
+        None,
+        (1, TType.MAP, 'maps', (
+            TType.STRING, None, TType.MAP,
+            (TType.STRING, None, TType.I32, None),
+        ), None),
+        (2, TType.LIST, 'lists', (TType.LIST, (TType.I32, None)), None),
+    )
+
+    def __init__(self, maps=None, lists=None):
+        self.maps = maps
+        self.lists = lists
+
+
+class CodecCase(unittest.TestCase):
+    """Precompiled codecs case"""
+
+    def setUp(self):
+        self.types = slotted.create_types({
+            'Note': ('guid', 'title', 'tagGuids', 'resources'),
+        })
+        self.chunk = notestore_ttypes.SyncChunk(
+            currentTime=1000L,
+            chunkHighUSN=2,
+            updateCount=3,
+            notes=[ttypes.Note(
+                guid='note',
+                title='title',
+                content='<en-note/>',
+                active=True,
+                tagGuids=['tag'],
+                attributes=ttypes.NoteAttributes(latitude=1.5),
+                resources=[ttypes.Resource(
+                    guid='resource',
+                    data=ttypes.Data(body='\x00\xff', size=2),
+                    width=-1,
+                )],
+            )],
+            tags=[ttypes.Tag(guid='tag', name='tag')],
+            expungedNotes=['gone'],
+        )
+        self.data = encode(self.chunk)
+
+    def test_encode(self):
+        """Test codec encodes as generated structs"""
+        chunk = self.types[notestore_ttypes.SyncChunk]()
+        TCodec.decode(chunk.__class__, chunk, self.data)
+        chunk.notes[0].content = '<en-note/>'
+        chunk.notes[0].attributes = self.types[ttypes.NoteAttributes](
+            latitude=1.5,
+        )
+        chunk.notes[0].active = True
+        self.assertEqual(TCodec.encode(chunk), self.data)
+
+    def test_decode(self):
+        """Test codec reads buffer with mask"""
+        buf = TTransport.TMemoryBuffer('prefix' + self.data + 'tail')
+        buf.read(6)
+        chunk = self.types[notestore_ttypes.SyncChunk]()
+        chunk.read(TBinaryProtocol.TBinaryProtocol(buf))
+        self.assertEqual(buf.read(4), 'tail')
+
+        note = chunk.notes[0]
+        self.assertEqual(chunk.currentTime, 1000)
+        self.assertEqual(chunk.expungedNotes, ['gone'])
+        self.assertEqual(chunk.tags[0].name, 'tag')
+        self.assertEqual(note.title, 'title')
+        self.assertEqual(note.tagGuids, ['tag'])
+        self.assertEqual(note.resources[0].data.body, '\x00\xff')
+        self.assertEqual(note.resources[0].width, -1)
+        self.assertIsNone(note.content)
+        self.assertIsNone(note.attributes)
+
+    def test_truncated(self):
+        """Test truncated buffer raises protocol error"""
+        chunk = self.types[notestore_ttypes.SyncChunk]()
+        buf = TTransport.TMemoryBuffer(self.data[:-20])
+        with self.assertRaises(TProtocolException):
+            chunk.read(TBinaryProtocol.TBinaryProtocol(buf))
+
+    def test_nested(self):
+        """Test nested containers keep outer keys"""
+        nested = Nested(
+            maps={'a': {'x': 1, 'y': 2}, 'b': {'z': 3}},
+            lists=[[1, 2], [], [3]],
+        )
+        decoded = Nested()
+        TCodec.decode(Nested, decoded, TCodec.encode(nested))
+        self.assertEqual(decoded.maps, nested.maps)
+        self.assertEqual(decoded.lists, nested.lists)
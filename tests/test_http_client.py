@@ -0,0 +1,153 @@
+from thrift.transport.THttpClient import THttpClient
+from thrift.transport.TTransport import TMemoryBuffer
+from thrift.protocol.TBinaryProtocol import TBinaryProtocol
+from thrift.Thrift import TMessageType
+from evernote.api.client import NoteStoreClient
+from evernote.edam.notestore.NoteStore import getResourceData_result
+from evernote.edam.error.ttypes import EDAMNotFoundException
+from BaseHTTPServer import HTTPServer, BaseHTTPRequestHandler
+from StringIO import StringIO
+import unittest
+import threading
+import gzip
+
+
+PAYLOAD = 'thrift payload ' * 4096
+
+
+class GzipHandler(BaseHTTPRequestHandler):
+    """Reply with gzipped payload when client accepts it"""
+    body = PAYLOAD
+    gzip = True
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers['Content-Length']))
+        body = self.body
+        self.send_response(200)
+        if self.gzip and 'gzip' in self.headers.get('Accept-Encoding', ''):
+            buf = StringIO()
+            with gzip.GzipFile(fileobj=buf, mode='wb') as compressed:
+                compressed.write(body)
+            body = buf.getvalue()
+            self.send_header('Content-Encoding', 'gzip')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class BadStatusHandler(BaseHTTPRequestHandler):
+    """Close connection without reply"""
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers['Content-Length']))
+
+    def log_message(self, *args):
+        pass
+
+
+def resource_reply(result):
+    buf = TMemoryBuffer()
+    protocol = TBinaryProtocol(buf)
+    protocol.writeMessageBegin('getResourceData', TMessageType.REPLY, 0)
+    result.write(protocol)
+    protocol.writeMessageEnd()
+    return buf.getvalue()
+
+
+class HttpClientCase(unittest.TestCase):
+    """Http transport compression case"""
+
+    def setUp(self):
+        self.server = HTTPServer(('127.0.0.1', 0), GzipHandler)
+        thread = threading.Thread(target=self.server.handle_request)
+        thread.daemon = True
+        thread.start()
+        self.client = THttpClient(
+            'http://127.0.0.1:%d/' % self.server.server_port,
+        )
+
+    def tearDown(self):
+        self.server.server_close()
+
+    def test_gzip_response(self):
+        """Test gzip response inflated while reading"""
+        self.client.write('request')
+        self.client.flush()
+
+        self.assertEqual(self.client.readAll(4), PAYLOAD[:4])
+        self.assertEqual(
+            self.client.readAll(len(PAYLOAD) - 4), PAYLOAD[4:],
+        )
+        self.assertEqual(self.client.read(1), '')
+        self.assertEqual(self.client.inflated, len(PAYLOAD))
+        self.assertGreater(self.client.compressionRatio(), 10)
+
+    def test_read_buffer(self):
+        """Test whole response buffered after partial read"""
+        self.client.write('request')
+        self.client.flush()
+
+        self.assertEqual(self.client.readAll(4), PAYLOAD[:4])
+        buf, pos = self.client.getReadBuffer()
+        self.assertEqual(buf[pos:], PAYLOAD[4:])
+        self.client.consumeReadBuffer(len(PAYLOAD) - 8)
+        self.assertEqual(self.client.readAll(4), PAYLOAD[-4:])
+        self.assertEqual(self.client.read(1), '')
+
+    def test_bad_status(self):
+        """Test missing status line flushed without headers"""
+        self.server.RequestHandlerClass = BadStatusHandler
+        self.client.write('request')
+        self.client.flush()
+
+        self.assertEqual(self.client.code, -1)
+        self.assertIsNone(self.client.headers)
+
+
+
+class ResourceDataCase(unittest.TestCase):
+    """Resource body written to file case"""
+
+    def setUp(self):
+        class ResourceHandler(GzipHandler):
+            body = resource_reply(getResourceData_result(success=PAYLOAD))
+
+        self.handler = ResourceHandler
+        self.server = HTTPServer(('127.0.0.1', 0), self.handler)
+        thread = threading.Thread(target=self.server.handle_request)
+        thread.daemon = True
+        thread.start()
+        self.transport = THttpClient(
+            'http://127.0.0.1:%d/' % self.server.server_port,
+        )
+        self.client = NoteStoreClient(TBinaryProtocol(self.transport))
+
+    def tearDown(self):
+        self.server.server_close()
+
+    def test_gzip_response(self):
+        """Test gzip body written by inflated chunks"""
+        out = StringIO()
+        size = self.client.getResourceDataTo('token', 'guid', out)
+        self.assertEqual(size, len(PAYLOAD))
+        self.assertEqual(out.getvalue(), PAYLOAD)
+        self.assertGreater(self.transport.compressed, 0)
+
+    def test_plain_response(self):
+        """Test plain body written by socket reads"""
+        self.handler.gzip = False
+        out = StringIO()
+        self.client.getResourceDataTo('token', 'guid', out)
+        self.assertEqual(out.getvalue(), PAYLOAD)
+        self.assertEqual(self.transport.compressed, 0)
+
+    def test_not_found(self):
+        """Test exception of result raised"""
+        self.handler.body = resource_reply(getResourceData_result(
+            notFoundException=EDAMNotFoundException(identifier='guid'),
+        ))
+        with self.assertRaises(EDAMNotFoundException):
+            self.client.getResourceDataTo('token', 'guid', StringIO())
@@ -0,0 +1,75 @@
+from evernote.edam import slotted
+from evernote.edam.type import ttypes
+from evernote.edam.notestore import ttypes as notestore_ttypes
+from thrift.protocol import TBinaryProtocol
+from thrift.transport import TTransport
+import unittest
+
+
+def encode(obj):
+    buf = TTransport.TMemoryBuffer()
+    obj.write(TBinaryProtocol.TBinaryProtocol(buf))
+    return buf.getvalue()
+
+
+def decode(cls, data):
+    obj = cls()
+    obj.read(TBinaryProtocol.TBinaryProtocol(TTransport.TMemoryBuffer(data)))
+    return obj
+
+
+class SlottedCase(unittest.TestCase):
+    """Slotted types case"""
+
+    def setUp(self):
+        self.types = slotted.create_types({
+            'Resource': ('guid', 'data', 'attributes'),
+        })
+        self.chunk = notestore_ttypes.SyncChunk(
+            chunkHighUSN=2,
+            notes=[ttypes.Note(
+                guid='note',
+                title='title',
+                resources=[ttypes.Resource(
+                    guid='resource',
+                    mime='image/png',
+                    data=ttypes.Data(bodyHash='hash', size=4),
+                    recognition=ttypes.Data(body='<recoIndex/>'),
+                    alternateData=ttypes.Data(body='alternate'),
+                    attributes=ttypes.ResourceAttributes(fileName='a.png'),
+                )],
+            )],
+        )
+
+    def test_slots(self):
+        """Test decoded structs have no instance dict"""
+        chunk = decode(
+            self.types[notestore_ttypes.SyncChunk], encode(self.chunk),
+        )
+        resource = chunk.notes[0].resources[0]
+        for obj in (chunk, chunk.notes[0], resource, resource.data):
+            self.assertFalse(hasattr(obj, '__dict__'))
+        self.assertIsInstance(resource, self.types[ttypes.Resource])
+        self.assertEqual(chunk.notes[0].title, 'title')
+        self.assertEqual(chunk.chunkHighUSN, 2)
+
+    def test_mask(self):
+        """Test fields not in mask skipped"""
+        chunk = decode(
+            self.types[notestore_ttypes.SyncChunk], encode(self.chunk),
+        )
+        resource = chunk.notes[0].resources[0]
+        self.assertEqual(resource.guid, 'resource')
+        self.assertEqual(resource.data.bodyHash, 'hash')
+        self.assertEqual(resource.attributes.fileName, 'a.png')
+        self.assertIsNone(resource.mime)
+        self.assertIsNone(resource.recognition)
+        self.assertIsNone(resource.alternateData)
+
+    def test_write(self):
+        """Test slotted structs encoded as generated ones"""
+        note = self.types[ttypes.Note](guid='note', tagGuids=['tag'])
+        self.assertEqual(
+            encode(note), encode(ttypes.Note(guid='note', tagGuids=['tag'])),
+        )
+        self.assertEqual(decode(self.types[ttypes.Note], encode(note)), note)
@@ -0,0 +1,83 @@
+from evernote.api.client import StorePool
+import unittest
+import threading
+import socket
+
+
+class FakeClient(object):
+    """Thrift client which waits for all calls to run at once"""
+    barrier = None
+    stalled = threading.Event()
+
+    def __init__(self, protocol):
+        pass
+
+    def getNotebook(self, authenticationToken, guid):
+        self.stalled.wait(5)
+        return guid
+
+    def getNote(self, authenticationToken, guid):
+        if guid == 'missing':
+            raise KeyError(guid)
+        self.barrier.wait()
+        return authenticationToken, guid
+
+
+class Barrier(object):
+
+    def __init__(self, count):
+        self.count = count
+        self.condition = threading.Condition()
+
+    def wait(self):
+        with self.condition:
+            self.count -= 1
+            self.condition.notify_all()
+            while self.count > 0:
+                self.condition.wait(5)
+            if self.count > 0:
+                raise RuntimeError('Calls not concurrent')
+
+
+class StorePoolCase(unittest.TestCase):
+    """Store pool case"""
+
+    def setUp(self):
+        self.pool = StorePool('token', FakeClient, 'http://localhost/', 3)
+
+    def tearDown(self):
+        self.pool.close()
+
+    def test_calls_in_flight(self):
+        """Test several calls run concurrently"""
+        FakeClient.barrier = Barrier(3)
+        self.assertEqual(
+            list(self.pool.map('getNote', [('a',), ('b',), ('c',)])),
+            [('token', 'a'), ('token', 'b'), ('token', 'c')],
+        )
+
+    def test_store_compatible(self):
+        """Test blocking call and errors same as with Store"""
+        FakeClient.barrier = Barrier(1)
+        self.assertEqual(self.pool.getNote('token', 'a'), ('token', 'a'))
+        with self.assertRaises(KeyError):
+            self.pool.getNote('missing')
+
+    def test_stalled_call(self):
+        """Test blocking call gives up when transport is idle"""
+        pool = StorePool('token', FakeClient, 'http://localhost/', 1, 0.05)
+        try:
+            with self.assertRaises(socket.timeout):
+                pool.getNotebook('a')
+            FakeClient.stalled.set()
+            # worker is free again after stalled call
+            self.assertEqual(pool.getNotebook('b'), 'b')
+        finally:
+            FakeClient.stalled.set()
+            pool.close()
+
+    def test_closed(self):
+        """Test calls after close fail instead of blocking"""
+        self.pool.close()
+        with self.assertRaises(RuntimeError):
+            self.pool.getNote('a')
@@ -219,6 +219,15 @@ class TBinaryProtocol(TProtocolBase):
     str = self.trans.readAll(len)
     return str
 
+  def readBinaryTo(self, out):
+    """Write binary value to file object without keeping it in memory"""
+    size = self.readI32()
+    if hasattr(self.trans, 'readTo'):
+      self.trans.readTo(out, size)
+    else:
+      out.write(self.trans.readAll(size))
+    return size
+
 
 class TBinaryProtocolFactory:
   def __init__(self, strictRead=False, strictWrite=True):
@@ -0,0 +1,315 @@
+#
+# Licensed to the Apache Software Foundation (ASF) under one
+# or more contributor license agreements. See the NOTICE file
+# distributed with this work for additional information
+# regarding copyright ownership. The ASF licenses this file
+# to you under the Apache License, Version 2.0 (the
+# "License"); you may not use this file except in compliance
+# with the License. You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied. See the License for the
+# specific language governing permissions and limitations
+# under the License.
+#
+
+"""Precompiled binary protocol codecs for pure Python.
+
+For each struct class decode and encode functions are generated once
+from its spec. Decoders read the whole buffered response with
+precompiled struct.Struct objects instead of a protocol method call
+per value:
+
+  pos = decode(cls, obj, buf, pos)
+  data = encode(obj)
+
+Decoders use `read_spec` of class when set, fields which are None
+there are skipped without being decoded.
+"""
+
+from thrift.Thrift import TType
+import struct
+import threading
+
+BYTE = struct.Struct('!b')
+I16 = struct.Struct('!h')
+I32 = struct.Struct('!i')
+I64 = struct.Struct('!q')
+DOUBLE = struct.Struct('!d')
+FIELD = struct.Struct('!bh')
+LIST = struct.Struct('!bi')
+MAP = struct.Struct('!bbi')
+
+FIXED_SIZES = {
+  TType.BOOL: 1,
+  TType.BYTE: 1,
+  TType.DOUBLE: 8,
+  TType.I16: 2,
+  TType.I32: 4,
+  TType.I64: 8,
+}
+
+NUMBERS = {
+  TType.BYTE: 'BYTE',
+  TType.DOUBLE: 'DOUBLE',
+  TType.I16: 'I16',
+  TType.I32: 'I32',
+  TType.I64: 'I64',
+}
+
+
+def skip(buf, pos, ttype):
+  """Position after value of ttype"""
+  if ttype in FIXED_SIZES:
+    return pos + FIXED_SIZES[ttype]
+  if ttype == TType.STRING:
+    return pos + 4 + I32.unpack_from(buf, pos)[0]
+  if ttype == TType.STRUCT:
+    while True:
+      ftype = ord(buf[pos])
+      if ftype == TType.STOP:
+        return pos + 1
+      pos = skip(buf, pos + 3, ftype)
+  if ttype in (TType.LIST, TType.SET):
+    etype, size = LIST.unpack_from(buf, pos)
+    pos += 5
+    if etype in FIXED_SIZES:
+      return pos + size * FIXED_SIZES[etype]
+    for _ in xrange(size):
+      pos = skip(buf, pos, etype)
+    return pos
+  if ttype == TType.MAP:
+    ktype, vtype, size = MAP.unpack_from(buf, pos)
+    pos += 6
+    for _ in xrange(size):
+      pos = skip(buf, skip(buf, pos, ktype), vtype)
+    return pos
+  raise ValueError('Unknown type %d' % ttype)
+
+
+class CodecCompiler(object):
+  """Generates codec functions sharing one namespace"""
+
+  def __init__(self):
+    self._lock = threading.RLock()
+    self._decoders = {}
+    self._encoders = {}
+    self._namespace = {
+      'BYTE_unpack': BYTE.unpack_from, 'BYTE_pack': BYTE.pack,
+      'I16_unpack': I16.unpack_from, 'I16_pack': I16.pack,
+      'I32_unpack': I32.unpack_from, 'I32_pack': I32.pack,
+      'I64_unpack': I64.unpack_from, 'I64_pack': I64.pack,
+      'DOUBLE_unpack': DOUBLE.unpack_from, 'DOUBLE_pack': DOUBLE.pack,
+      'LIST_unpack': LIST.unpack_from, 'LIST_pack': LIST.pack,
+      'MAP_unpack': MAP.unpack_from, 'MAP_pack': MAP.pack,
+      'FIELD_pack': FIELD.pack,
+      'skip': skip,
+    }
+
+  def decoder(self, cls):
+    with self._lock:
+      if cls not in self._decoders:
+        self._compile(cls)
+      return self._decoders[cls]
+
+  def encoder(self, cls):
+    with self._lock:
+      if cls not in self._encoders:
+        self._compile(cls)
+      return self._encoders[cls]
+
+  def _compile(self, cls):
+    """Compile codecs of class and structs it refers"""
+    pending = [cls]
+    while pending:
+      current = pending.pop()
+      if current in self._decoders:
+        continue
+      name = '%s_%d' % (current.__name__, len(self._decoders))
+      self._namespace['cls_' + name] = current
+      # placeholders, nested codecs are bound by name at call time
+      self._decoders[current] = self._encoders[current] = None
+      read_spec = getattr(current, 'read_spec', None) or current.thrift_spec
+      source = '\n'.join(
+        self._decoder_source(name, read_spec)
+        + self._encoder_source(name, current.thrift_spec)
+      )
+      exec compile(source, '<codec %s>' % name, 'exec') in self._namespace
+      self._decoders[current] = self._namespace['decode_' + name]
+      self._encoders[current] = self._namespace['encode_' + name]
+      for nested in _nested_classes(current.thrift_spec):
+        if nested not in self._decoders:
+          pending.append(nested)
+
+  def _struct_name(self, cls):
+    for key, value in self._namespace.items():
+      if key.startswith('cls_') and value is cls:
+        return key[len('cls_'):]
+    self._compile(cls)
+    return self._struct_name(cls)
+
+  def _decoder_source(self, name, spec):
+    lines = [
+      'def decode_%s(obj, buf, pos):' % name,
+      '  while True:',
+      '    ftype = ord(buf[pos])',
+      '    if ftype == 0:',
+      '      return pos + 1',
+      '    fid = I16_unpack(buf, pos + 1)[0]',
+      '    pos += 3',
+    ]
+    keyword = 'if'
+    for field in spec:
+      if not field:
+        continue
+      fid, ftype, fname, fspec = field[:4]
+      lines.append('    %s fid == %d and ftype == %d:' % (keyword, fid, ftype))
+      lines.extend(self._read_value('obj.' + fname, ftype, fspec, 3))
+      keyword = 'elif'
+    if keyword == 'if':
+      lines.append('    pos = skip(buf, pos, ftype)')
+    else:
+      lines.append('    else:')
+      lines.append('      pos = skip(buf, pos, ftype)')
+    return lines
+
+  def _read_value(self, target, ttype, spec, depth):
+    indent = '  ' * depth
+    var = 'v%d' % depth
+    if ttype == TType.BOOL:
+      return [
+        indent + '%s = buf[pos] != "\\x00"' % target,
+        indent + 'pos += 1',
+      ]
+    if ttype in NUMBERS:
+      return [
+        indent + '%s = %s_unpack(buf, pos)[0]' % (target, NUMBERS[ttype]),
+        indent + 'pos += %d' % FIXED_SIZES[ttype],
+      ]
+    if ttype == TType.STRING:
+      return [
+        indent + 'size = I32_unpack(buf, pos)[0]',
+        indent + 'pos += 4',
+        indent + '%s = buf[pos:pos + size]' % target,
+        indent + 'pos += size',
+      ]
+    if ttype == TType.STRUCT:
+      name = self._struct_name(spec[0])
+      return [
+        indent + '%s = cls_%s()' % (var, name),
+        indent + 'pos = decode_%s(%s, buf, pos)' % (name, var),
+        indent + '%s = %s' % (target, var),
+      ]
+    if ttype in (TType.LIST, TType.SET):
+      etype, espec = spec[0], spec[1]
+      lines = [
+        indent + 'size%d = LIST_unpack(buf, pos)[1]' % depth,
+        indent + 'pos += 5',
+        indent + 'items%d = []' % depth,
+        indent + 'for _ in xrange(size%d):' % depth,
+      ]
+      item = 'item%d' % depth
+      lines.extend(self._read_value(item, etype, espec, depth + 1))
+      lines.append(indent + '  items%d.append(%s)' % (depth, item))
+      if ttype == TType.SET:
+        lines.append(indent + '%s = set(items%d)' % (target, depth))
+      else:
+        lines.append(indent + '%s = items%d' % (target, depth))
+      return lines
+    if ttype == TType.MAP:
+      ktype, kspec, vtype, vspec = spec
+      lines = [
+        indent + 'size%d = MAP_unpack(buf, pos)[2]' % depth,
+        indent + 'pos += 6',
+        indent + 'items%d = {}' % depth,
+        indent + 'for _ in xrange(size%d):' % depth,
+      ]
+      key = 'key%d' % depth
+      lines.extend(self._read_value(key, ktype, kspec, depth + 1))
+      lines.extend(self._read_value(
+        'items%d[%s]' % (depth, key), vtype, vspec, depth + 1,
+      ))
+      lines.append(indent + '%s = items%d' % (target, depth))
+      return lines
+    return [indent + 'pos = skip(buf, pos, %d)' % ttype]
+
+  def _encoder_source(self, name, spec):
+    lines = ['def encode_%s(obj, out):' % name]
+    for field in spec:
+      if not field:
+        continue
+      fid, ftype, fname, fspec = field[:4]
+      lines.extend([
+        '  value = obj.%s' % fname,
+        '  if value is not None:',
+        '    out(FIELD_pack(%d, %d))' % (ftype, fid),
+      ])
+      lines.extend(self._write_value('value', ftype, fspec, 2))
+    lines.append('  out("\\x00")')
+    return lines
+
+  def _write_value(self, value, ttype, spec, depth):
+    indent = '  ' * depth
+    if ttype == TType.BOOL:
+      return [indent + 'out("\\x01" if %s else "\\x00")' % value]
+    if ttype in NUMBERS:
+      return [indent + 'out(%s_pack(%s))' % (NUMBERS[ttype], value)]
+    if ttype == TType.STRING:
+      return [
+        indent + 'if isinstance(%s, unicode):' % value,
+        indent + '  %s = %s.encode("utf8")' % (value, value),
+        indent + 'out(I32_pack(len(%s)))' % value,
+        indent + 'out(%s)' % value,
+      ]
+    if ttype == TType.STRUCT:
+      return [indent + 'encode_%s(%s, out)' % (
+        self._struct_name(spec[0]), value,
+      )]
+    item = 'item%d' % depth
+    if ttype in (TType.LIST, TType.SET):
+      lines = [
+        indent + 'out(LIST_pack(%d, len(%s)))' % (spec[0], value),
+        indent + 'for %s in %s:' % (item, value),
+      ]
+      lines.extend(self._write_value(item, spec[0], spec[1], depth + 1))
+      return lines
+    if ttype == TType.MAP:
+      key = 'key%d' % depth
+      lines = [
+        indent + 'out(MAP_pack(%d, %d, len(%s)))' % (
+          spec[0], spec[2], value,
+        ),
+        indent + 'for %s, %s in %s.iteritems():' % (key, item, value),
+      ]
+      lines.extend(self._write_value(key, spec[0], spec[1], depth + 1))
+      lines.extend(self._write_value(item, spec[2], spec[3], depth + 1))
+      return lines
+    raise ValueError('Unknown type %d' % ttype)
+
+
+def _nested_classes(spec):
+  """Struct classes referred by spec"""
+  if isinstance(spec, tuple):
+    if len(spec) == 2 and isinstance(spec[0], type):
+      yield spec[0]
+    for item in spec:
+      for cls in _nested_classes(item):
+        yield cls
+
+
+compiler = CodecCompiler()
+
+
+def decode(cls, obj, buf, pos=0):
+  """Fill obj from buf, get position after struct"""
+  return compiler.decoder(cls)(obj, buf, pos)
+
+
+def encode(obj):
+  out = []
+  compiler.encoder(obj.__class__)(obj, out.append)
+  return ''.join(out)
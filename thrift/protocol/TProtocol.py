@@ -157,6 +157,12 @@ class TProtocolBase:
   def readString(self):
     pass
 
+  def readBinaryTo(self, out):
+    """Write binary value to file object, get its size"""
+    value = self.readString()
+    out.write(value)
+    return len(value)
+
   def skip(self, type):
     if type == TType.STOP:
       return
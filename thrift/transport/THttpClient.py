@@ -17,18 +17,31 @@
 # under the License.
 #
 
-from TTransport import TTransportBase
+from TTransport import TTransportBase, TTransportException
 from cStringIO import StringIO
 
 import urlparse
 import httplib
 import warnings
 import socket
+import threading
+import zlib
 
 
 class THttpClient(TTransportBase):
 
-    """Http implementation of TTransport base."""
+    """Http implementation of TTransport base.
+
+    Gzip encoded responses are inflated while read, getReadBuffer
+    buffers whole response for precompiled codecs."""
+
+    READ_CHUNK = 8192
+    SPILL_CHUNK = 65536
+
+    # bytes of compressed responses for all clients
+    total_compressed = 0
+    total_inflated = 0
+    __totals_lock = threading.Lock()
 
     def __init__(
         self,
@@ -91,6 +104,16 @@ class THttpClient(TTransportBase):
         self.__http = None
         self.__timeout = None
         self.__headers = {}
+        self.__inflater = None
+        self.__rbuf = ''
+        self.__rpos = 0
+        self.__eof = False
+        self.__gzip = False
+        self.compressed = 0
+        self.inflated = 0
+        # bytes on the wire
+        self.sent = 0
+        self.received = 0
 
     def open(self):
         protocol = httplib.HTTP if self.scheme == 'http' else httplib.HTTPS
@@ -113,7 +136,91 @@ class THttpClient(TTransportBase):
             self.__timeout = ms / 1000.0
 
     def read(self, sz):
-        return self.__http.file.read(sz)
+        if self.__inflater is None and self.__rpos == len(self.__rbuf):
+            data = self.__http.file.read(sz)
+            self.received += len(data)
+            return data
+
+        if len(self.__rbuf) - self.__rpos < sz:
+            self.__fill(sz)
+        data = self.__rbuf[self.__rpos:self.__rpos + sz]
+        self.__rpos += len(data)
+        return data
+
+    def readTo(self, out, sz):
+        """Write next sz bytes of response to file object.
+
+        Plain response is written by socket reads, gzip one by
+        inflated chunks, so whole value never stays in memory."""
+        while sz:
+            available = len(self.__rbuf) - self.__rpos
+            if not available and self.__inflater is None:
+                data = self.__http.file.read(min(sz, self.SPILL_CHUNK))
+                if not data:
+                    raise TTransportException(
+                        type=TTransportException.END_OF_FILE,
+                        message='Response ended while reading value',
+                    )
+                self.received += len(data)
+                out.write(data)
+                sz -= len(data)
+                continue
+            if not available:
+                self.__fill(min(sz, self.SPILL_CHUNK))
+                continue
+            size = min(available, sz)
+            out.write(buffer(self.__rbuf, self.__rpos, size))
+            self.__rpos += size
+            sz -= size
+
+    def getReadBuffer(self):
+        """Whole remaining response and position in it"""
+        self.__fill()
+        return self.__rbuf, self.__rpos
+
+    def consumeReadBuffer(self, sz):
+        self.__rpos += sz
+
+    def __fill(self, sz=None):
+        """Buffer next chunks until sz bytes available or response ends"""
+        chunks = [self.__rbuf[self.__rpos:]]
+        available = len(chunks[0])
+        received = inflated = 0
+        while (sz is None or available < sz) and not self.__eof:
+            chunk = self.__http.file.read(self.READ_CHUNK)
+            received += len(chunk)
+            if self.__inflater is None:
+                data = chunk
+                self.__eof = not chunk
+            elif chunk:
+                data = self.__inflater.decompress(chunk)
+            else:
+                data = self.__inflater.flush()
+                self.__inflater = None
+                self.__eof = True
+            inflated += len(data)
+            available += len(data)
+            chunks.append(data)
+        self.__rbuf = ''.join(chunks)
+        self.__rpos = 0
+        if self.__gzip:
+            self.__count(received, inflated)
+        else:
+            self.received += received
+
+    def __count(self, compressed, inflated):
+        self.compressed += compressed
+        self.inflated += inflated
+        self.received += compressed
+        with THttpClient.__totals_lock:
+            THttpClient.total_compressed += compressed
+            THttpClient.total_inflated += inflated
+
+    def compressionRatio(self):
+        """Inflated to compressed size of gzip encoded responses"""
+        if not self.compressed:
+            return None
+        return float(self.inflated) / self.compressed
 
     def write(self, buf):
         self.__wbuf.write(buf)
@@ -146,16 +253,33 @@ class THttpClient(TTransportBase):
         self.__http.putheader('Host', self.host)
         self.__http.putheader('Content-Type', 'application/x-thrift')
         self.__http.putheader('Content-Length', str(len(data)))
+        self.__http.putheader('Accept-Encoding', 'gzip')
         for key, value in self.__headers.iteritems():
             self.__http.putheader(key, value)
         self.__http.endheaders()
 
-        # Write payload
-        self.__http.send(data)
+        # Write payload, counted by chunks so waiters see progress
+        for start in xrange(0, len(data), self.SPILL_CHUNK):
+            chunk = buffer(data, start, self.SPILL_CHUNK)
+            self.__http.send(chunk)
+            self.sent += len(chunk)
 
         # Get reply to flush the request
         self.code, self.message, self.headers = self.__http.getreply()
 
+        self.__rbuf = ''
+        self.__rpos = 0
+        self.__eof = False
+        # no headers when status line is bad
+        self.__gzip = self.headers is not None and (
+            self.headers.getheader('Content-Encoding', '').lower() == 'gzip'
+        )
+        if self.__gzip:
+            # 16 + MAX_WBITS expects gzip header and trailer
+            self.__inflater = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        else:
+            self.__inflater = None
+
     # Decorate if we know how to timeout
     if hasattr(socket, 'getdefaulttimeout'):
         flush = __withTimeout(flush)
@@ -202,6 +202,7 @@ class TMemoryBuffer(TTransportBase, CReadableTransport):
 
     If value is set, this will be a transport for reading,
     otherwise, it is for writing"""
+    self._value = value
     if value is not None:
       self._buffer = StringIO(value)
     else:
@@ -228,6 +229,13 @@ class TMemoryBuffer(TTransportBase, CReadableTransport):
   def getvalue(self):
     return self._buffer.getvalue()
 
+  def getReadBuffer(self):
+    """Value to read and position in it"""
+    return self._value, self._buffer.tell()
+
+  def consumeReadBuffer(self, sz):
+    self._buffer.seek(sz, 1)
+
   # Implement the CReadableTransport interface.
   @property
   def cstringio_buf(self):